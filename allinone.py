@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Single-process "all challenges" mode for low-memory hosts.
+
+Mounts the portal and the web challenges in one Python process under the
+path prefixes used by nginx-ctf.conf (/login-sqli/, /jwt-weak/, ...), so the
+interpreter, Flask, Jinja, requests and lxml are loaded once instead of once
+per container.
+
+command-injection and hard-deserialization hand out a shell / arbitrary code
+execution and stay in their own containers (see docker-compose.allinone.yml);
+nginx-ctf-allinone.conf routes their prefixes there.
+
+    gunicorn -c python:ctfcommon.gunicorn_conf allinone:application   # production
+    python allinone.py                                                # dev server on PORT
+    python allinone.py --measure                                      # memory report
+"""
+import argparse
+import importlib.util
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+from werkzeug.middleware.dispatcher import DispatcherMiddleware
+from werkzeug.utils import redirect
+
+from ctfcommon import startup as app_startup, urls
+from ctfcommon.startup import flag_env_name
+
+BASE_DIR = Path(__file__).resolve().parent
+
+# prefix -> app directory, as in nginx-ctf.conf
+MOUNTS = {
+    "/login-sqli": "login-sqli",
+    "/jwt-weak": "jwt-weak",
+    "/static-secrets": "static-secrets",
+    "/ssrf-internal": "ssrf-internal",
+    "/xxe-injection": "xxe-injection",
+    "/container-breakout": "container-breakout",
+    "/hard-jwt-confusion": "hard-jwt-confusion",
+}
+
+# Served by their own containers; the portal still links to them by prefix
+OUT_OF_PROCESS = {
+    "/command-injection": "command-injection",
+    "/hard-deserialization": "hard-deserialization",
+}
+
+def module_name(app_dir: str) -> str:
+    return "ctf_" + app_dir.replace("-", "_")
+
+
+def load_app(app_dir: str):
+    """Import <app_dir>/app.py under a unique module name with its own FLAG."""
+    path = BASE_DIR / app_dir / "app.py"
+    if str(path.parent) not in sys.path:
+        sys.path.append(str(path.parent))  # app-local modules (portal: store, events, ...)
+    saved_flag = os.environ.pop("FLAG", None)
+    if os.getenv(flag_env_name(app_dir)):
+        os.environ["FLAG"] = os.environ[flag_env_name(app_dir)]
+    try:
+        spec = importlib.util.spec_from_file_location(module_name(app_dir), path)
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[spec.name] = module
+        spec.loader.exec_module(module)
+    finally:
+        os.environ.pop("FLAG", None)
+        if saved_flag is not None:
+            os.environ["FLAG"] = saved_flag
+    return module
+
+
+def add_trailing_slash(wsgi_app):
+    """/login-sqli -> /login-sqli/, so relative links inside the app resolve under the prefix."""
+    def middleware(environ, start_response):
+        if environ.get("PATH_INFO", "") == "" and environ.get("SCRIPT_NAME"):
+            return redirect(environ["SCRIPT_NAME"] + "/", 308)(environ, start_response)
+        return wsgi_app(environ, start_response)
+    return middleware
+
+
+def build():
+    # Links between the apps use the prefixes above, proxy or not
+    urls.URL_LAYOUT = os.getenv("CTF_URL_LAYOUT", "paths")
+    # Portal status badges: mounted apps on this process, the rest in their containers
+    local = f"http://127.0.0.1:{os.getenv('PORT', '5000')}"
+    os.environ.setdefault("HEALTH_TARGETS", ",".join(
+        [f"portal={local}/healthz"]
+        + [f"{app_dir}={local}{prefix}/healthz" for prefix, app_dir in MOUNTS.items()]
+        + [f"{app_dir}=http://{app_dir}:5000/healthz" for app_dir in OUT_OF_PROCESS.values()]
+        + ["brute-ssh=tcp://brute-ssh:22"]
+    ))
+    modules = {"/": load_app("portal")}
+    modules.update({prefix: load_app(app_dir) for prefix, app_dir in MOUNTS.items()})
+    application = DispatcherMiddleware(
+        modules["/"].app,
+        {prefix: add_trailing_slash(module.app) for prefix, module in modules.items() if prefix != "/"},
+    )
+    return application, modules
+
+
+application, MODULES = build()
+
+
+def startup():
+    """The one-time setup of startup.py; the gunicorn master runs that file without importing this one."""
+    app_startup.run(BASE_DIR)
+
+
+def shutdown():
+    """Called in each gunicorn worker on exit (ctfcommon/gunicorn_conf.py)."""
+    for module in MODULES.values():
+        if hasattr(module, "shutdown"):
+            module.shutdown()
+
+
+def rss_kib(pid="self") -> int:
+    for line in Path(f"/proc/{pid}/status").read_text().splitlines():
+        if line.startswith("VmRSS:"):
+            return int(line.split()[1])
+    return 0
+
+
+# Load a single app the way its own container does (importing allinone would load them all)
+MEASURE_SNIPPET = """
+import runpy, sys
+from pathlib import Path
+app_dir = Path(sys.argv[1]).resolve()
+sys.path[:0] = [str(app_dir), str(app_dir.parent)]
+runpy.run_path(str(app_dir / "app.py"))
+print(next(int(l.split()[1]) for l in Path("/proc/self/status").read_text().splitlines() if l.startswith("VmRSS:")))
+"""
+
+
+def measure() -> None:
+    """Compare one process per app (as in docker-compose.yml) against this process."""
+    separate = {}
+    for app_dir in ["portal", *MOUNTS.values()]:
+        out = subprocess.run(
+            [sys.executable, "-c", MEASURE_SNIPPET, app_dir],
+            cwd=BASE_DIR, capture_output=True, text=True, check=True,
+        )
+        separate[app_dir] = int(out.stdout.strip().splitlines()[-1])
+    combined = rss_kib()
+    total = sum(separate.values())
+    print(f"{'app':24} {'RSS (MiB)':>10}")
+    for app_dir, kib in separate.items():
+        print(f"{app_dir:24} {kib / 1024:10.1f}")
+    print(f"{'sum of separate':24} {total / 1024:10.1f}")
+    print(f"{'all-in-one process':24} {combined / 1024:10.1f}")
+    print(f"{'saved':24} {(total - combined) / 1024:10.1f}  ({100 * (total - combined) / total:.0f}%)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--measure", action="store_true", help="report memory saved versus one process per app")
+    args = parser.parse_args()
+    if args.measure:
+        measure()
+    else:
+        from werkzeug.serving import run_simple
+        startup()
+        run_simple("0.0.0.0", int(os.getenv("PORT", "5000")), application, threaded=True)
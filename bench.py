@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+"""
+Per-route microbenchmarks with a regression gate.
+
+Drives every app in-process through app.test_client() (as the test_*.py
+suites do), so the numbers are the cost of the Flask view and the
+challenge's own work, without sockets or gunicorn. Routes that make outbound
+requests (ssrf-internal, container-breakout) fetch from a local stand-in
+HTTP server instead of the internet or dind-host.
+
+    python bench.py                  # run, compare with bench_baseline.json
+    python bench.py --save           # run and (re)write the baseline
+    python bench.py -k jwt           # only routes whose name contains "jwt"
+    python bench.py --threshold 0.15 # fail above a 15% regression (default 25%)
+
+Per route it records ops/sec (best of several timed rounds) and, from a
+separate tracemalloc pass, the peak memory allocated during one request and
+the memory blocks still held after it (a growing number is a leak). A route
+regresses when its ops/sec drops, or its peak allocation grows, by more than
+the threshold; the script then exits 1. Baselines are machine-specific:
+compare runs made on the same host.
+"""
+import argparse
+import base64
+import datetime
+import hashlib
+import hmac
+import importlib.util
+import json
+import os
+import pickle
+import platform
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import warnings
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent
+BASELINE = BASE_DIR / "bench_baseline.json"
+
+# The benchmarks hammer routes far beyond any rate limit
+os.environ["RATE_LIMIT_ENABLED"] = "0"
+os.environ.setdefault("PORTAL_DB", str(Path(tempfile.mkdtemp(prefix="ctf-bench-")) / "portal.db"))
+os.environ.setdefault("DB_PATH", str(Path(tempfile.mkdtemp(prefix="ctf-bench-")) / "users.db"))
+os.environ.setdefault("JWT_KEY_DIR", tempfile.mkdtemp(prefix="ctf-bench-"))
+warnings.filterwarnings("ignore", message="The HMAC key is")
+
+import jwt  # noqa: E402
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Answers every request like a small internal API would"""
+
+    def do_GET(self):
+        body = b'{"status": "ok", "stand_in": true}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_POST = do_GET
+
+    def log_message(self, *args):
+        pass
+
+
+def start_stand_in() -> str:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def forge_hs256(claims: dict, key: str) -> str:
+    """HS256 token keyed on a PEM, which jwt.encode() refuses to do"""
+    def b64(raw: bytes) -> str:
+        return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+    signing_input = b64(b'{"alg":"HS256","typ":"JWT"}') + "." + b64(json.dumps(claims).encode())
+    return signing_input + "." + b64(hmac.new(key.encode(), signing_input.encode(), hashlib.sha256).digest())
+
+
+def load_app(app_dir: str, env: dict = None):
+    """Import <app_dir>/app.py under its own module name and return a test client"""
+    path = BASE_DIR / app_dir / "app.py"
+    if str(path.parent) not in sys.path:
+        sys.path.insert(0, str(path.parent))
+    os.environ.update(env or {})
+    name = "bench_" + app_dir.replace("-", "_")
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module.app.test_client()
+
+
+def build_cases(stand_in: str):
+    """(name, client, method, path, kwargs, expected status) for every benchmarked route"""
+    login = load_app("login-sqli")
+    jwt_weak = load_app("jwt-weak")
+    static = load_app("static-secrets")
+    cmd = load_app("command-injection")
+    ssrf = load_app("ssrf-internal")
+    xxe = load_app("xxe-injection")
+    breakout = load_app("container-breakout", {"DIND_HOST": stand_in})
+    deser = load_app("hard-deserialization")
+    confusion = load_app("hard-jwt-confusion")
+    portal = load_app("portal")
+
+    weak_admin = jwt.encode({"sub": "bench", "role": "admin"}, "secret", algorithm="HS256")
+    confusion_admin = forge_hs256({"sub": "bench", "role": "admin"}, confusion.get("/public-key").get_json()["public_key"])
+    secret_file = Path(tempfile.mkdtemp(prefix="ctf-bench-")) / "secret.txt"
+    secret_file.write_text("CTF{bench}")
+    xxe_payload = (
+        f'<?xml version="1.0"?><!DOCTYPE foo [<!ENTITY xxe SYSTEM "file://{secret_file}">]>'
+        "<user><name>&xxe;</name><email>a@b.c</email></user>"
+    )
+    serialized = deser.post("/serialize", data={"username": "bench", "email": "b@x.y"}).get_json()["data"]
+    benign_pickle = base64.b64encode(pickle.dumps({"user": "bench"})).decode()
+    job_url = cmd.post("/api/jobs", json={"host": "127.0.0.1; true"}).get_json()["url"]
+
+    return [
+        ("login-sqli GET /login", login, "get", "/login", {}, 200),
+        ("login-sqli POST /login (wrong password)", login, "post", "/login", {"data": {"username": "admin", "password": "nope"}}, 401),
+        ("login-sqli POST /login (SQLi)", login, "post", "/login", {"data": {"username": "admin' --", "password": "x"}}, 302),
+        # One request of a sqlmap-style boolean-blind extraction
+        ("login-sqli POST /login (blind SQLi probe)", login, "post", "/login",
+         {"data": {"username": "admin' AND substr(password,1,1)='b' --", "password": "x"}}, 401),
+        ("jwt-weak GET /login", jwt_weak, "get", "/login?username=bench", {}, 200),
+        ("jwt-weak GET /admin", jwt_weak, "get", "/admin", {"headers": {"Authorization": f"Bearer {weak_admin}"}}, 200),
+        # 100 tokens per request; compare ops/s x 100 with the single-token routes
+        ("jwt-weak POST /login/batch (100 tokens)", jwt_weak, "post", "/login/batch",
+         {"json": {"usernames": [f"bench{i}" for i in range(100)]}}, 200),
+        ("jwt-weak POST /admin/batch (100 tokens)", jwt_weak, "post", "/admin/batch", {"json": {"tokens": [weak_admin] * 100}}, 200),
+        ("static-secrets GET /robots.txt", static, "get", "/robots.txt", {}, 200),
+        ("static-secrets GET /hidden/", static, "get", "/hidden/", {}, 200),
+        ("static-secrets GET /hidden/flag.txt", static, "get", "/hidden/flag.txt", {}, 200),
+        # What a directory brute-forcer mostly gets
+        ("static-secrets GET /hidden/<missing> (404)", static, "get", "/hidden/backup.zip", {}, 404),
+        ("static-secrets GET /robots.txt (If-None-Match)", static, "get", "/robots.txt",
+         {"headers": {"If-None-Match": static.get("/robots.txt").headers.get("ETag", "")}}, 304),
+        ("command-injection POST /", cmd, "post", "/", {"data": {"host": "127.0.0.1; true"}}, 200),
+        # Polling a submitted job: what a harness collecting results does
+        ("command-injection GET /api/jobs/<id>", cmd, "get", job_url, {}, 200),
+        ("ssrf-internal POST / (stand-in)", ssrf, "post", "/", {"data": {"url": stand_in + "/status"}}, 200),
+        ("xxe-injection POST /api/import", xxe, "post", "/api/import", {"data": xxe_payload, "content_type": "application/xml"}, 200),
+        ("container-breakout POST /fetch (stand-in)", breakout, "post", "/fetch", {"data": {"url": stand_in + "/_ping"}}, 200),
+        ("hard-deserialization POST /serialize", deser, "post", "/serialize", {"data": {"username": "bench", "email": "b@x.y"}}, 200),
+        ("hard-deserialization POST /deserialize", deser, "post", "/deserialize", {"data": {"data": serialized}}, 200),
+        ("hard-deserialization POST /deserialize (dict)", deser, "post", "/deserialize", {"data": {"data": benign_pickle}}, 200),
+        ("hard-jwt-confusion POST /verify", confusion, "post", "/verify", {"data": {"token": confusion_admin}}, 200),
+        ("hard-jwt-confusion POST /verify/batch (100 tokens)", confusion, "post", "/verify/batch",
+         {"json": {"tokens": [confusion_admin] * 100}}, 200),
+        ("portal GET /", portal, "get", "/", {}, 200),
+        ("portal POST / (wrong flag)", portal, "post", "/", {"data": {"flag": "CTF{nope}"}}, 302),
+        ("portal POST /api/submit", portal, "post", "/api/submit", {"json": {"flags": ["CTF{nope}", "CTF{follow_the_robots}"]}}, 200),
+        ("portal GET /api/scoreboard", portal, "get", "/api/scoreboard", {}, 200),
+    ]
+
+
+def call(client, method, path, kwargs):
+    resp = getattr(client, method)(path, **kwargs)
+    resp.close()
+    return resp
+
+
+def time_route(client, method, path, kwargs, min_time: float, rounds: int) -> float:
+    """Best ops/sec over several rounds of at least min_time seconds each"""
+    for _ in range(10):
+        call(client, method, path, kwargs)
+    # Calibrate the number of calls per round
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            call(client, method, path, kwargs)
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time / 4:
+            break
+        number *= 2
+    number = max(1, int(number * min_time / max(elapsed, 1e-9)))
+    best = 0.0
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for _ in range(number):
+            call(client, method, path, kwargs)
+        best = max(best, number / (time.perf_counter() - start))
+    return best
+
+
+def measure_memory(client, method, path, kwargs, calls: int = 20):
+    """(peak KiB allocated during one call, blocks retained per call)"""
+    tracemalloc.start()
+    try:
+        call(client, method, path, kwargs)
+        before = tracemalloc.take_snapshot()
+        peak = 0
+        for _ in range(calls):
+            current, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            call(client, method, path, kwargs)
+            peak = max(peak, tracemalloc.get_traced_memory()[1] - current)
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    retained = sum(stat.count_diff for stat in after.compare_to(before, "filename"))
+    return round(peak / 1024, 1), round(retained / calls, 2)
+
+
+def run(filter_text: str, min_time: float, rounds: int, baseline: dict = None, threshold: float = 0.25) -> dict:
+    baseline = baseline or {}
+    stand_in = start_stand_in()
+    results = {}
+    for name, client, method, path, kwargs, expected in build_cases(stand_in):
+        if filter_text and filter_text not in name:
+            continue
+        status = call(client, method, path, kwargs).status_code
+        if status != expected:
+            raise SystemExit(f"{name}: HTTP {status}, expected {expected}")
+        ops = time_route(client, method, path, kwargs, min_time, rounds)
+        floor = baseline.get(name, {}).get("ops_per_sec", 0) * (1 - threshold)
+        for _ in range(2):
+            # Confirm an apparent slowdown before reporting it; one noisy round is not a regression
+            if ops >= floor:
+                break
+            ops = max(ops, time_route(client, method, path, kwargs, min_time, rounds))
+        peak_kib, retained = measure_memory(client, method, path, kwargs)
+        results[name] = {
+            "ops_per_sec": round(ops, 1),
+            "us_per_op": round(1e6 / ops, 1),
+            "peak_kib": peak_kib,
+            "retained_blocks": retained,
+        }
+        print(f"{name:48} {ops:10.1f} ops/s {1e6 / ops:10.1f} us {peak_kib:8.1f} KiB {retained:7.2f} blocks")
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """Names and reasons of routes that regressed beyond the threshold"""
+    regressions = []
+    print(f"\n{'route':48} {'ops/s':>8} {'base':>8} {'change':>8} {'peak KiB':>9} {'base':>8}")
+    for name, now in results.items():
+        before = baseline.get(name)
+        if before is None:
+            print(f"{name:48} {now['ops_per_sec']:8.0f} {'(new)':>8}")
+            continue
+        speed = now["ops_per_sec"] / before["ops_per_sec"] - 1
+        memory = now["peak_kib"] / before["peak_kib"] - 1 if before["peak_kib"] else 0.0
+        flag = ""
+        if speed < -threshold:
+            regressions.append(f"{name}: {speed:+.0%} ops/sec")
+            flag = "  SLOWER"
+        if memory > threshold:
+            regressions.append(f"{name}: {memory:+.0%} peak allocation")
+            flag += "  MORE MEMORY"
+        print(f"{name:48} {now['ops_per_sec']:8.0f} {before['ops_per_sec']:8.0f} {speed:+8.0%} "
+              f"{now['peak_kib']:9.1f} {before['peak_kib']:8.1f}{flag}")
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--save", action="store_true", help=f"write the results to {BASELINE.name}")
+    parser.add_argument("--baseline", type=Path, default=BASELINE)
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed regression, as a fraction")
+    parser.add_argument("-k", dest="filter", default="", help="only routes whose name contains this text")
+    parser.add_argument("--min-time", type=float, default=0.2, help="seconds per timed round")
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    saving = args.save or not args.baseline.exists()
+    baseline = None if saving else json.loads(args.baseline.read_text())
+    results = run(args.filter, args.min_time, args.rounds, baseline and baseline["routes"], args.threshold)
+
+    if saving:
+        args.baseline.write_text(json.dumps({
+            "created": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "machine": platform.node(),
+            "routes": results,
+        }, indent=2) + "\n")
+        print(f"\nBaseline written to {args.baseline}")
+        return
+
+    regressions = compare(results, baseline["routes"], args.threshold)
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) beyond {args.threshold:.0%}:")
+        for line in regressions:
+            print(f"  {line}")
+        sys.exit(1)
+    print(f"\nNo regressions beyond {args.threshold:.0%} (baseline from {baseline['created']})")
+
+
+if __name__ == "__main__":
+    main()
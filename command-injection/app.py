@@ -2,13 +2,82 @@
 Command Injection CTF Challenge (Medium)
 Vulnerability: OS command injection via unsanitized ping input
 """
-from flask import Flask, request, render_template_string
-import subprocess
+from flask import Flask, Response, request, render_template_string, url_for
+from markupsafe import escape
+import json
 import os
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))  # shared ctfcommon/ package in a repo checkout
+
+from ctfcommon.ratelimit import RateLimiter, client_ip, client_key
+from ctfcommon import startup, urls
+from ctfcommon.metrics import Metrics
+from jobs import JobQueue, QueueFull, TooManyJobs, make_store
+from runner import MB, Busy, RunnerPool
 
 app = Flask(__name__)
+urls.init_app(app)
+limiter = RateLimiter(app)
+metrics = Metrics(app)
 FLAG = os.getenv("FLAG", "CTF{rce_through_ping}")
 
+# Per worker process: how many commands run at once, how many requests may wait
+# for a slot, and the sandbox every command gets (runner.py)
+RUNNER_MAX_CONCURRENCY = int(os.getenv("RUNNER_MAX_CONCURRENCY", "8"))
+RUNNER_MAX_QUEUE = int(os.getenv("RUNNER_MAX_QUEUE", "32"))
+RUNNER_QUEUE_TIMEOUT = float(os.getenv("RUNNER_QUEUE_TIMEOUT", "5"))
+RUNNER_TIMEOUT = float(os.getenv("RUNNER_TIMEOUT", "10"))
+RUNNER_OUTPUT_LIMIT = int(os.getenv("RUNNER_OUTPUT_LIMIT", str(64 * 1024)))
+RUNNER_CPU_SECONDS = int(os.getenv("RUNNER_CPU_SECONDS", "5"))
+RUNNER_MEMORY_MB = int(os.getenv("RUNNER_MEMORY_MB", "256"))
+RUNNER_NPROC = int(os.getenv("RUNNER_NPROC", "64"))
+RUNNER_FILE_SIZE_MB = int(os.getenv("RUNNER_FILE_SIZE_MB", "1"))
+# Streamed output: send a heartbeat after this many quiet seconds, so a client
+# that went away is noticed (and its command killed) while the command idles
+STREAM_HEARTBEAT = float(os.getenv("STREAM_HEARTBEAT", "1"))
+STREAM_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+# Asynchronous jobs (jobs.py): worker threads and queue per process, and a
+# store shared between workers with JOBS_STORAGE=sqlite:///path
+JOBS_WORKERS = int(os.getenv("JOBS_WORKERS", "4"))
+JOBS_MAX_QUEUED = int(os.getenv("JOBS_MAX_QUEUED", "64"))
+JOBS_PER_CLIENT = int(os.getenv("JOBS_PER_CLIENT", "10"))
+JOBS_TTL = float(os.getenv("JOBS_TTL", "300"))
+JOBS_MAX_MB = int(os.getenv("JOBS_MAX_MB", "16"))
+JOBS_STORAGE = os.getenv("JOBS_STORAGE", "memory")
+
+RUNNER_JOBS = metrics.counter("command_runner_jobs_total", "Commands run, by outcome.", ("result",))
+RUNNER_KILLS = metrics.counter("command_runner_kills_total", "Process groups killed, by reason.", ("reason",))
+RUNNER_SECONDS = metrics.counter("command_runner_seconds_total", "Wall-clock time spent running commands.")
+
+
+def count_job(result, killed):
+    RUNNER_JOBS.inc(killed or "ok")
+    if killed:
+        RUNNER_KILLS.inc(killed)
+    RUNNER_SECONDS.inc(amount=result.seconds)
+
+
+SANDBOX = dict(
+    timeout=RUNNER_TIMEOUT, output_limit=RUNNER_OUTPUT_LIMIT, cpu_seconds=RUNNER_CPU_SECONDS,
+    memory_bytes=RUNNER_MEMORY_MB * MB, nproc=RUNNER_NPROC, file_size=RUNNER_FILE_SIZE_MB * MB,
+    on_finish=count_job,
+)
+pool = RunnerPool(
+    max_concurrency=RUNNER_MAX_CONCURRENCY, max_queue=RUNNER_MAX_QUEUE, queue_timeout=RUNNER_QUEUE_TIMEOUT, **SANDBOX,
+)
+# The job workers get slots of their own: one per worker thread, so they never wait
+job_pool = RunnerPool(max_concurrency=JOBS_WORKERS, max_queue=JOBS_WORKERS, **SANDBOX)
+jobs = JobQueue(
+    make_store(JOBS_STORAGE, ttl=JOBS_TTL, max_bytes=JOBS_MAX_MB * MB), run=job_pool.run,
+    workers=JOBS_WORKERS, max_queued=JOBS_MAX_QUEUED, per_client=JOBS_PER_CLIENT,
+)
+metrics.gauge("command_runner_queue_depth", "Requests waiting for a free runner slot.", lambda: pool.waiting)
+metrics.gauge("command_runner_running", "Commands running right now.", lambda: pool.running + job_pool.running)
+JOBS_SUBMITTED = metrics.counter("command_jobs_submitted_total", "Job submissions, by outcome.", ("result",))
+metrics.gauge("command_jobs_queued", "Jobs waiting for a job worker.", lambda: jobs.queued)
+
 HTML_TEMPLATE = """
 <!doctype html>
 <html lang="en">
@@ -21,6 +90,7 @@ HTML_TEMPLATE = """
         body { font-family: system-ui, sans-serif; max-width: 700px; margin: 2rem auto; padding: 0 1rem; }
         h1 { color: #2563eb; }
         form { margin: 1.5rem 0; }
+        label.stream { margin-left: 0.5rem; }
         input[type="text"] { padding: 0.6rem 0.7rem; width: 320px; border: 1px solid #cbd5e1; border-radius: 8px; }
         input[type="text"]:focus-visible, button:focus-visible { outline: 3px solid #93c5fd; outline-offset: 2px; }
         button { padding: 0.6rem 1rem; background: #2563eb; color: white; border: 1px solid #1d4ed8; border-radius: 8px; cursor: pointer; font-weight:600; }
@@ -43,6 +113,7 @@ HTML_TEMPLATE = """
     <form method="POST">
         <input type="text" name="host" placeholder="e.g., 8.8.8.8" value="{{ host or '' }}" required>
         <button type="submit">Ping</button>
+        <label class="stream"><input type="checkbox" name="stream" value="1"> Live output</label>
     </form>
     {% if output %}
     <h3>Result:</h3>
@@ -54,35 +125,128 @@ HTML_TEMPLATE = """
 """
 
 
+def result_note(result) -> str:
+    if result.timed_out:
+        return "\nCommand timed out"
+    if result.truncated:
+        return f"\n[output truncated at {RUNNER_OUTPUT_LIMIT} bytes]"
+    return ""
+
+
+def busy_page(host):
+    RUNNER_JOBS.inc("rejected")
+    page = render_template_string(HTML_TEMPLATE, output="Server busy, try again in a few seconds", host=host)
+    return page, 503, {"Retry-After": "5"}
+
+
+# Placeholder output: the streamed page is the template split around it
+STREAM_MARKER = "\x00stream\x00"
+
+
+def stream_page(host):
+    """The result page with the output written into it as it arrives (chunked transfer)."""
+    try:
+        job = pool.start(f"ping -c 2 {host}")
+    except Busy:
+        return busy_page(host)
+    head, tail = render_template_string(HTML_TEMPLATE, output=STREAM_MARKER, host=host).split(STREAM_MARKER)
+
+    def generate():
+        # gunicorn closes the generator when the client disconnects: finally kills the command
+        try:
+            yield head
+            for text in job.chunks(idle=STREAM_HEARTBEAT):
+                yield str(escape(text)) if text else "<!-- -->"
+            yield str(escape(result_note(job.result)))
+            yield tail
+        finally:
+            job.close()
+
+    return Response(generate(), mimetype="text/html", headers=STREAM_HEADERS)
+
+
+def sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
 @app.route("/", methods=["GET", "POST"])
+@limiter.limit("ping", "12/60", methods=("POST",))
 def index():
     output = None
     host = None
-    scheme = request.headers.get("X-Forwarded-Proto", request.scheme or "http")
-    forwarded_host = request.headers.get("X-Forwarded-Host")
-    raw_host = (forwarded_host.split(",")[0].strip() if forwarded_host else request.host)
-    portal_host = raw_host.split(":")[0]
-    portal_url = f"{scheme}://{portal_host}/"
     if request.method == "POST":
         host = request.form.get("host", "")
+        if host and request.form.get("stream"):
+            return stream_page(host)
         if host:
             # VULNERABLE: Direct shell command execution with user input
             # In real apps, NEVER do this!
             try:
-                # Using shell=True makes this exploitable
-                result = subprocess.run(
-                    f"ping -c 2 {host}",
-                    shell=True,
-                    capture_output=True,
-                    text=True,
-                    timeout=10
-                )
-                output = result.stdout + result.stderr
-            except subprocess.TimeoutExpired:
-                output = "Command timed out"
+                # Running it through /bin/sh -c makes this exploitable
+                result = pool.run(f"ping -c 2 {host}")
+                output = result.output + result_note(result)
+            except Busy:
+                return busy_page(host)
             except Exception as e:
                 output = f"Error: {e}"
-    return render_template_string(HTML_TEMPLATE, output=output, host=host, portal_url=portal_url)
+    return render_template_string(HTML_TEMPLATE, output=output, host=host)
+
+
+@app.route("/stream")
+@limiter.limit("ping", "12/60")
+def stream():
+    """Server-Sent Events: "output" events with the text as it arrives, then one "done" event."""
+    host = request.args.get("host", "")
+    if not host:
+        return {"error": "Missing host"}, 400
+    try:
+        job = pool.start(f"ping -c 2 {host}")
+    except Busy:
+        RUNNER_JOBS.inc("rejected")
+        return {"error": "Server busy, try again in a few seconds"}, 503, {"Retry-After": "5"}
+
+    def generate():
+        try:
+            for text in job.chunks(idle=STREAM_HEARTBEAT):
+                yield sse("output", {"text": text}) if text else ": heartbeat\n\n"
+            result = job.result
+            yield sse("done", {
+                "returncode": result.returncode, "timed_out": result.timed_out, "truncated": result.truncated,
+            })
+        finally:
+            job.close()
+
+    return Response(generate(), mimetype="text/event-stream", headers=STREAM_HEADERS)
+
+
+@app.post("/api/jobs")
+@limiter.limit("jobs", "60/60")
+def submit_job():
+    """Queue a ping in the background: 202 with the job id to poll."""
+    payload = request.get_json(silent=True)
+    host = payload.get("host") if isinstance(payload, dict) else request.form.get("host")
+    if not isinstance(host, str) or not host:
+        return {"error": "Missing host"}, 400
+    try:
+        job_id = jobs.submit(f"ping -c 2 {host}", client_key() or f"ip:{client_ip()}")
+    except TooManyJobs:
+        JOBS_SUBMITTED.inc("client_limit")
+        return {"error": f"At most {JOBS_PER_CLIENT} unfinished jobs per client"}, 429, {"Retry-After": "5"}
+    except QueueFull:
+        JOBS_SUBMITTED.inc("queue_full")
+        return {"error": "Server busy, try again in a few seconds"}, 503, {"Retry-After": "5"}
+    JOBS_SUBMITTED.inc("accepted")
+    location = url_for("job_status", job_id=job_id)
+    return {"id": job_id, "status": "queued", "url": location}, 202, {"Location": location}
+
+
+@app.get("/api/jobs/<job_id>")
+def job_status(job_id):
+    record = jobs.store.get(job_id)
+    if record is None:
+        return {"error": "Unknown or expired job"}, 404
+    del record["client"]
+    return record
 
 
 @app.route("/healthz")
@@ -90,8 +254,11 @@ def healthz():
     return {"status": "ok"}
 
 
+def shutdown():
+    """Per-worker cleanup, run by gunicorn's worker_exit hook (ctfcommon/gunicorn_conf.py)."""
+    jobs.stop()
+
+
 if __name__ == "__main__":
-    # Write flag to /flag.txt for the challenge
-    with open("/flag.txt", "w") as f:
-        f.write(FLAG)
-    app.run(host="0.0.0.0", port=5000, debug=False)
+    startup.run(Path(__file__).resolve().parent)  # startup.py, as the gunicorn master does
+    app.run(host="0.0.0.0", port=int(os.getenv("PORT", "5000")), debug=False)
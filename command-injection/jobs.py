@@ -0,0 +1,309 @@
+"""
+Asynchronous command jobs: submit now, collect the output later.
+
+    jobs = JobQueue(make_store("memory"), run=pool.run, workers=4)
+    job_id = jobs.submit("ping -c 2 127.0.0.1", client="ip:10.0.0.1")  # or TooManyJobs / QueueFull
+    jobs.store.get(job_id)  # {"id", "status": "queued" | "running" | "done" | "cancelled", "output", ...}, or None
+
+Commands run on the queue's own worker threads, never on the thread that
+served the request, so a slow injected command holds a job worker instead of
+an HTTP worker. The threads start with the first submit (after any fork).
+At most max_queued jobs wait for a worker per process; past that submit
+raises QueueFull. A client may have at most per_client jobs queued or
+running at once (TooManyJobs). Jobs still queued when the queue stops are
+stored as "cancelled", so a client polling them is not left waiting.
+
+The store keeps every job for ttl seconds after it was submitted, and a
+finished one for ttl seconds after it finished; then it is gone. It holds at
+most max_bytes of output: past that the oldest finished jobs are evicted
+first. Jobs live in process memory by default. Use
+sqlite:///path/jobs.db to share them between the workers of one container,
+so a job can be polled on any worker, not just the one that accepted it.
+"""
+import os
+import queue
+import secrets
+import sqlite3
+import threading
+import time
+from collections import Counter, OrderedDict
+from contextlib import closing
+
+FIELDS = ("id", "client", "status", "created", "finished", "output", "returncode", "timed_out", "truncated")
+
+
+class TooManyJobs(Exception):
+    """The client already has its maximum of unfinished jobs."""
+
+
+class QueueFull(Exception):
+    """No room in this worker's queue; retry later."""
+
+
+class MemoryJobStore:
+    def __init__(self, ttl: float = 300, max_bytes: int = 16 * 1024 * 1024):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._jobs = OrderedDict()  # id -> (expires_at, size, record), oldest first
+        self._active = Counter()  # client -> jobs not yet done
+        self._bytes = 0
+        self._next_prune = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, job_id: str, client: str, per_client: int) -> bool:
+        """Store a new queued job, unless the client already has per_client unfinished ones."""
+        now = time.time()
+        with self._lock:
+            self._prune(now)
+            if self._active[client] >= per_client:
+                return False
+            record = dict.fromkeys(FIELDS)
+            record.update(id=job_id, client=client, status="queued", created=now)
+            self._jobs[job_id] = (now + self.ttl, 0, record)
+            self._active[client] += 1
+        return True
+
+    def start(self, job_id: str) -> None:
+        with self._lock:
+            entry = self._jobs.get(job_id)
+            if entry is not None:
+                entry[2]["status"] = "running"
+
+    def finish(self, job_id: str, output: str, returncode, timed_out: bool, truncated: bool,
+               status: str = "done") -> None:
+        now = time.time()
+        size = len(output.encode())
+        with self._lock:
+            entry = self._jobs.pop(job_id, None)
+            if entry is None:
+                return  # expired while it ran
+            record = entry[2]
+            record.update(status=status, finished=now, output=output, returncode=returncode,
+                          timed_out=timed_out, truncated=truncated)
+            self._release(record["client"])
+            self._jobs[job_id] = (now + self.ttl, size, record)  # to the end: the newest result
+            self._bytes += size
+            if self._bytes > self.max_bytes:
+                for old_id in [i for i, (_, _, r) in self._jobs.items() if r["finished"] is not None]:
+                    self._remove(old_id)
+                    if self._bytes <= self.max_bytes:
+                        break
+
+    def remove(self, job_id: str) -> None:
+        with self._lock:
+            if job_id in self._jobs:
+                self._remove(job_id)
+
+    def get(self, job_id: str):
+        with self._lock:
+            entry = self._jobs.get(job_id)
+            if entry is None or entry[0] <= time.time():
+                return None
+            return dict(entry[2])
+
+    def _remove(self, job_id: str) -> None:
+        _, size, record = self._jobs.pop(job_id)
+        self._bytes -= size
+        if record["finished"] is None:
+            self._release(record["client"])
+
+    def _release(self, client: str) -> None:
+        self._active[client] -= 1
+        if not self._active[client]:
+            del self._active[client]
+
+    def _prune(self, now: float) -> None:
+        # A full scan, so at most once a second; get() checks expiry itself
+        if now < self._next_prune:
+            return
+        self._next_prune = now + 1
+        for job_id in [i for i, (expires_at, _, _) in self._jobs.items() if expires_at <= now]:
+            self._remove(job_id)
+
+    def stats(self) -> dict:
+        return {"jobs": len(self._jobs), "bytes": self._bytes, "max_bytes": self.max_bytes}
+
+
+class SQLiteJobStore:
+    """Jobs in a SQLite file shared by every worker process of a service."""
+
+    def __init__(self, path: str, ttl: float = 300, max_bytes: int = 16 * 1024 * 1024):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        # Not kept: the store is built at import, which may be in the gunicorn master
+        with closing(self._connect()) as con:
+            con.execute(
+                "CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, client TEXT NOT NULL, status TEXT NOT NULL,"
+                " created REAL NOT NULL, finished REAL, output TEXT, returncode INTEGER, timed_out INTEGER,"
+                " truncated INTEGER, expires REAL NOT NULL, size INTEGER NOT NULL DEFAULT 0)"
+            )
+            con.execute("CREATE INDEX IF NOT EXISTS jobs_client ON jobs (client, status)")
+            con.execute("CREATE INDEX IF NOT EXISTS jobs_expires ON jobs (expires)")
+
+    def _connect(self) -> sqlite3.Connection:
+        con = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        con.execute("PRAGMA journal_mode=WAL")
+        con.execute("PRAGMA synchronous=OFF")  # results are disposable
+        return con
+
+    def _conn(self) -> sqlite3.Connection:
+        # One connection per thread, and a new one after a fork
+        if getattr(self._local, "pid", None) != os.getpid():
+            self._local.con = self._connect()
+            self._local.pid = os.getpid()
+        return self._local.con
+
+    def _transaction(self, work):
+        con = self._conn()
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            value = work(con)
+            con.execute("COMMIT")
+        except BaseException:
+            con.execute("ROLLBACK")
+            raise
+        return value
+
+    def add(self, job_id: str, client: str, per_client: int) -> bool:
+        now = time.time()
+
+        def work(con):
+            con.execute("DELETE FROM jobs WHERE expires <= ?", (now,))
+            (active,) = con.execute(
+                "SELECT COUNT(*) FROM jobs WHERE client = ? AND finished IS NULL", (client,)
+            ).fetchone()
+            if active >= per_client:
+                return False
+            con.execute(
+                "INSERT INTO jobs (id, client, status, created, expires) VALUES (?, ?, 'queued', ?, ?)",
+                (job_id, client, now, now + self.ttl),
+            )
+            return True
+
+        return self._transaction(work)
+
+    def start(self, job_id: str) -> None:
+        self._conn().execute("UPDATE jobs SET status = 'running' WHERE id = ?", (job_id,))
+
+    def finish(self, job_id: str, output: str, returncode, timed_out: bool, truncated: bool,
+               status: str = "done") -> None:
+        now = time.time()
+
+        def work(con):
+            con.execute(
+                "UPDATE jobs SET status = ?, finished = ?, output = ?, returncode = ?, timed_out = ?,"
+                " truncated = ?, expires = ?, size = ? WHERE id = ?",
+                (status, now, output, returncode, timed_out, truncated, now + self.ttl, len(output.encode()), job_id),
+            )
+            (total,) = con.execute("SELECT COALESCE(SUM(size), 0) FROM jobs").fetchone()
+            if total <= self.max_bytes:
+                return
+            evict = []
+            for old_id, size in con.execute("SELECT id, size FROM jobs WHERE finished IS NOT NULL ORDER BY finished"):
+                if total <= self.max_bytes:
+                    break
+                evict.append((old_id,))
+                total -= size
+            con.executemany("DELETE FROM jobs WHERE id = ?", evict)
+
+        self._transaction(work)
+
+    def remove(self, job_id: str) -> None:
+        self._conn().execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+
+    def get(self, job_id: str):
+        row = self._conn().execute(
+            f"SELECT {', '.join(FIELDS)} FROM jobs WHERE id = ? AND expires > ?", (job_id, time.time())
+        ).fetchone()
+        if row is None:
+            return None
+        record = dict(zip(FIELDS, row))
+        if record["finished"] is not None:
+            record["timed_out"] = bool(record["timed_out"])
+            record["truncated"] = bool(record["truncated"])
+        return record
+
+    def stats(self) -> dict:
+        jobs, size = self._conn().execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM jobs").fetchone()
+        return {"jobs": jobs, "bytes": size, "max_bytes": self.max_bytes}
+
+
+def make_store(storage: str, ttl: float = 300, max_bytes: int = 16 * 1024 * 1024):
+    if storage.startswith("sqlite:///"):
+        return SQLiteJobStore(storage[len("sqlite:///"):], ttl, max_bytes)
+    return MemoryJobStore(ttl, max_bytes)
+
+
+class JobQueue:
+    def __init__(self, store, run, workers: int = 4, max_queued: int = 64, per_client: int = 10):
+        """run(command) -> RunResult, called on a worker thread."""
+        self.store = store
+        self.run = run
+        self.workers = workers
+        self.per_client = per_client
+        self.running = 0
+        self._queue = queue.Queue(max_queued)
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def submit(self, command: str, client: str) -> str:
+        self._ensure_workers()
+        job_id = secrets.token_urlsafe(16)  # unguessable: the id is the only key to the output
+        if not self.store.add(job_id, client, self.per_client):
+            raise TooManyJobs(client)
+        try:
+            self._queue.put_nowait((job_id, command))
+        except queue.Full:
+            self.store.remove(job_id)
+            raise QueueFull() from None
+        return job_id
+
+    def _ensure_workers(self) -> None:
+        if self._threads:
+            return
+        with self._lock:
+            if not self._threads:
+                for n in range(self.workers):
+                    thread = threading.Thread(target=self._work, name=f"command-job-{n}", daemon=True)
+                    thread.start()
+                    self._threads.append(thread)
+
+    def _work(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            job_id, command = item
+            self.store.start(job_id)
+            with self._lock:
+                self.running += 1
+            try:
+                result = self.run(command)
+                self.store.finish(job_id, result.output, result.returncode, result.timed_out, result.truncated)
+            except Exception as exc:
+                self.store.finish(job_id, f"Error: {exc}", None, False, False)
+            finally:
+                with self._lock:
+                    self.running -= 1
+
+    @property
+    def queued(self) -> int:
+        return self._queue.qsize()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Let the workers finish their current job and exit; queued jobs are cancelled."""
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                self.store.finish(item[0], "Cancelled: the service shut down before the job ran", None,
+                                  False, False, status="cancelled")
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
@@ -0,0 +1,237 @@
+"""
+Bounded, sandboxed execution of the ping command line.
+
+    pool = RunnerPool(max_concurrency=8, max_queue=32)
+    result = pool.run("ping -c 2 127.0.0.1; id")    # RunResult, or raises Busy
+
+    job = pool.start("ping -c 2 127.0.0.1")         # or stream it
+    try:
+        for text in job.chunks():
+            send(text)
+    finally:
+        job.close()                                  # kills the group if it still runs
+
+At most max_concurrency commands run at once; up to max_queue more requests
+wait (at most queue_timeout seconds) for a slot, the rest get Busy at once.
+
+Each command runs under /bin/sh in a session of its own (so it leads its own
+process group) with rlimits on CPU time, address space, processes and file
+size. The limits are set by util-linux prlimit(1), which execs the shell:
+no Python runs between fork and exec (a preexec_fn is not safe in a
+threaded worker). Without prlimit installed they are applied to the shell
+right after it started, which leaves it a moment without them.
+
+When the shell exits, anything it left behind in that group (`sleep 999 &`)
+is killed. So is the whole group when the command runs past its timeout or
+writes more than output_limit bytes, or when the job is closed before it
+finished (the client went away). Output is read as it comes in chunks of at
+most CHUNK bytes, and nothing beyond the limit is kept.
+
+The group is not a wall. A command can leave it with setsid(1), and such a
+process outlives its request. It keeps the rlimits it inherited, so it gets
+at most cpu_seconds of CPU time and memory_bytes of address space. How many
+there can be is bounded by RLIMIT_NPROC, which counts processes per user,
+but the kernel does not apply it to root. The service's container therefore
+has a pids limit as well (docker-compose.yml).
+"""
+import codecs
+import os
+import resource
+import selectors
+import shutil
+import signal
+import subprocess
+import threading
+import time
+
+MB = 1024 * 1024
+CHUNK = 4096
+PRLIMIT = shutil.which("prlimit")
+
+
+class Busy(Exception):
+    """No slot became free in time; the caller should retry later."""
+
+
+class RunResult:
+    def __init__(self, output: str, returncode, timed_out: bool, truncated: bool, seconds: float, waited: float):
+        self.output = output
+        self.returncode = returncode
+        self.timed_out = timed_out
+        self.truncated = truncated
+        self.seconds = seconds
+        self.waited = waited
+
+
+class Job:
+    """A running command. Iterate chunks() for its output as it arrives; always close() it."""
+
+    def __init__(self, pool, proc, waited: float):
+        self.pool = pool
+        self.proc = proc
+        self.waited = waited
+        self.start = time.perf_counter()
+        self.deadline = self.start + pool.timeout
+        self.size = 0
+        self.killed = None  # "timeout", "output" or "cancelled"
+        self.result = None  # RunResult once closed; output is not kept here
+        self._finished = False
+        self._decoder = codecs.getincrementaldecoder("utf-8")("replace")
+
+    def chunks(self, idle: float = None):
+        """
+        Output text as it arrives. With idle set, yields "" after idle seconds
+        without output, so a streaming caller gets a chance to notice that its
+        client is gone.
+        """
+        limit = self.pool.output_limit
+        last = time.perf_counter()
+        exited = False
+        try:
+            with selectors.DefaultSelector() as selector:
+                selector.register(self.proc.stdout, selectors.EVENT_READ)
+                while True:
+                    now = time.perf_counter()
+                    if now >= self.deadline:
+                        self.killed = "timeout"
+                        break
+                    if not selector.select(0 if exited else min(self.deadline - now, 0.1)):
+                        if exited:
+                            break
+                        if self.proc.poll() is not None:
+                            # The shell is done; what still holds the pipe is left-over background jobs.
+                            # Read what is already in the pipe (its last output), without waiting for them.
+                            exited = True
+                            continue
+                        if idle is not None and now - last >= idle:
+                            last = now
+                            yield ""
+                        continue
+                    data = os.read(self.proc.stdout.fileno(), CHUNK)
+                    if not data:
+                        break  # every process in the group closed its output
+                    text = self._decoder.decode(data[:limit - self.size])
+                    self.size += len(data)
+                    if text:
+                        last = now
+                        yield text
+                    if self.size > limit:
+                        self.killed = "output"
+                        break
+            self._finished = True
+            tail = self._decoder.decode(b"", final=True)
+            if tail:
+                yield tail
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        """Kill the process group and free the slot; safe to call more than once."""
+        if self.result is not None:
+            return
+        if not self._finished and self.killed is None:
+            self.killed = "cancelled"
+        try:
+            os.killpg(self.proc.pid, signal.SIGKILL)  # the session leader's pid is the group id
+        except ProcessLookupError:
+            pass  # the group is already gone
+        self.proc.stdout.close()
+        returncode = self.proc.wait()
+        self.result = RunResult(
+            None, returncode, timed_out=self.killed == "timeout", truncated=self.killed == "output",
+            seconds=time.perf_counter() - self.start, waited=self.waited,
+        )
+        self.pool._finish(self)
+
+
+class RunnerPool:
+    def __init__(self, max_concurrency: int = 8, max_queue: int = 32, queue_timeout: float = 5.0,
+                 timeout: float = 10.0, output_limit: int = 64 * 1024, cpu_seconds: int = 5,
+                 memory_bytes: int = 256 * MB, nproc: int = 64, file_size: int = 1 * MB, on_finish=None):
+        """on_finish(result, reason): reason is None, or why the group was killed ("timeout", "output", "cancelled")."""
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.timeout = timeout
+        self.output_limit = output_limit
+        self.limits = [
+            (resource.RLIMIT_CPU, cpu_seconds),
+            (resource.RLIMIT_AS, memory_bytes),
+            (resource.RLIMIT_NPROC, nproc),
+            (resource.RLIMIT_FSIZE, file_size),
+        ]
+        self.prefix = [
+            PRLIMIT, f"--cpu={cpu_seconds}", f"--as={memory_bytes}", f"--nproc={nproc}", f"--fsize={file_size}", "--",
+        ] if PRLIMIT else []
+        self.on_finish = on_finish
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._lock = threading.Lock()
+        self.running = 0
+        self.waiting = 0
+        self.rejected = 0
+        self.kills = 0
+
+    def _apply_limits(self, pid: int) -> None:
+        # Only without prlimit(1): the shell is already running
+        try:
+            for limit, value in self.limits:
+                resource.prlimit(pid, limit, (value, value))
+        except ProcessLookupError:
+            pass  # already exited
+
+    def start(self, command: str) -> Job:
+        """Wait for a slot (or raise Busy) and start the command."""
+        queued = time.perf_counter()
+        with self._lock:
+            if self.waiting >= self.max_queue:
+                self.rejected += 1
+                raise Busy("queue full")
+            self.waiting += 1
+        try:
+            acquired = self._slots.acquire(timeout=self.queue_timeout)
+        finally:
+            with self._lock:
+                self.waiting -= 1
+        if not acquired:
+            with self._lock:
+                self.rejected += 1
+            raise Busy("no free slot")
+        try:
+            proc = subprocess.Popen(
+                self.prefix + ["/bin/sh", "-c", command],
+                stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                start_new_session=True,
+            )
+        except BaseException:
+            self._slots.release()
+            raise
+        if not self.prefix:
+            self._apply_limits(proc.pid)
+        with self._lock:
+            self.running += 1
+        return Job(self, proc, time.perf_counter() - queued)
+
+    def run(self, command: str) -> RunResult:
+        """Run to the end and return all (capped) output at once."""
+        job = self.start(command)
+        output = "".join(job.chunks())  # closes the job
+        job.result.output = output
+        return job.result
+
+    def _finish(self, job: Job) -> None:
+        with self._lock:
+            self.running -= 1
+            if job.killed:
+                self.kills += 1
+        self._slots.release()
+        if self.on_finish is not None:
+            self.on_finish(job.result, job.killed)
+
+    def stats(self) -> dict:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "running": self.running,
+            "waiting": self.waiting,
+            "rejected": self.rejected,
+            "kills": self.kills,
+        }
@@ -6,9 +6,19 @@ Objective: Use SSRF to access Docker API and break out of container via bind-mou
 from flask import Flask, request, jsonify
 import os
 import requests
+import sys
 from pathlib import Path
 
+sys.path.append(str(Path(__file__).resolve().parent.parent))  # shared ctfcommon/ package in a repo checkout
+
+from ctfcommon.ratelimit import RateLimiter
+from ctfcommon import urls
+from ctfcommon.metrics import Metrics
+
 app = Flask(__name__, template_folder=str(Path(__file__).parent / "templates"))
+urls.init_app(app)
+limiter = RateLimiter(app)
+metrics = Metrics(app)
 
 FLAG = os.getenv("FLAG", "CTF{host_root_pwn}")
 DIND_HOST = os.getenv("DIND_HOST", "http://dind-host:2375")
@@ -24,7 +34,7 @@ def index():
     <body>
         <h1>Container Breakout Challenge</h1>
         <p>Docker API endpoint: {DIND_HOST}</p>
-        <form method="post" action="/fetch">
+        <form method="post" action="fetch">
             <input type="text" name="url" placeholder="http://dind-host:2375/_ping" required>
             <button>Fetch</button>
         </form>
@@ -35,6 +45,7 @@ def index():
 
 
 @app.route("/fetch", methods=["GET", "POST"])
+@limiter.limit("docker-fetch", "60/60")
 def fetch():
     """
     VULNERABLE: SSRF endpoint that fetches arbitrary URLs
@@ -76,4 +87,4 @@ def healthz():
 
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000, debug=False)
+    app.run(host="0.0.0.0", port=int(os.getenv("PORT", "5000")), debug=False)
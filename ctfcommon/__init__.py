@@ -0,0 +1,7 @@
+"""
+Code shared by the portal and the challenge apps.
+
+Each service still builds from its own directory; docker-compose passes this
+package in as an extra build context and the Dockerfiles copy it next to
+app.py. In a repo checkout the apps add the repo root to sys.path instead.
+"""
@@ -0,0 +1,53 @@
+"""
+JSON batch endpoints: many tokens in one HTTP request, for graders and load tests.
+
+    @app.post("/verify/batch")
+    def verify_batch():
+        return batch.respond("tokens", verify_result)   # verify_result(item) -> (body, status)
+
+The request body is {"tokens": [...]}. Each item gets the HTTP status and
+JSON body the single-item endpoint would have answered:
+{"status": 401, "body": {"error": ...}}.
+Up to BATCH_STREAM_MIN items come back as one JSON document
+{"results": [...]}. Larger batches, or any batch requested with
+"Accept: application/x-ndjson", are streamed as NDJSON, one result per line
+in item order, so the client can start on the first results while the
+server still works on the rest.
+
+BATCH_MAX (default 1000) caps the items per request; more answers 413.
+"""
+import json
+import os
+
+from flask import Response, jsonify, request, stream_with_context
+
+BATCH_MAX = int(os.getenv("BATCH_MAX", "1000"))
+BATCH_STREAM_MIN = int(os.getenv("BATCH_STREAM_MIN", "100"))
+NDJSON = "application/x-ndjson"
+
+
+def wants_ndjson(count: int) -> bool:
+    return count > BATCH_STREAM_MIN or request.accept_mimetypes.best == NDJSON
+
+
+def respond(field: str, handle):
+    payload = request.get_json(silent=True)
+    items = payload.get(field) if isinstance(payload, dict) else None
+    if not isinstance(items, list):
+        return jsonify({"error": f'Expected a JSON body {{"{field}": [...]}}'}), 400
+    if len(items) > BATCH_MAX:
+        return jsonify({"error": f"At most {BATCH_MAX} {field} per batch"}), 413
+
+    def result(item) -> dict:
+        body, status = handle(item)
+        return {"status": status, "body": body}
+
+    if not wants_ndjson(len(items)):
+        return jsonify({"results": [result(item) for item in items]})
+
+    def lines():
+        for item in items:
+            yield json.dumps(result(item)) + "\n"
+
+    # stream_with_context: the handlers still read the request (per-player flags)
+    return Response(stream_with_context(lines()), mimetype=NDJSON)
@@ -0,0 +1,80 @@
+"""
+Per-player flags derived from a shared event key.
+
+With EVENT_KEY set, a challenge that would hand out CTF{base} hands out
+CTF{base-<tag>} instead, where tag = HMAC(EVENT_KEY, challenge|player). The
+portal verifies a submission by recomputing the tag for the submitting
+player: O(1), no table of players x challenges, no database query.
+
+The portal tells the challenge apps who the player is through the
+`ctf_player` cookie ("<base64 name>.<signature>"). Cookies are not scoped
+to a port, so the apps on :8001-:8009 (or under path prefixes behind nginx)
+all receive it.
+"""
+import base64
+import hashlib
+import hmac
+import os
+import re
+
+EVENT_KEY = os.getenv("EVENT_KEY", "")
+ENABLED = bool(EVENT_KEY)
+PLAYER_COOKIE = "ctf_player"
+TAG_LENGTH = 16  # hex characters of the HMAC kept in the flag
+
+_DYNAMIC_FLAG = re.compile(r"^(?P<prefix>\w+)\{(?P<base>.+)-(?P<tag>[0-9a-f]{%d})\}$" % TAG_LENGTH)
+_STATIC_FLAG = re.compile(r"^(?P<prefix>\w+)\{(?P<base>.+)\}$")
+
+
+def _mac(message: str) -> str:
+    return hmac.new(EVENT_KEY.encode(), message.encode(), hashlib.sha256).hexdigest()
+
+
+def sign_player(player: str) -> str:
+    """Cookie value identifying a player to the challenge apps."""
+    encoded = base64.urlsafe_b64encode(player.encode()).decode().rstrip("=")
+    return f"{encoded}.{_mac('player|' + encoded)[:32]}"
+
+
+def read_player(cookie_value):
+    """Player name from a signed cookie value, or None if missing or forged."""
+    if not ENABLED or not cookie_value or "." not in cookie_value:
+        return None
+    encoded, signature = cookie_value.rsplit(".", 1)
+    if not hmac.compare_digest(signature, _mac("player|" + encoded)[:32]):
+        return None
+    try:
+        return base64.urlsafe_b64decode(encoded + "=" * (-len(encoded) % 4)).decode()
+    except ValueError:
+        return None
+
+
+def flag_tag(challenge_id: str, player: str) -> str:
+    return _mac(f"flag|{challenge_id}|{player}")[:TAG_LENGTH]
+
+
+def derive_flag(static_flag: str, challenge_id: str, player: str) -> str:
+    match = _STATIC_FLAG.match(static_flag)
+    if not match:
+        return static_flag
+    return f"{match['prefix']}{{{match['base']}-{flag_tag(challenge_id, player)}}}"
+
+
+def split_flag(submitted: str):
+    """Split CTF{base-tag} into (static flag CTF{base}, tag); None if it is not a derived flag."""
+    match = _DYNAMIC_FLAG.match(submitted)
+    if not match:
+        return None
+    return f"{match['prefix']}{{{match['base']}}}", match["tag"]
+
+
+def verify_tag(tag: str, challenge_id: str, player: str) -> bool:
+    return hmac.compare_digest(tag, flag_tag(challenge_id, player))
+
+
+def flag_for(request, static_flag: str, challenge_id: str) -> str:
+    """The flag a challenge app should reveal for this request."""
+    player = read_player(request.cookies.get(PLAYER_COOKIE))
+    if player is None:
+        return static_flag
+    return derive_flag(static_flag, challenge_id, player)
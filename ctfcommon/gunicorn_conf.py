@@ -0,0 +1,49 @@
+"""
+Gunicorn settings shared by every service:
+
+    gunicorn -c python:ctfcommon.gunicorn_conf app:app
+
+Tuned through the environment so docker-compose can size each service:
+WEB_CONCURRENCY (workers), GUNICORN_THREADS, GUNICORN_WORKER_CLASS
+(gthread, or gevent for the portal's SSE stream), GUNICORN_PRELOAD,
+GUNICORN_TIMEOUT and PORT.
+"""
+import importlib.util
+import os
+import sys
+from pathlib import Path
+
+from ctfcommon import startup
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+threads = int(os.getenv("GUNICORN_THREADS", "4"))
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gthread")
+worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", "1000"))
+preload_app = os.getenv("GUNICORN_PRELOAD", "1") == "1"
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "30"))
+graceful_timeout = 10
+keepalive = 5
+accesslog = "-"
+errorlog = "-"
+
+
+def on_starting(server):
+    """
+    Run the app's one-time startup work (writing /flag.txt, creating a database)
+    once, in the master, before any worker forks. Apps opt in with a startup.py
+    next to the app module (ctfcommon/startup.py); the app itself is not
+    imported here, so GUNICORN_PRELOAD=0 keeps it out of the master.
+    """
+    module_name = server.app.app_uri.split(":", 1)[0]
+    spec = importlib.util.find_spec(module_name)  # locates the file without running it
+    if spec is not None and spec.origin:
+        startup.run(Path(spec.origin).parent)
+
+
+def worker_exit(server, worker):
+    """Release per-worker resources (cached database connections, ...). Apps opt in with shutdown()."""
+    module_name = server.app.app_uri.split(":", 1)[0]
+    shutdown = getattr(sys.modules.get(module_name), "shutdown", None)
+    if shutdown is not None:
+        shutdown()
@@ -0,0 +1,126 @@
+"""
+Concurrent health probes for every service.
+
+    poller = HealthPoller(parse_targets("portal=http://portal:5000/healthz,brute-ssh=tcp://brute-ssh:22"))
+    poller.start()           # background thread with its own asyncio loop
+    poller.snapshot()        # last results; never waits on a probe
+
+An http(s):// target is up when it answers 200 within the timeout, a tcp://
+target when it accepts a connection. All targets of one round are probed at
+the same time, so a round takes as long as the slowest probe, not the sum.
+
+Used by the portal (/api/status, badges on the home page) and by smoke.py.
+"""
+import asyncio
+import socket
+import ssl
+import threading
+import time
+from urllib.parse import urlsplit
+
+
+def parse_targets(spec: str) -> dict:
+    """"name=url,name=url" -> {name: url}"""
+    targets = {}
+    for item in spec.split(","):
+        name, sep, url = item.strip().partition("=")
+        if sep and name and url:
+            targets[name.strip()] = url.strip()
+    return targets
+
+
+def _describe(exc: Exception) -> str:
+    if isinstance(exc, asyncio.TimeoutError):
+        return "timeout"
+    if isinstance(exc, ConnectionRefusedError):
+        return "refused"
+    if isinstance(exc, socket.gaierror):
+        return "unknown host"
+    return str(exc) or type(exc).__name__
+
+
+async def probe(url: str, timeout: float) -> dict:
+    """Probe one target: {"up", "latency_ms", "error"}."""
+    parts = urlsplit(url)
+    tls = parts.scheme == "https"
+    port = parts.port or (443 if tls else 80)
+    start = time.perf_counter()
+    writer = None
+    try:
+        async with asyncio.timeout(timeout):
+            reader, writer = await asyncio.open_connection(
+                parts.hostname, port, ssl=ssl.create_default_context() if tls else None,
+            )
+            if parts.scheme in ("http", "https"):
+                path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+                writer.write(
+                    f"GET {path} HTTP/1.1\r\nHost: {parts.netloc}\r\n"
+                    f"User-Agent: ctf-health\r\nConnection: close\r\n\r\n".encode()
+                )
+                await writer.drain()
+                status_line = await reader.readline()
+                status = status_line.split(b" ", 2)[1:2]
+                if status != [b"200"]:
+                    raise ConnectionError(f"HTTP {b''.join(status).decode() or '?'}")
+        return {"up": True, "latency_ms": round((time.perf_counter() - start) * 1000, 1), "error": None}
+    except (OSError, asyncio.TimeoutError, ValueError) as exc:
+        return {"up": False, "latency_ms": None, "error": _describe(exc)}
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+async def probe_all(targets: dict, timeout: float) -> dict:
+    results = await asyncio.gather(*(probe(url, timeout) for url in targets.values()))
+    checked_at = time.time()
+    return {name: {**result, "checked_at": checked_at} for name, result in zip(targets, results)}
+
+
+def check(targets: dict, timeout: float = 5.0) -> dict:
+    """One round of probes, from synchronous code."""
+    return asyncio.run(probe_all(targets, timeout))
+
+
+class HealthPoller(threading.Thread):
+    """Probes the targets every interval seconds and keeps the last results."""
+
+    def __init__(self, targets: dict, interval: float = 15.0, timeout: float = 3.0):
+        super().__init__(name="health-poller", daemon=True)
+        self.targets = targets
+        self.interval = interval
+        self.timeout = timeout
+        self.rounds = 0
+        self._results = {name: {"up": None, "latency_ms": None, "error": None, "checked_at": None, "since": None}
+                         for name in targets}
+        self._stop_event = threading.Event()
+
+    def snapshot(self) -> dict:
+        """name -> last result; "up" is None until the first round finished."""
+        return self._results
+
+    def poll_once(self, loop) -> None:
+        results = loop.run_until_complete(probe_all(self.targets, self.timeout))
+        previous = self._results
+        for name, result in results.items():
+            # When the current up/down state started
+            before = previous.get(name, {})
+            same = before.get("up") == result["up"] and before.get("since")
+            result["since"] = before["since"] if same else result["checked_at"]
+        self._results = results  # replaced whole, so readers never see half a round
+        self.rounds += 1
+
+    def run(self) -> None:
+        loop = asyncio.new_event_loop()
+        try:
+            while not self._stop_event.is_set():
+                try:
+                    self.poll_once(loop)
+                except Exception:
+                    # A broken probe round must not kill the poller
+                    pass
+                self._stop_event.wait(self.interval)
+        finally:
+            loop.close()
+
+    def stop(self) -> None:
+        self._stop_event.set()
@@ -0,0 +1,89 @@
+"""
+Cache of verified JWTs, for endpoints that players hit in a loop.
+
+    decode = VerifiedTokenCache(lambda token: jwt.decode(token, SECRET, algorithms=["HS256"]))
+    claims = decode(token)   # same result and same exceptions as the lambda
+
+Tokens are keyed on their SHA-256 digest. A valid token's claims are kept
+until the token's own "exp"; after that it is decoded again, so the caller
+still gets jwt.ExpiredSignatureError at exactly the same moment. A rejected
+token is remembered for negative_ttl seconds and the same error (type and
+message) is raised again. Errors that can turn into success with time (a
+future "nbf" or "iat") are never cached.
+
+Size with JWT_CACHE_SIZE (entries, default 4096; 0 disables the cache) and
+JWT_CACHE_NEGATIVE_TTL (seconds, default 5).
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import jwt
+
+JWT_CACHE_SIZE = int(os.getenv("JWT_CACHE_SIZE", "4096"))
+JWT_CACHE_NEGATIVE_TTL = float(os.getenv("JWT_CACHE_NEGATIVE_TTL", "5"))
+
+# Not yet valid is not the same as invalid: decode these again every time
+UNCACHEABLE = (jwt.ImmatureSignatureError,)
+
+
+class VerifiedTokenCache:
+    def __init__(self, decode, maxsize: int = None, negative_ttl: float = None, clock=time.time):
+        self.decode = decode
+        self.maxsize = JWT_CACHE_SIZE if maxsize is None else maxsize
+        self.negative_ttl = JWT_CACHE_NEGATIVE_TTL if negative_ttl is None else negative_ttl
+        self.clock = clock
+        # digest -> (expires_at, claims, error); error is (type, args) for a rejected token
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __call__(self, token: str) -> dict:
+        if self.maxsize <= 0:
+            return self.decode(token)
+        key = hashlib.sha256(token.encode("utf-8", "surrogatepass")).digest()
+        now = self.clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now < entry[0]:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                expires_at, claims, error = entry
+                if error is not None:
+                    raise error[0](*error[1])
+                return dict(claims)  # callers may change their copy
+            self.misses += 1
+
+        try:
+            claims = self.decode(token)
+        except UNCACHEABLE:
+            raise
+        except jwt.InvalidTokenError as exc:
+            self._store(key, (now + self.negative_ttl, None, (type(exc), exc.args)))
+            raise
+        self._store(key, (self._expiry(claims), claims, None))
+        return dict(claims)
+
+    @staticmethod
+    def _expiry(claims) -> float:
+        """The token's own "exp" (PyJWT rejects it from that second on), or never."""
+        if not isinstance(claims, dict) or "exp" not in claims:
+            return float("inf")
+        return float(int(claims["exp"]))  # as PyJWT reads it; decode() already checked it parses
+
+    def _store(self, key: bytes, entry: tuple) -> None:
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        return {"entries": len(self._entries), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,235 @@
+"""
+Request metrics in the Prometheus text format.
+
+    metrics = Metrics(app)                       # GET /metrics
+    submissions = metrics.counter("flag_submissions_total", "Flags submitted", ("challenge", "result"))
+    submissions.inc("login-sqli", "correct")
+    metrics.gauge("queue_depth", "Jobs waiting", lambda: pool.waiting)   # read at scrape time
+
+Per route (the URL rule, so /hidden/<path> is one series) and method:
+request counts by status, a latency histogram, response sizes, and an
+in-flight gauge per app.
+
+Every OS thread writes to its own shard, so recording a request takes no
+lock; /metrics adds the shards up. Shards are keyed by the native thread id,
+which gevent does not patch, so greenlets on one thread share a shard (they
+cannot preempt each other mid-update) instead of creating one each.
+
+Counters are per process. Every series carries a worker="<pid>" label, so
+with several gunicorn workers a scrape that lands on another worker shows up
+as another series instead of a counter going backwards; sum() over worker.
+
+Latency is measured up to the moment the response is returned by the view,
+so for streamed responses (/events) it is the time to the first byte.
+"""
+import os
+import threading
+import time
+from pathlib import Path
+
+from flask import Response, request
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+UNMATCHED = "<unmatched>"  # 404s and the like, so random paths do not create series
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values) -> str:
+    return ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values))
+
+
+class _Shard:
+    def __init__(self):
+        self.requests = {}  # (route, method, status) -> count
+        self.latency = {}  # (route, method) -> [bucket counts..., sum, count]
+        self.sizes = {}  # (route, method) -> [bytes, responses]
+        self.in_flight = 0
+        self.counters = {}  # (metric name, label values) -> count
+
+
+class Counter:
+    """A labelled counter, sharded like the request metrics."""
+
+    def __init__(self, registry, name: str, help_text: str, labels=()):
+        self.registry = registry
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+
+    def inc(self, *values, amount: int = 1) -> None:
+        counters = self.registry._shard().counters
+        key = (self.name, values)
+        counters[key] = counters.get(key, 0) + amount
+
+
+class Metrics:
+    def __init__(self, app=None, buckets=DEFAULT_BUCKETS, app_label: str = None):
+        self.buckets = tuple(buckets)
+        self.app_label = app_label
+        self.custom = {}  # name -> Counter
+        self.gauges = {}  # name -> (help, read())
+        self._shards = {}  # native thread id -> _Shard
+        self._shards_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app) -> None:
+        if self.app_label is None:
+            # The service directory: portal, login-sqli, ...
+            self.app_label = Path(app.root_path).name
+        # First, so requests answered by another before_request hook (429s) are timed too
+        app.before_request_funcs.setdefault(None, []).insert(0, self._before)
+        app.after_request(self._after)
+        app.teardown_request(self._teardown)
+        app.add_url_rule("/metrics", "metrics", self.view)
+
+    def counter(self, name: str, help_text: str, labels=()) -> Counter:
+        counter = Counter(self, name, help_text, labels)
+        self.custom[name] = counter
+        return counter
+
+    def gauge(self, name: str, help_text: str, read) -> None:
+        """A value of this process, read() when /metrics is scraped."""
+        self.gauges[name] = (help_text, read)
+
+    def _shard(self) -> _Shard:
+        tid = threading.get_native_id()
+        shard = self._shards.get(tid)
+        if shard is None:
+            # Once per thread, not per request
+            with self._shards_lock:
+                shard = self._shards.setdefault(tid, _Shard())
+        return shard
+
+    # Request hooks. State lives on the request object itself: one proxy lookup
+    # per hook instead of one per attribute through flask.g.
+
+    def _before(self) -> None:
+        req = request._get_current_object()
+        req._metrics_start = time.perf_counter()
+        self._shard().in_flight += 1
+
+    def _after(self, response: Response) -> Response:
+        req = request._get_current_object()
+        start = getattr(req, "_metrics_start", None)
+        if start is not None:
+            req._metrics_start = None
+            size = None if response.is_streamed else response.calculate_content_length()
+            self._record(req, response.status_code, time.perf_counter() - start, size)
+            req._metrics_recorded = True
+        return response
+
+    def _teardown(self, exc) -> None:
+        req = request._get_current_object()
+        start = getattr(req, "_metrics_start", None)
+        if start is not None:
+            # The request failed before a response existed
+            req._metrics_start = None
+            self._record(req, 500, time.perf_counter() - start, None)
+        elif not getattr(req, "_metrics_recorded", False):
+            return
+        self._shard().in_flight -= 1
+
+    def _record(self, req, status: int, seconds: float, size) -> None:
+        shard = self._shard()
+        route = req.url_rule.rule if req.url_rule is not None else UNMATCHED
+        method = req.method
+        key = (route, method, status)
+        shard.requests[key] = shard.requests.get(key, 0) + 1
+
+        hist = shard.latency.get((route, method))
+        if hist is None:
+            hist = shard.latency[(route, method)] = [0] * (len(self.buckets) + 2)
+        for i, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                hist[i] += 1
+                break
+        hist[-2] += seconds
+        hist[-1] += 1
+
+        if size is not None:
+            sizes = shard.sizes.get((route, method))
+            if sizes is None:
+                sizes = shard.sizes[(route, method)] = [0, 0]
+            sizes[0] += size
+            sizes[1] += 1
+
+    # Exposition
+
+    def collect(self) -> dict:
+        """All shards added up (also used by tests)."""
+        requests, latency, sizes, counters = {}, {}, {}, {}
+        in_flight = 0
+        for shard in list(self._shards.values()):
+            in_flight += shard.in_flight
+            for key, value in list(shard.requests.items()):
+                requests[key] = requests.get(key, 0) + value
+            for key, hist in list(shard.latency.items()):
+                total = latency.setdefault(key, [0] * len(hist))
+                for i, value in enumerate(list(hist)):
+                    total[i] += value
+            for key, (size, count) in list(shard.sizes.items()):
+                total = sizes.setdefault(key, [0, 0])
+                total[0] += size
+                total[1] += count
+            for key, value in list(shard.counters.items()):
+                counters[key] = counters.get(key, 0) + value
+        return {"requests": requests, "latency": latency, "sizes": sizes, "counters": counters, "in_flight": in_flight}
+
+    def render(self) -> str:
+        data = self.collect()
+        app = f'app="{_escape(self.app_label)}",worker="{os.getpid()}"'
+        lines = [
+            "# HELP http_requests_total Requests by route, method and status.",
+            "# TYPE http_requests_total counter",
+        ]
+        for (route, method, status), value in sorted(data["requests"].items()):
+            lines.append(f'http_requests_total{{{app},{_labels(("route", "method", "status"), (route, method, status))}}} {value}')
+
+        lines += [
+            "# HELP http_request_duration_seconds Time until the view returned a response.",
+            "# TYPE http_request_duration_seconds histogram",
+        ]
+        for (route, method), hist in sorted(data["latency"].items()):
+            labels = f'{app},{_labels(("route", "method"), (route, method))}'
+            cumulative = 0
+            for bound, value in zip(self.buckets, hist):
+                cumulative += value
+                lines.append(f'http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} {hist[-1]}')
+            lines.append(f"http_request_duration_seconds_sum{{{labels}}} {hist[-2]:.6f}")
+            lines.append(f"http_request_duration_seconds_count{{{labels}}} {hist[-1]}")
+
+        lines += [
+            "# HELP http_response_size_bytes Response body sizes (streamed responses excluded).",
+            "# TYPE http_response_size_bytes summary",
+        ]
+        for (route, method), (size, count) in sorted(data["sizes"].items()):
+            labels = f'{app},{_labels(("route", "method"), (route, method))}'
+            lines.append(f"http_response_size_bytes_sum{{{labels}}} {size}")
+            lines.append(f"http_response_size_bytes_count{{{labels}}} {count}")
+
+        lines += [
+            "# HELP http_requests_in_flight Requests being handled right now.",
+            "# TYPE http_requests_in_flight gauge",
+            f"http_requests_in_flight{{{app}}} {data['in_flight']}",
+        ]
+
+        for name, counter in sorted(self.custom.items()):
+            lines.append(f"# HELP {name} {counter.help}")
+            lines.append(f"# TYPE {name} counter")
+            for (metric, values), value in sorted(data["counters"].items()):
+                if metric == name:
+                    lines.append(f"{name}{{{app},{_labels(counter.labels, values)}}} {value}")
+
+        for name, (help_text, read) in sorted(self.gauges.items()):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name}{{{app}}} {read()}")
+        return "\n".join(lines) + "\n"
+
+    def view(self):
+        return Response(self.render(), mimetype="text/plain; version=0.0.4")
@@ -0,0 +1,271 @@
+"""
+Token-bucket rate limiting for Flask routes.
+
+    limiter = RateLimiter(app)
+
+    @app.post("/deserialize")
+    @limiter.limit("deserialize", "10/60")
+    def deserialize(): ...
+
+A rate "N/S" is a bucket of N tokens refilled at N per S seconds, so a client
+may burst N requests and then sustain N every S seconds. Each route's rate
+can be overridden with RATE_LIMIT_<NAME> (e.g. RATE_LIMIT_DESERIALIZE=30/60,
+or "off"); RATE_LIMIT_ENABLED=0 turns limiting off entirely.
+
+Buckets live in process memory by default. Set
+RATE_LIMIT_STORAGE=sqlite:///path/ratelimit.db to share them between the
+workers of one container, so N workers do not mean N times the limit.
+
+Every request takes a token from two buckets. The client's own bucket is
+keyed on the signed portal player cookie, else on a signed random client
+cookie that the limiter sets on the first response (or on another key
+function that returns None unless the request carries a valid signed
+identity). A request without either uses "anon:<ip>". Every client behind
+one address also shares an IP bucket of RATE_LIMIT_IP_FACTOR (default 10)
+times the rate, for a classroom behind NAT. So each browser in the classroom
+gets its own bucket, and a client that drops its cookie, or collects new
+player names, still runs into its address's buckets.
+
+The client cookie is signed with RATE_LIMIT_SECRET, else the app's
+secret_key, else a key made at import (shared by preloaded gunicorn
+workers, new after a restart). It is named after its key, so apps with
+different keys on one host do not overwrite each other's.
+
+Rejected requests get 429 with Retry-After; GET /ratelimit returns counters.
+"""
+import functools
+import hashlib
+import hmac
+import math
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from contextlib import closing
+
+from flask import current_app, jsonify, request
+
+from ctfcommon import dynflag
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "1") != "0"
+RATE_LIMIT_STORAGE = os.getenv("RATE_LIMIT_STORAGE", "memory")
+RATE_LIMIT_IP_FACTOR = float(os.getenv("RATE_LIMIT_IP_FACTOR", "10"))
+RATE_LIMIT_SECRET = os.getenv("RATE_LIMIT_SECRET", "")
+_PROCESS_SECRET = secrets.token_hex(32)
+# How often (seconds) a SQLite backend deletes buckets that have refilled
+PRUNE_INTERVAL = 60
+
+
+def parse_rate(rate: str):
+    """"30/60" -> (capacity 30, refill 0.5 tokens/s); "off" -> None."""
+    if rate.strip().lower() in ("off", "0", "none"):
+        return None
+    count, _, seconds = rate.partition("/")
+    capacity = int(count)
+    return capacity, capacity / float(seconds or 1)
+
+
+class MemoryBackend:
+    def __init__(self, max_keys: int = 100_000):
+        self.max_keys = max_keys
+        self._buckets = {}  # key -> (tokens, updated_at, full_at)
+        self._lock = threading.Lock()
+
+    def take(self, key: str, capacity: int, refill: float, now: float):
+        """Take one token. Returns (allowed, seconds until a token is available)."""
+        with self._lock:
+            tokens, updated_at, _ = self._buckets.get(key, (capacity, now, now))
+            tokens = min(capacity, tokens + (now - updated_at) * refill)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now, now + (capacity - tokens) / refill)
+            if len(self._buckets) > self.max_keys:
+                self._prune(now)
+        return allowed, 0.0 if allowed else (1 - tokens) / refill
+
+    def _prune(self, now: float) -> None:
+        # A bucket that has refilled completely is the same as no bucket at all
+        for key in [k for k, (_, _, full_at) in self._buckets.items() if full_at <= now]:
+            del self._buckets[key]
+
+
+class SQLiteBackend:
+    """Buckets in a SQLite file shared by every worker process of a service."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        # Closed again right away: the limiter is built at import, maybe in a process that forks later
+        self._next_prune = 0.0
+        with closing(self._connect()) as con:
+            con.execute(
+                "CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL,"
+                " full_at REAL NOT NULL DEFAULT 0)"
+            )
+            if "full_at" not in {row[1] for row in con.execute("PRAGMA table_info(buckets)")}:
+                # A file written before buckets were pruned
+                con.execute("ALTER TABLE buckets ADD COLUMN full_at REAL NOT NULL DEFAULT 0")
+            con.execute("CREATE INDEX IF NOT EXISTS buckets_full_at ON buckets (full_at)")
+
+    def _connect(self) -> sqlite3.Connection:
+        con = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        con.execute("PRAGMA journal_mode=WAL")
+        con.execute("PRAGMA synchronous=OFF")  # losing a few tokens on a crash is fine
+        return con
+
+    def _conn(self) -> sqlite3.Connection:
+        con = getattr(self._local, "con", None)
+        if con is None or self._local.pid != os.getpid():
+            # New thread, or a worker forked from a process that had one
+            con = self._connect()
+            self._local.con, self._local.pid = con, os.getpid()
+        return con
+
+    def take(self, key: str, capacity: int, refill: float, now: float):
+        con = self._conn()
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            row = con.execute("SELECT tokens, updated_at FROM buckets WHERE key = ?", (key,)).fetchone()
+            tokens, updated_at = row if row else (capacity, now)
+            tokens = min(capacity, tokens + (now - updated_at) * refill)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            con.execute(
+                "INSERT OR REPLACE INTO buckets (key, tokens, updated_at, full_at) VALUES (?, ?, ?, ?)",
+                (key, tokens, now, now + (capacity - tokens) / refill),
+            )
+            if now >= self._next_prune:
+                # As in MemoryBackend: a bucket that has refilled is the same as none
+                self._next_prune = now + PRUNE_INTERVAL
+                con.execute("DELETE FROM buckets WHERE full_at <= ?", (now,))
+            con.execute("COMMIT")
+        except BaseException:
+            con.execute("ROLLBACK")
+            raise
+        return allowed, 0.0 if allowed else (1 - tokens) / refill
+
+
+def make_backend(storage: str):
+    if storage.startswith("sqlite:///"):
+        return SQLiteBackend(storage[len("sqlite:///"):])
+    return MemoryBackend()
+
+
+def client_ip() -> str:
+    return request.remote_addr or "unknown"
+
+
+def _mac(message: str) -> str:
+    key = RATE_LIMIT_SECRET or current_app.secret_key or _PROCESS_SECRET
+    key = key if isinstance(key, bytes) else key.encode()
+    return hmac.new(key, message.encode(), hashlib.sha256).hexdigest()
+
+
+def client_cookie_name() -> str:
+    return "ctf_client_" + _mac("cookie")[:8]
+
+
+def client_session():
+    """The random id in this app's signed client cookie, or None if missing or forged."""
+    value = request.cookies.get(client_cookie_name())
+    if not value or "." not in value:
+        return None
+    client, signature = value.rsplit(".", 1)
+    return client if hmac.compare_digest(signature, _mac("client|" + client)[:32]) else None
+
+
+def client_key():
+    """
+    The signed portal player cookie when present (see dynflag), else the
+    signed client cookie, else None (the anonymous bucket of the remote IP).
+    A classroom behind one NAT address then still gets a bucket per team or
+    browser, within the address's shared bucket.
+    """
+    player = dynflag.read_player(request.cookies.get(dynflag.PLAYER_COOKIE))
+    if player is not None:
+        return f"player:{player}"
+    client = client_session()
+    return f"client:{client}" if client is not None else None
+
+
+class RateLimiter:
+    def __init__(self, app=None, backend=None, enabled: bool = RATE_LIMIT_ENABLED, ip_factor: float = RATE_LIMIT_IP_FACTOR):
+        self.backend = backend or make_backend(RATE_LIMIT_STORAGE)
+        self.enabled = enabled
+        self.ip_factor = ip_factor
+        self.rates = {}  # route name -> (capacity, refill) or None
+        self.rate_specs = {}  # route name -> configured "N/S" string
+        self.counters = {}  # route name -> [allowed, limited]
+        self._counter_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app) -> None:
+        app.add_url_rule("/ratelimit", "ratelimit_stats", self.stats_view)
+        app.after_request(self.set_client_cookie)
+
+    def set_client_cookie(self, resp):
+        """Give a client without a valid client cookie one, for its next requests."""
+        if self.enabled and client_session() is None:
+            client = secrets.token_urlsafe(12)
+            value = f"{client}.{_mac('client|' + client)[:32]}"
+            resp.set_cookie(client_cookie_name(), value, httponly=True, samesite="Lax")
+        return resp
+
+    def limit(self, name: str, default: str, key=client_key, methods=None, message: str = "Too many requests, slow down"):
+        """
+        Limit a view. `key` maps the current request to a client id, or None when
+        the request carries no trustworthy identity (default: the signed player
+        or client cookie). Pass e.g. a signed-session lookup for per-session
+        buckets, but never one that makes up a new id for a request without a
+        cookie: that request costs the address's anonymous bucket, and gets its
+        client cookie with the response. Routes sharing a name share buckets
+        and counters.
+        """
+        env_name = "RATE_LIMIT_" + name.upper().replace("-", "_")
+        self.rate_specs[name] = os.getenv(env_name, default)
+        self.rates[name] = parse_rate(self.rate_specs[name])
+        self.counters.setdefault(name, [0, 0])
+
+        def decorator(view):
+            @functools.wraps(view)
+            def wrapper(*args, **kwargs):
+                rate = self.rates[name]
+                if not self.enabled or rate is None or (methods and request.method not in methods):
+                    return view(*args, **kwargs)
+                capacity, refill = rate
+                now = time.time()
+                ip = client_ip()
+                # The address's shared bucket first: a rejection there costs the client nothing
+                allowed, retry_after = self.backend.take(
+                    f"{name}:ip:{ip}", max(capacity, int(capacity * self.ip_factor)), refill * self.ip_factor, now,
+                )
+                if allowed:
+                    allowed, retry_after = self.backend.take(f"{name}:{key() or 'anon:' + ip}", capacity, refill, now)
+                self._count(name, allowed)
+                if allowed:
+                    return view(*args, **kwargs)
+                retry = max(1, math.ceil(retry_after))
+                resp = jsonify({"error": message, "retry_after": retry})
+                resp.status_code = 429
+                resp.headers["Retry-After"] = str(retry)
+                return resp
+            return wrapper
+        return decorator
+
+    def _count(self, name: str, allowed: bool) -> None:
+        with self._counter_lock:
+            self.counters[name][0 if allowed else 1] += 1
+
+    def stats(self) -> dict:
+        with self._counter_lock:
+            return {
+                name: {"allowed": allowed, "limited": limited, "rate": self.rate_specs[name]}
+                for name, (allowed, limited) in self.counters.items()
+            }
+
+    def stats_view(self):
+        return jsonify({"enabled": self.enabled, "backend": type(self.backend).__name__, "routes": self.stats()})
@@ -0,0 +1,66 @@
+"""
+One-time setup that runs before the workers fork, without importing the app.
+
+An app directory may hold a startup.py with a run() function that writes the
+flag file or seeds a database. startup.py must not import app.py. That lets
+the gunicorn master (ctfcommon/gunicorn_conf.py) run it without loading
+Flask or opening connections that the forked workers would then share. With
+GUNICORN_PRELOAD=0 the app really is imported only in the workers.
+
+    startup.run(Path("xxe-injection"))                            # <dir>/startup.py run(), if any
+    startup.run(Path("login-sqli"), env={"FLAG": "CTF{other}"})   # with a temporary environment
+
+The files are loaded by path under a name per directory, because every app
+has a startup.py and allinone.py puts all the app directories on sys.path.
+"""
+import importlib.util
+import os
+import sys
+from pathlib import Path
+
+
+def flag_env_name(app_dir: str) -> str:
+    """Per-app FLAG override in allinone mode, e.g. FLAG_LOGIN_SQLI; the apps all read plain FLAG."""
+    return "FLAG_" + Path(app_dir).name.upper().replace("-", "_")
+
+
+def app_env(app_dir: str) -> dict:
+    """{"FLAG": $FLAG_<APP>} when that override is set, else nothing."""
+    value = os.getenv(flag_env_name(app_dir))
+    return {"FLAG": value} if value else {}
+
+
+def module_name(app_dir: Path) -> str:
+    return "ctf_startup_" + Path(app_dir).resolve().name.replace("-", "_")
+
+
+def load(app_dir):
+    """
+    <app_dir>/startup.py as a freshly executed module (so it reads the current
+    environment), or None if the app has no startup work.
+    """
+    path = Path(app_dir).resolve() / "startup.py"
+    name = module_name(path.parent)
+    if not path.exists():
+        return None
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def run(app_dir, env: dict = None) -> None:
+    module = load(app_dir)
+    if module is None:
+        return
+    saved = {name: os.environ.get(name) for name in env or {}}
+    os.environ.update(env or {})
+    try:
+        module.run()
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
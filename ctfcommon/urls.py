@@ -0,0 +1,88 @@
+"""
+Reverse-proxy handling and links between the portal and the challenges.
+
+    urls.init_app(app)          # once, next to app = Flask(__name__)
+    urls.portal_url()           # in a view; templates get {{ portal_url }}
+    urls.site_urls()["jwt-weak"]
+
+init_app wraps the app in werkzeug's ProxyFix, so X-Forwarded-Proto/-Host/
+-Prefix are applied once per request and request.scheme, request.host and
+url_for() are right behind nginx or the instance manager. X-Forwarded-For
+is only trusted with TRUSTED_PROXIES=1 (the number of proxies in front),
+because a client talking to a container port directly could otherwise pick
+its own IP for the rate limiter.
+
+Two layouts are supported (CTF_URL_LAYOUT):
+
+- ports: docker-compose without a proxy; the portal on :8080, the
+  challenges on :8001-:8009 of the same host
+- paths: nginx-ctf.conf or allinone.py; the portal on /, the challenges
+  under /login-sqli/, /jwt-weak/, ...
+
+The default, auto, picks paths when a proxy forwarded the request and ports
+otherwise. The link map depends only on (layout, scheme, host) and is
+memoized in a small LRU cache; Host is client-controlled, so it is bounded.
+"""
+import functools
+import os
+
+from flask import request
+from werkzeug.middleware.proxy_fix import ProxyFix
+
+URL_LAYOUT = os.getenv("CTF_URL_LAYOUT", "auto")
+TRUSTED_PROXIES = int(os.getenv("TRUSTED_PROXIES", "0"))
+
+PORTAL_PORT = int(os.getenv("PORTAL_PORT", "8080"))
+# challenge id -> host port in docker-compose.yml; the path prefix is /<id>/
+CHALLENGE_PORTS = {
+    "login-sqli": 8001,
+    "jwt-weak": 8002,
+    "static-secrets": 8003,
+    "command-injection": 8004,
+    "ssrf-internal": 8005,
+    "xxe-injection": 8006,
+    "container-breakout": 8007,
+    "hard-deserialization": 8008,
+    "hard-jwt-confusion": 8009,
+}
+
+
+def init_app(app) -> None:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXIES, x_proto=1, x_host=1, x_prefix=1)
+    app.context_processor(lambda: {"portal_url": portal_url()})
+
+
+def hostname(host: str) -> str:
+    """Host header without the port ("[::1]:8001" -> "[::1]")."""
+    if host.startswith("["):
+        return host.partition("]")[0] + "]"
+    return host.partition(":")[0]
+
+
+def layout() -> str:
+    if URL_LAYOUT != "auto":
+        return URL_LAYOUT
+    environ = request.environ
+    proxied = "HTTP_X_FORWARDED_PROTO" in environ or "HTTP_X_FORWARDED_HOST" in environ
+    return "paths" if proxied else "ports"
+
+
+@functools.lru_cache(maxsize=256)
+def _site_urls(url_layout: str, scheme: str, host: str) -> dict:
+    if url_layout == "paths":
+        urls = {challenge: f"/{challenge}/" for challenge in CHALLENGE_PORTS}
+        urls["portal"] = "/"
+    else:
+        base = f"{scheme}://{hostname(host)}"
+        urls = {challenge: f"{base}:{port}" for challenge, port in CHALLENGE_PORTS.items()}
+        urls["portal"] = f"{base}:{PORTAL_PORT}/"
+    return urls
+
+
+def site_urls() -> dict:
+    """challenge id (and "portal") -> URL, for the current request. Do not modify."""
+    return _site_urls(layout(), request.scheme, request.host)
+
+
+def portal_url() -> str:
+    return site_urls()["portal"]
@@ -7,8 +7,19 @@ from flask import Flask, request, jsonify
 import pickle
 import base64
 import os
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))  # shared ctfcommon/ package in a repo checkout
+
+from ctfcommon.ratelimit import RateLimiter
+from ctfcommon import startup, urls
+from ctfcommon.metrics import Metrics
 
 app = Flask(__name__)
+urls.init_app(app)
+limiter = RateLimiter(app)
+metrics = Metrics(app)
 
 FLAG = os.getenv("FLAG", "CTF{pickle_rce_pwn}")
 
@@ -52,7 +63,7 @@ def index():
         
         <div class="card">
             <h2>Serialize User Profile</h2>
-            <form method="post" action="/serialize">
+            <form method="post" action="serialize">
                 <label>Username:</label>
                 <input type="text" name="username" placeholder="john_doe" required>
                 
@@ -66,7 +77,7 @@ def index():
         <div class="card">
             <h2>Deserialize User Profile</h2>
             <p class="hint">⚠️ Paste a base64-encoded serialized object to deserialize:</p>
-            <form method="post" action="/deserialize">
+            <form method="post" action="deserialize">
                 <label>Base64 Serialized Data:</label>
                 <textarea name="data" placeholder="gANdcQAoWAQAAAB1c2VyIHE..." required></textarea>
                 
@@ -117,6 +128,7 @@ def serialize():
 
 
 @app.route("/deserialize", methods=["POST"])
+@limiter.limit("deserialize", "30/60")
 def deserialize():
     """
     VULNERABLE: Deserializes untrusted pickle data
@@ -158,7 +170,5 @@ def healthz():
 
 
 if __name__ == "__main__":
-    # Write flag to file
-    with open("/flag.txt", "w") as f:
-        f.write(FLAG)
-    app.run(host="0.0.0.0", port=5000, debug=False)
+    startup.run(Path(__file__).resolve().parent)  # startup.py, as the gunicorn master does
+    app.run(host="0.0.0.0", port=int(os.getenv("PORT", "5000")), debug=False)
@@ -0,0 +1,12 @@
+"""
+One-time setup for hard-deserialization: run once by the gunicorn master before it
+forks (ctfcommon/startup.py), or by app.py when started directly.
+Keep app.py out of here.
+"""
+import os
+
+
+def run():
+    # Write flag to /flag.txt for the challenge (FLAG_FILE: elsewhere, e.g. loadtest.py --spawn)
+    with open(os.getenv("FLAG_FILE", "/flag.txt"), "w") as f:
+        f.write(os.getenv("FLAG", "CTF{pickle_rce_pwn}"))
@@ -4,18 +4,68 @@ Vulnerability: Algorithm confusion / key confusion attack on JWT tokens
 Objective: Forge a JWT token by exploiting algorithm confusion (HS256 vs RS256)
 """
 from flask import Flask, request, jsonify
+import binascii
+import hashlib
+import hmac
+import json
 import jwt
 import os
+import sys
 from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))  # shared ctfcommon/ package in a repo checkout
+
+from ctfcommon import batch, dynflag, startup, urls
+from ctfcommon.jwtcache import VerifiedTokenCache
+from ctfcommon.metrics import Metrics
+from keys import load_or_create
 
 app = Flask(__name__)
+urls.init_app(app)
+metrics = Metrics(app)
 
-# The public key (which is also the HS256 secret - this is the vulnerability)
-PUBLIC_KEY = os.getenv("PUBLIC_KEY", "very-secret-symmetric-key-9999")
 FLAG = os.getenv("FLAG", "CTF{algorithm_confusion_wins}")
 
-# JWT secret that should be used
-JWT_SECRET = PUBLIC_KEY
+# Real RS256 keypair, generated on first boot and reused from JWT_KEY_DIR after that (keys.py)
+JWT_KEY_DIR = os.getenv("JWT_KEY_DIR", str(Path(__file__).parent / "keys"))
+KEYS = load_or_create(JWT_KEY_DIR)
+
+# The public key (which is also accepted as HS256 secret - this is the vulnerability)
+PUBLIC_KEY = KEYS.public_pem
+
+JWKS_MAX_AGE = 3600
+JWKS_BODY = json.dumps({"keys": [KEYS.jwk]})
+
+
+def decode_jwt(token: str) -> dict:
+    """
+    VULNERABLE: Accepts both HS256 and RS256, and verifies HS256 with the
+    public key PEM as HMAC secret. Anyone can download that key and sign.
+    In production, should ONLY accept one algorithm.
+    """
+    alg = jwt.get_unverified_header(token).get("alg")
+    if alg == "RS256":
+        return jwt.decode(token, KEYS.public_key, algorithms=["RS256"])
+    if alg != "HS256":
+        raise jwt.InvalidAlgorithmError("The specified alg value is not allowed")
+
+    # PyJWT refuses a PEM as HMAC key, so check the signature by hand
+    signing_input, _, signature = token.rpartition(".")
+    try:
+        signature = jwt.utils.base64url_decode(signature)
+    except (binascii.Error, ValueError):
+        raise jwt.DecodeError("Invalid crypto padding") from None
+    expected = hmac.new(PUBLIC_KEY.encode(), signing_input.encode(), hashlib.sha256).digest()
+    if not hmac.compare_digest(signature, expected):
+        raise jwt.InvalidSignatureError("Signature verification failed")
+    return jwt.decode(token, options={
+        "verify_signature": False, "verify_exp": True, "verify_nbf": True, "verify_iat": True,
+    })
+
+
+# Verified tokens are cached until their exp (ctfcommon/jwtcache.py)
+decode_token = VerifiedTokenCache(decode_jwt)
 
 
 @app.get("/")
@@ -51,7 +101,7 @@ def index():
         <div class="card">
             <h2>1. Generate JWT Token</h2>
             <p class="hint">Generate a regular user token:</p>
-            <form method="post" action="/token">
+            <form method="post" action="token">
                 <label>Username:</label>
                 <input type="text" name="username" placeholder="john_doe" required>
                 
@@ -68,7 +118,7 @@ def index():
         <div class="card">
             <h2>2. Verify JWT Token</h2>
             <p class="hint">Paste a JWT token to verify it and access admin functionality:</p>
-            <form method="post" action="/verify">
+            <form method="post" action="verify">
                 <label>JWT Token:</label>
                 <textarea name="token" placeholder="eyJhbGciOiJIUzI1NiIsInR5cCI6IkpXVCJ9..." required></textarea>
                 
@@ -81,7 +131,7 @@ def index():
             <p class="hint">
                 ⚠️ <strong>Vulnerability:</strong> Service accepts both HS256 and RS256 algorithms<br>
                 🎯 <strong>Goal:</strong> Forge a token with role=admin using HS256 and public key as secret<br>
-                💡 <strong>Hint:</strong> The public key is exposed at /public-key
+                💡 <strong>Hint:</strong> The public key is exposed at /public-key (and /.well-known/jwks.json)
             </p>
         </div>
     </body>
@@ -90,15 +140,11 @@ def index():
     return html
 
 
-@app.route("/token", methods=["POST"])
-def generate_token():
+def issue_token(username: str, role: str) -> dict:
     """
     Generate a JWT token with user role
-    Uses HS256 algorithm
+    Uses RS256, signed with the private key (parsed once, keys.py)
     """
-    username = request.form.get("username", "guest")
-    role = request.form.get("role", "user")
-
     payload = {
         "sub": username,
         "role": role,
@@ -106,10 +152,10 @@ def generate_token():
         "exp": datetime.utcnow() + timedelta(hours=24)
     }
 
-    # Sign with HS256
-    token = jwt.encode(payload, JWT_SECRET, algorithm="HS256")
+    # Sign with RS256
+    token = jwt.encode(payload, KEYS.private_key, algorithm="RS256", headers={"kid": KEYS.kid})
 
-    return jsonify({
+    return {
         "status": "success",
         "token": token,
         "payload": {
@@ -117,50 +163,78 @@ def generate_token():
             "role": role,
             "message": "Use this token to access admin endpoints"
         }
-    })
+    }
 
 
-@app.route("/verify", methods=["POST"])
-def verify_token():
+@app.route("/token", methods=["POST"])
+def generate_token():
+    username = request.form.get("username", "guest")
+    role = request.form.get("role", "user")
+    return jsonify(issue_token(username, role))
+
+
+@app.post("/token/batch")
+def generate_token_batch():
+    """{"users": [{"username": ..., "role": ...}, ...]} -> one /token answer per user"""
+    def issue(user):
+        if not isinstance(user, dict):
+            return {"error": "Each user must be an object"}, 400
+        username, role = user.get("username", "guest"), user.get("role", "user")
+        if not isinstance(username, str) or not isinstance(role, str):
+            return {"error": "username and role must be strings"}, 400
+        return issue_token(username, role), 200
+    return batch.respond("users", issue)
+
+
+def verify_result(token: str):
     """
     VULNERABLE: Verifies JWT token but accepts both HS256 and RS256
     This allows algorithm confusion attack
     """
-    token = request.form.get("token", "").strip()
-
     if not token:
-        return jsonify({"error": "Missing token"}), 400
+        return {"error": "Missing token"}, 400
 
     try:
-        # VULNERABLE: Try to decode with both algorithms
-        # In production, should ONLY accept one algorithm
-        data = jwt.decode(token, JWT_SECRET, algorithms=["HS256", "RS256"])
+        data = decode_token(token)
 
         # Check role
         role = data.get("role", "user")
 
         if role == "admin":
-            return jsonify({
+            return {
                 "status": "verified",
                 "username": data.get("sub"),
                 "role": role,
-                "flag": FLAG,
+                "flag": dynflag.flag_for(request, FLAG, "hard-jwt-confusion"),
                 "message": "Welcome admin! Here's your flag."
-            })
+            }, 200
         else:
-            return jsonify({
+            return {
                 "status": "verified",
                 "username": data.get("sub"),
                 "role": role,
                 "message": "You need admin role to access the flag"
-            })
+            }, 200
 
     except jwt.ExpiredSignatureError:
-        return jsonify({"error": "Token expired"}), 401
+        return {"error": "Token expired"}, 401
     except jwt.InvalidSignatureError:
-        return jsonify({"error": "Invalid token signature"}), 401
+        return {"error": "Invalid token signature"}, 401
     except Exception as e:
-        return jsonify({"error": str(e)}), 401
+        return {"error": str(e)}, 401
+
+
+@app.route("/verify", methods=["POST"])
+def verify_token():
+    token = request.form.get("token", "").strip()
+    body, status = verify_result(token)
+    return jsonify(body), status
+
+
+@app.post("/verify/batch")
+def verify_token_batch():
+    """{"tokens": [...]} -> one /verify answer per token"""
+    return batch.respond("tokens", lambda token: verify_result(token.strip() if isinstance(token, str) else ""))
 
 
 @app.get("/public-key")
@@ -172,16 +246,25 @@ def public_key_endpoint():
     return jsonify({
         "public_key": PUBLIC_KEY,
         "algorithm": "RS256",
+        "kid": KEYS.kid,
         "message": "This key is used to verify JWT tokens"
     })
 
 
+@app.get("/.well-known/jwks.json")
+def jwks():
+    """The same public key as a JWK Set; it only changes when JWT_KEY_DIR is wiped"""
+    resp = app.response_class(JWKS_BODY, mimetype="application/json")
+    resp.headers["Cache-Control"] = f"public, max-age={JWKS_MAX_AGE}"
+    resp.set_etag(KEYS.kid)
+    return resp.make_conditional(request)
+
+
 @app.get("/healthz")
 def healthz():
     return {"status": "ok"}
 
 
 if __name__ == "__main__":
-    with open("/flag.txt", "w") as f:
-        f.write(FLAG)
-    app.run(host="0.0.0.0", port=5000, debug=False)
+    startup.run(Path(__file__).resolve().parent)  # startup.py, as the gunicorn master does
+    app.run(host="0.0.0.0", port=int(os.getenv("PORT", "5000")), debug=False)
@@ -0,0 +1,68 @@
+"""
+The service's RSA signing key, generated once and kept on disk.
+
+Generating a 2048-bit key takes tens to hundreds of milliseconds, and every
+worker needs the same key to check the others' tokens. The first process to
+start generates it under an exclusive file lock and writes private.pem; the
+others (and later restarts) wait for the lock and load that file.
+"""
+import base64
+import fcntl
+import hashlib
+import json
+import os
+from pathlib import Path
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+KEY_SIZE = 2048
+
+
+class KeyPair:
+    def __init__(self, private_key):
+        self.private_key = private_key
+        self.public_key = private_key.public_key()
+        self.public_pem = self.public_key.public_bytes(
+            serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo,
+        ).decode()
+        self.jwk = self._jwk()
+        self.kid = self.jwk["kid"]
+
+    def _jwk(self) -> dict:
+        numbers = self.public_key.public_numbers()
+
+        def b64(value: int) -> str:
+            raw = value.to_bytes((value.bit_length() + 7) // 8, "big")
+            return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+        key = {"e": b64(numbers.e), "kty": "RSA", "n": b64(numbers.n)}
+        # RFC 7638 thumbprint: SHA-256 of the required members, sorted, no whitespace
+        thumbprint = hashlib.sha256(json.dumps(key, sort_keys=True, separators=(",", ":")).encode()).digest()
+        kid = base64.urlsafe_b64encode(thumbprint).rstrip(b"=").decode()
+        return {**key, "alg": "RS256", "use": "sig", "kid": kid}
+
+
+def load_or_create(key_dir) -> KeyPair:
+    """Load key_dir/private.pem, generating it first if no process has yet."""
+    key_dir = Path(key_dir)
+    key_dir.mkdir(parents=True, exist_ok=True)
+    path = key_dir / "private.pem"
+    with open(key_dir / ".lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        if not path.exists():
+            private_key = rsa.generate_private_key(public_exponent=65537, key_size=KEY_SIZE)
+            pem = private_key.private_bytes(
+                serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption(),
+            )
+            tmp = path.with_suffix(".tmp")
+            fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "wb") as f:
+                f.write(pem)
+            os.replace(tmp, path)  # never a half-written key, even if we die here
+            return KeyPair(private_key)
+    # Our own key, checked when it was generated: skip the RSA validation, which
+    # costs as much as generating it
+    return KeyPair(serialization.load_pem_private_key(
+        path.read_bytes(), password=None, unsafe_skip_rsa_key_validation=True,
+    ))
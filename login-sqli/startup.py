@@ -0,0 +1,28 @@
+"""
+One-time setup for login-sqli: the users database. Run once by the gunicorn
+master before it forks (ctfcommon/startup.py), and again (idempotently) when
+app.py is imported. Keep app.py out of here.
+"""
+import os
+import sqlite3
+from pathlib import Path
+
+DB_PATH = Path(os.getenv("DB_PATH", str(Path(__file__).parent / "users.db")))
+
+
+def init_db():
+    # Idempotent, so concurrently starting workers cannot trip over each other
+    con = sqlite3.connect(DB_PATH, timeout=10)
+    cur = con.cursor()
+    # Persistent in the file: readers never block on each other or on a writer
+    cur.execute("PRAGMA journal_mode=WAL")
+    cur.execute("CREATE TABLE IF NOT EXISTS users (username TEXT PRIMARY KEY, password TEXT)")
+    # Intentionally weak: plaintext passwords, for CTF demo only
+    cur.execute("INSERT OR IGNORE INTO users (username, password) VALUES ('admin', 'admin123')")
+    cur.execute("INSERT OR IGNORE INTO users (username, password) VALUES ('guest', 'guest')")
+    con.commit()
+    con.close()
+
+
+def run():
+    init_db()
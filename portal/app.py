@@ -1,10 +1,33 @@
-from flask import Flask, render_template, request, session, flash, redirect, url_for
+from flask import Flask, render_template, request, session, flash, redirect, url_for, jsonify, Response
+import hashlib
+import hmac
 import os
-from urllib.parse import urlparse
+import queue
+import secrets
+import sys
+import threading
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))  # shared ctfcommon/ package in a repo checkout
+
+from ctfcommon import dynflag, urls
+from ctfcommon.health import HealthPoller, parse_targets
+from ctfcommon.ratelimit import RateLimiter, client_key
+from ctfcommon.metrics import Metrics
+from events import EventBroker, SolveFeed, format_sse
+from pagecache import PageCache
+from store import SolveStore
 
 app = Flask(__name__)
+urls.init_app(app)
 
 app.secret_key = os.getenv("SECRET_KEY", "dev-secret-key-change-me")
+limiter = RateLimiter(app)
+metrics = Metrics(app)
+FLAG_SUBMISSIONS = metrics.counter(
+    "ctf_flag_submissions_total", "Flag submissions by challenge and result.", ("challenge", "result"),
+)
+TOO_MANY_SUBMISSIONS = "Te veel pogingen, wacht even voor je opnieuw probeert"
 
 LOGIN_URL = os.getenv("LOGIN_URL")
 JWT_URL = os.getenv("JWT_URL")
@@ -44,52 +67,313 @@ CHALLENGES = [
     {"id": "hard-jwt-confusion", "name": "JWT Algorithm Confusion", "flag": EXPECTED_JWT_CONFUSION_FLAG, "level": "hard"},
 ]
 
+# Challenges whose apps hand out a per-player flag when EVENT_KEY is set. The others
+# reveal /flag.txt or a host file, which cannot differ per player, and stay static.
+DYNAMIC_FLAG_CHALLENGES = set(os.getenv(
+    "DYNAMIC_FLAG_CHALLENGES", "login-sqli,jwt-weak,static-secrets,ssrf-internal,hard-jwt-confusion"
+).split(","))
+
+# Bit per challenge for the solved-set key of the home page cache
+CHALLENGE_BITS = {c["id"]: 1 << i for i, c in enumerate(CHALLENGES)}
+PAGE_CACHE = PageCache(int(os.getenv("PAGE_CACHE_SIZE", "256")))
+
+LEVEL_POINTS = {"beginner": 100, "medium": 200, "hard": 300}
+POINTS = {c["id"]: LEVEL_POINTS[c["level"]] for c in CHALLENGES}
+
+DB_PATH = os.getenv("PORTAL_DB", str(Path(__file__).parent / "data" / "portal.db"))
+STORE = SolveStore(DB_PATH, POINTS)
+
+# Live solve feed (/events)
+EVENTS_QUEUE_SIZE = int(os.getenv("EVENTS_QUEUE_SIZE", "64"))
+EVENTS_MAX_CLIENTS = int(os.getenv("EVENTS_MAX_CLIENTS", "500"))
+EVENTS_POLL_INTERVAL = float(os.getenv("EVENTS_POLL_INTERVAL", "1.0"))
+EVENTS_HEARTBEAT = float(os.getenv("EVENTS_HEARTBEAT", "15"))
+BROKER = EventBroker(max_queue=EVENTS_QUEUE_SIZE, max_clients=EVENTS_MAX_CLIENTS)
+_feed = None
+_feed_lock = threading.Lock()
+
+# Service health (/api/status): probed in the background, never during a request.
+# Defaults are the docker-compose service names; HEALTH_POLL_INTERVAL=0 turns it off.
+HEALTH_TARGETS = parse_targets(os.getenv("HEALTH_TARGETS", ",".join(
+    [f"portal=http://127.0.0.1:{os.getenv('PORT', '5000')}/healthz"]
+    + [f"{challenge}=http://{challenge}:5000/healthz" for challenge in urls.CHALLENGE_PORTS]
+    + ["brute-ssh=tcp://brute-ssh:22"]
+)))
+HEALTH_POLL_INTERVAL = float(os.getenv("HEALTH_POLL_INTERVAL", "15"))
+HEALTH_TIMEOUT = float(os.getenv("HEALTH_TIMEOUT", "3"))
+_health = None
+_health_lock = threading.Lock()
+
+# Maximum number of flags accepted in one POST /api/submit call
+MAX_BATCH_FLAGS = int(os.getenv("MAX_BATCH_FLAGS", "50"))
+
+# Per-process key for the flag index. Keying the digest means the dict lookup
+# (and its timing) says nothing about how close a guess is to a real flag.
+_INDEX_KEY = secrets.token_bytes(32)
+
+
+def _flag_digest(flag: str) -> bytes:
+    return hmac.new(_INDEX_KEY, flag.encode(), hashlib.sha256).digest()
+
+
+# digest(flag) -> challenge, built once at startup
+FLAG_INDEX = {_flag_digest(c["flag"]): c for c in CHALLENGES}
+
+
+def _match_static(submitted: str):
+    matched = FLAG_INDEX.get(_flag_digest(submitted))
+    if matched is None or not hmac.compare_digest(matched["flag"].encode(), submitted.encode()):
+        return None
+    return matched
+
+
+def match_flag(submitted: str, player=None):
+    """
+    Return the challenge for a submitted flag, or None. O(1) in the number of challenges.
+    With dynamic flags on, per-player flags are checked by recomputing their HMAC tag.
+    """
+    matched = _match_static(submitted)
+    if not dynflag.ENABLED:
+        return matched
+    if matched is not None:
+        # A static flag of a per-player challenge was leaked or obtained without the player cookie
+        return None if matched["id"] in DYNAMIC_FLAG_CHALLENGES else matched
+
+    parts = dynflag.split_flag(submitted) if player else None
+    if parts is None:
+        return None
+    static_flag, tag = parts
+    matched = _match_static(static_flag)
+    if matched is None or matched["id"] not in DYNAMIC_FLAG_CHALLENGES:
+        return None
+    return matched if dynflag.verify_tag(tag, matched["id"], player) else None
+
+
+def claimed_challenge(submitted: str):
+    """The challenge a (wrong) flag looks like it is for, e.g. another team's per-player flag."""
+    matched = _match_static(submitted)
+    if matched is None and dynflag.ENABLED:
+        parts = dynflag.split_flag(submitted)
+        matched = _match_static(parts[0]) if parts else None
+    return matched
+
+
+def count_submission(submitted: str, matched) -> None:
+    if matched:
+        FLAG_SUBMISSIONS.inc(matched["id"], "correct")
+    else:
+        claimed = claimed_challenge(submitted)
+        FLAG_SUBMISSIONS.inc(claimed["id"] if claimed else "unknown", "incorrect")
+
+
+def current_player() -> str:
+    """Team/player name for this browser; anonymous players get a random one."""
+    player = session.get("player")
+    if not player:
+        player = f"speler-{secrets.token_hex(3)}"
+        session["player"] = player
+    return player
+
+
+def rate_limit_key():
+    """
+    The team in the signed session cookie, else the limiter's own client cookie,
+    without making one up: a request without either falls back to its IP's
+    anonymous bucket (see ctfcommon.ratelimit).
+    """
+    player = session.get("player")
+    return f"player:{player}" if player else client_key()
+
+
+def solved_mask(solved) -> int:
+    """Encode a set of solved challenge ids as a bitmask over CHALLENGES."""
+    mask = 0
+    for challenge_id in solved:
+        mask |= CHALLENGE_BITS.get(challenge_id, 0)
+    return mask
+
+
+def render_home(links: dict, host: str, solved) -> str:
+    """links: challenge id -> URL from ctfcommon.urls; *_URL settings take precedence."""
+    return render_template(
+        "home.html",
+        login_url=LOGIN_URL or links["login-sqli"],
+        jwt_url=JWT_URL or links["jwt-weak"],
+        static_url=STATIC_URL or links["static-secrets"],
+        cmd_injection_url=CMD_INJECTION_URL or links["command-injection"],
+        ssrf_url=SSRF_URL or links["ssrf-internal"],
+        xxe_url=XXE_URL or links["xxe-injection"],
+        breakout_url=BREAKOUT_URL or links["container-breakout"],
+        deserialization_url=DESERIALIZATION_URL or links["hard-deserialization"],
+        jwt_confusion_url=JWT_CONFUSION_URL or links["hard-jwt-confusion"],
+        ssh_info=host,  # SSH connection info
+        solved=solved,
+    )
+
+
+@app.after_request
+def set_player_cookie(resp):
+    """Tell the challenge apps who this player is, so they can derive per-player flags."""
+    player = session.get("player")
+    if dynflag.ENABLED and player:
+        value = dynflag.sign_player(player)
+        if request.cookies.get(dynflag.PLAYER_COOKIE) != value:
+            resp.set_cookie(dynflag.PLAYER_COOKIE, value, httponly=True, samesite="Lax")
+    return resp
+
 
 @app.route("/", methods=["GET", "POST"])
+@limiter.limit("portal-submit", "20/60", key=rate_limit_key, methods=("POST",), message=TOO_MANY_SUBMISSIONS)
 def index():
-    scheme = request.headers.get("X-Forwarded-Proto", request.scheme or "http")
-    parsed = urlparse(request.host_url)
-    host = parsed.hostname or request.host.split(":")[0]
-
-    login_url = LOGIN_URL or f"{scheme}://{host}:8001"
-    jwt_url = JWT_URL or f"{scheme}://{host}:8002"
-    static_url = STATIC_URL or f"{scheme}://{host}:8003"
-    cmd_injection_url = CMD_INJECTION_URL or f"{scheme}://{host}:8004"
-    ssrf_url = SSRF_URL or f"{scheme}://{host}:8005"
-    xxe_url = XXE_URL or f"{scheme}://{host}:8006"
-    breakout_url = BREAKOUT_URL or f"{scheme}://{host}:8007"
-    deserialization_url = DESERIALIZATION_URL or f"{scheme}://{host}:8008"
-    jwt_confusion_url = JWT_CONFUSION_URL or f"{scheme}://{host}:8009"
-    ssh_info = f"{host}"  # SSH connection info
-
-    solved = set(session.get("solved", []))
-
     if request.method == "POST":
+        team = (request.form.get("team") or "").strip()[:32]
+        if team:
+            session["player"] = team
         submitted = (request.form.get("flag") or "").strip()
         if submitted:
-            matched = next((c for c in CHALLENGES if submitted == c["flag"]), None)
+            matched = match_flag(submitted, current_player())
+            count_submission(submitted, matched)
             if matched:
-                solved.add(matched["id"])
-                session["solved"] = list(solved)
+                STORE.record_solve(current_player(), matched["id"])
                 flash(f"Proficiat! Je hebt '{matched['name']}' opgelost.", "ok")
+            elif dynflag.ENABLED and _match_static(submitted):
+                flash("Deze key hoort niet bij jouw team. Open de challenge opnieuw via dit portaal.", "fail")
             else:
                 flash("Helaas, deze key is niet correct. Probeer opnieuw.", "fail")
         return redirect(url_for("index"))
 
-    return render_template(
-        "home.html",
-        login_url=login_url,
-        jwt_url=jwt_url,
-        static_url=static_url,
-        cmd_injection_url=cmd_injection_url,
-        ssrf_url=ssrf_url,
-        xxe_url=xxe_url,
-        breakout_url=breakout_url,
-        deserialization_url=deserialization_url,
-        jwt_confusion_url=jwt_confusion_url,
-        ssh_info=ssh_info,
-        solved=solved,
-    )
+    links = urls.site_urls()
+    host = urls.hostname(request.host)
+    solved = STORE.solved_by(current_player())
+
+    if "_flashes" in session:
+        # Flash messages are one-shot; this page must not be cached or reused
+        return render_home(links, host, solved)
+
+    # The portal link stands for the layout and scheme the links were built for
+    key = (links["portal"], host, solved_mask(solved))
+    page = PAGE_CACHE.get(key)
+    if page is None:
+        page = PAGE_CACHE.put(key, render_home(links, host, solved).encode())
+
+    headers = {"Cache-Control": "private, no-cache"}
+    if page.etag in request.if_none_match:
+        resp = Response(status=304, headers=headers)
+    else:
+        resp = Response(page.body, mimetype="text/html", headers=headers)
+    resp.set_etag(page.etag)
+    return resp
+
+
+@app.post("/api/submit")
+@limiter.limit("portal-submit", "20/60", key=rate_limit_key, message=TOO_MANY_SUBMISSIONS)
+def api_submit():
+    """
+    Batch flag submission for graders and scripts.
+    Body: {"flags": ["CTF{...}", ...]} -> one verdict per flag, in order.
+    """
+    body = request.get_json(silent=True)
+    flags = body.get("flags") if isinstance(body, dict) else None
+    if not isinstance(flags, list) or not all(isinstance(f, str) for f in flags):
+        return jsonify({"error": "Verwacht JSON: {\"flags\": [\"CTF{...}\", ...]}"}), 400
+    if len(flags) > MAX_BATCH_FLAGS:
+        return jsonify({"error": f"Maximaal {MAX_BATCH_FLAGS} flags per aanvraag"}), 413
+
+    player = current_player()
+    results = []
+    for flag in flags:
+        submitted = flag.strip()
+        matched = match_flag(submitted, player) if submitted else None
+        if submitted:
+            count_submission(submitted, matched)
+        if matched:
+            STORE.record_solve(player, matched["id"])
+            results.append({"flag": flag, "correct": True, "challenge": matched["id"], "name": matched["name"]})
+        else:
+            results.append({"flag": flag, "correct": False})
+
+    return jsonify({
+        "player": player,
+        "results": results,
+        "correct": sum(1 for r in results if r["correct"]),
+        "solved": sorted(STORE.solved_by(player)),
+    })
+
+
+@app.get("/scoreboard")
+def scoreboard():
+    return render_template("scoreboard.html", board=STORE.leaderboard(), player=current_player())
+
+
+@app.get("/api/scoreboard")
+def api_scoreboard():
+    limit = min(request.args.get("limit", 500, type=int), 500)
+    return jsonify({"leaderboard": STORE.leaderboard(limit)})
+
+
+def ensure_solve_feed() -> SolveFeed:
+    """Start the solve feed on first use, in the serving process (never before a fork)."""
+    global _feed
+    with _feed_lock:
+        if _feed is None:
+            _feed = SolveFeed(STORE, BROKER, {c["id"]: c["name"] for c in CHALLENGES}, EVENTS_POLL_INTERVAL)
+            _feed.start()
+    return _feed
+
+
+@app.get("/events")
+def events():
+    """
+    Server-Sent Events stream of solves.
+    Served by gevent workers (portal/Dockerfile), so idle clients cost a greenlet, not a thread.
+    """
+    feed = ensure_solve_feed()
+    sub = BROKER.subscribe()
+    if sub is None:
+        return jsonify({"error": "Te veel live verbindingen, probeer later opnieuw"}), 503
+    last_id = request.headers.get("Last-Event-ID", type=int)
+
+    def stream():
+        try:
+            yield "retry: 3000\n\n"
+            if last_id is not None:
+                # Replay what a reconnecting client missed; it ignores ids it has already seen
+                for solve in STORE.solves_since(last_id):
+                    yield format_sse("solve", feed.event_data(solve), solve["id"])
+            while not sub.closed:
+                try:
+                    yield sub.queue.get(timeout=EVENTS_HEARTBEAT)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+        finally:
+            BROKER.unsubscribe(sub)
+
+    return Response(stream(), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",  # nginx: do not buffer the stream
+    })
+
+
+def ensure_health_poller():
+    """Start the health poller on first use, in the serving process (never before a fork)."""
+    global _health
+    if HEALTH_POLL_INTERVAL <= 0:
+        return None
+    with _health_lock:
+        if _health is None:
+            _health = HealthPoller(HEALTH_TARGETS, HEALTH_POLL_INTERVAL, HEALTH_TIMEOUT)
+            _health.start()
+    return _health
+
+
+@app.get("/api/status")
+def api_status():
+    """Last known health of every service; "up" is null until the first probe round finished."""
+    poller = ensure_health_poller()
+    services = poller.snapshot() if poller is not None else {}
+    resp = jsonify({"enabled": poller is not None, "interval": HEALTH_POLL_INTERVAL, "services": services})
+    resp.headers["Cache-Control"] = "no-cache"
+    return resp
 
 
 @app.get("/healthz")
@@ -103,4 +387,4 @@ def solutions():
 
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000, debug=False)
+    app.run(host="0.0.0.0", port=int(os.getenv("PORT", "5000")), debug=False)
@@ -0,0 +1,101 @@
+"""
+In-process pub/sub for the portal's Server-Sent Events stream.
+
+Every connected /events client gets its own bounded queue. A published event
+is encoded once and handed to each queue without blocking; a client whose
+queue is full is too slow to keep up and is evicted (its browser reconnects
+and resumes from Last-Event-ID).
+
+Solves come from the SQLite store rather than from the request that recorded
+them, so every gunicorn worker streams every solve, no matter which worker
+handled the flag submission.
+"""
+import json
+import queue
+import threading
+import time
+
+
+def format_sse(event: str, data: dict, event_id=None) -> str:
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data, separators=(',', ':'))}")
+    return "\n".join(lines) + "\n\n"
+
+
+class Subscriber:
+    def __init__(self, maxsize: int):
+        self.queue = queue.Queue(maxsize)
+        self.closed = False
+
+
+class EventBroker:
+    def __init__(self, max_queue: int = 64, max_clients: int = 500):
+        self.max_queue = max_queue
+        self.max_clients = max_clients
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self.published = 0
+        self.evicted = 0
+
+    def subscribe(self):
+        """Register a new client, or return None when the broker is full."""
+        sub = Subscriber(self.max_queue)
+        with self._lock:
+            if len(self._subscribers) >= self.max_clients:
+                return None
+            self._subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscriber) -> None:
+        sub.closed = True
+        with self._lock:
+            self._subscribers.discard(sub)
+
+    def publish(self, event: str, data: dict, event_id=None) -> None:
+        message = format_sse(event, data, event_id)
+        with self._lock:
+            subscribers = list(self._subscribers)
+            self.published += 1
+        for sub in subscribers:
+            try:
+                sub.queue.put_nowait(message)
+            except queue.Full:
+                self.evicted += 1
+                self.unsubscribe(sub)
+
+    def client_count(self) -> int:
+        return len(self._subscribers)
+
+
+class SolveFeed(threading.Thread):
+    """Tails the solves table and publishes each new solve to the broker."""
+
+    def __init__(self, store, broker: EventBroker, names: dict, interval: float = 1.0):
+        super().__init__(name="solve-feed", daemon=True)
+        self.store = store
+        self.broker = broker
+        self.names = names  # challenge id -> display name
+        self.interval = interval
+        self.last_id = store.last_solve_id()
+
+    def poll_once(self) -> int:
+        solves = self.store.solves_since(self.last_id)
+        for solve in solves:
+            self.broker.publish("solve", self.event_data(solve), solve["id"])
+            self.last_id = solve["id"]
+        return len(solves)
+
+    def event_data(self, solve: dict) -> dict:
+        return {**solve, "name": self.names.get(solve["challenge"], solve["challenge"])}
+
+    def run(self) -> None:
+        while True:
+            try:
+                self.poll_once()
+            except Exception:
+                # A locked or briefly unavailable database must not kill the feed
+                pass
+            time.sleep(self.interval)
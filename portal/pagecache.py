@@ -0,0 +1,52 @@
+"""
+Bounded LRU cache of rendered portal pages.
+
+Entries hold the encoded body and a strong ETag (a digest of those bytes), so
+a hit serves either the cached bytes or a bare 304 without touching Jinja.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+class CachedPage:
+    __slots__ = ("body", "etag")
+
+    def __init__(self, body: bytes):
+        self.body = body
+        self.etag = hashlib.sha256(body).hexdigest()[:32]
+
+
+class PageCache:
+    def __init__(self, maxsize: int = 256):
+        self.maxsize = maxsize
+        self._pages = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            page = self._pages.get(key)
+            if page is None:
+                self.misses += 1
+                return None
+            self._pages.move_to_end(key)
+            self.hits += 1
+            return page
+
+    def put(self, key, body: bytes) -> CachedPage:
+        page = CachedPage(body)
+        with self._lock:
+            self._pages[key] = page
+            self._pages.move_to_end(key)
+            while len(self._pages) > self.maxsize:
+                self._pages.popitem(last=False)
+        return page
+
+    def clear(self) -> None:
+        with self._lock:
+            self._pages.clear()
+
+    def __len__(self) -> int:
+        return len(self._pages)
@@ -0,0 +1,121 @@
+"""
+Server-side solve store for the portal.
+
+SQLite in WAL mode so several gunicorn workers can write concurrently while
+readers never block. Every solve is recorded once per (player, challenge) and
+the leaderboard table is updated in the same transaction, so rendering the
+scoreboard is a single indexed read instead of a GROUP BY over all solves.
+"""
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from pathlib import Path
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS solves (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    player TEXT NOT NULL,
+    challenge TEXT NOT NULL,
+    points INTEGER NOT NULL,
+    solved_at REAL NOT NULL,
+    UNIQUE (player, challenge)
+);
+CREATE TABLE IF NOT EXISTS leaderboard (
+    player TEXT PRIMARY KEY,
+    score INTEGER NOT NULL,
+    solves INTEGER NOT NULL,
+    last_solve REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS leaderboard_rank ON leaderboard (score DESC, last_solve ASC);
+"""
+
+
+class SolveStore:
+    def __init__(self, path, points):
+        self.path = Path(path)
+        self.points = points  # challenge id -> points
+        self._local = threading.local()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # Closed again right away: this may run in a process that forks later
+        with closing(self._connect()) as con:
+            con.executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        con = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        con.execute("PRAGMA journal_mode=WAL")
+        con.execute("PRAGMA synchronous=NORMAL")
+        con.execute("PRAGMA busy_timeout=10000")
+        return con
+
+    def _conn(self) -> sqlite3.Connection:
+        # One connection per thread; sqlite3 connections must not be shared across threads
+        con = getattr(self._local, "con", None)
+        if con is None or self._local.pid != os.getpid():
+            # New thread, or a worker forked from a process that had one
+            con = self._connect()
+            self._local.con, self._local.pid = con, os.getpid()
+        return con
+
+    def record_solve(self, player: str, challenge_id: str) -> bool:
+        """Record a solve. Returns False if this player had already solved the challenge."""
+        points = self.points.get(challenge_id, 0)
+        now = time.time()
+        con = self._conn()
+        # IMMEDIATE takes the write lock up front, so concurrent workers queue on
+        # busy_timeout instead of failing halfway through the transaction
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            cur = con.execute(
+                "INSERT OR IGNORE INTO solves (player, challenge, points, solved_at) VALUES (?, ?, ?, ?)",
+                (player, challenge_id, points, now),
+            )
+            new = cur.rowcount == 1
+            if new:
+                con.execute(
+                    """
+                    INSERT INTO leaderboard (player, score, solves, last_solve) VALUES (?, ?, 1, ?)
+                    ON CONFLICT (player) DO UPDATE SET
+                        score = score + excluded.score,
+                        solves = solves + 1,
+                        last_solve = excluded.last_solve
+                    """,
+                    (player, points, now),
+                )
+            con.execute("COMMIT")
+        except BaseException:
+            con.execute("ROLLBACK")
+            raise
+        return new
+
+    def solved_by(self, player: str) -> set:
+        rows = self._conn().execute("SELECT challenge FROM solves WHERE player = ?", (player,))
+        return {row[0] for row in rows}
+
+    def leaderboard(self, limit: int = 500) -> list:
+        rows = self._conn().execute(
+            "SELECT player, score, solves, last_solve FROM leaderboard "
+            "ORDER BY score DESC, last_solve ASC LIMIT ?",
+            (limit,),
+        )
+        return [
+            {"rank": rank, "player": player, "score": score, "solves": solves, "last_solve": last_solve}
+            for rank, (player, score, solves, last_solve) in enumerate(rows, start=1)
+        ]
+
+    def last_solve_id(self) -> int:
+        return self._conn().execute("SELECT COALESCE(MAX(id), 0) FROM solves").fetchone()[0]
+
+    def solves_since(self, last_id: int, limit: int = 200) -> list:
+        """Solves recorded after last_id, oldest first, with the player's current score."""
+        rows = self._conn().execute(
+            "SELECT s.id, s.player, s.challenge, s.points, s.solved_at, l.score "
+            "FROM solves s JOIN leaderboard l ON l.player = s.player "
+            "WHERE s.id > ? ORDER BY s.id LIMIT ?",
+            (last_id, limit),
+        )
+        return [
+            {"id": id_, "player": player, "challenge": challenge, "points": points, "solved_at": solved_at, "score": score}
+            for id_, player, challenge, points, solved_at, score in rows
+        ]
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Smoke test: probe every service's /healthz and the brute-ssh port, all at once.
+
+    python smoke.py                                   # localhost, docker-compose ports
+    python smoke.py --host 203.0.113.10
+    python smoke.py --base-url https://capturetheflagkdg.com --paths   # behind nginx-ctf.conf
+    python smoke.py --watch 10                        # re-check every 10 s
+
+Uses the same concurrent prober as the portal's /api/status
+(ctfcommon/health.py), so one round takes as long as the slowest service
+(at most --timeout), not the sum. Exits 1 when a service is down.
+"""
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+from urllib.parse import urlsplit
+
+sys.path.append(str(Path(__file__).resolve().parent))
+
+from ctfcommon.health import check
+from ctfcommon.urls import CHALLENGE_PORTS, PORTAL_PORT
+
+SSH_PORT = 2222
+
+
+def targets_for(host: str = None, base_url: str = None, paths: bool = False) -> dict:
+    if base_url:
+        base = base_url.rstrip("/")
+        targets = {"portal": f"{base}/healthz"}
+        targets.update({
+            challenge: f"{base}/{challenge}/healthz" if paths else f"{base}:{port}/healthz"
+            for challenge, port in CHALLENGE_PORTS.items()
+        })
+        host = urlsplit(base).hostname
+    else:
+        targets = {"portal": f"http://{host}:{PORTAL_PORT}/healthz"}
+        targets.update({
+            challenge: f"http://{host}:{port}/healthz" for challenge, port in CHALLENGE_PORTS.items()
+        })
+    targets["brute-ssh"] = f"tcp://{host}:{SSH_PORT}"
+    return targets
+
+
+def report(targets: dict, results: dict) -> bool:
+    width = max(len(name) for name in targets)
+    for name, url in targets.items():
+        result = results[name]
+        if result["up"]:
+            print(f"  {name:<{width}}  up    {result['latency_ms']:>7.1f} ms  {url}")
+        else:
+            print(f"  {name:<{width}}  DOWN  {result['error']:>10}  {url}")
+    down = [name for name, result in results.items() if not result["up"]]
+    print(f"{len(results) - len(down)}/{len(results)} up" + (f"; down: {', '.join(down)}" if down else ""))
+    return not down
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--host", default="localhost", help="deployment host using the docker-compose ports")
+    target.add_argument("--base-url", help="single origin; combine with --paths")
+    parser.add_argument("--paths", action="store_true", help="challenges live under /<challenge>/ (nginx-ctf.conf, allinone.py)")
+    parser.add_argument("--skip", default="", help="comma-separated services to leave out")
+    parser.add_argument("--timeout", type=float, default=5.0, help="seconds per probe")
+    parser.add_argument("--watch", type=float, default=0, help="repeat every N seconds until interrupted")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args()
+
+    targets = targets_for(args.host, args.base_url, args.paths)
+    for name in filter(None, args.skip.split(",")):
+        targets.pop(name.strip(), None)
+
+    while True:
+        results = check(targets, args.timeout)
+        if args.json:
+            print(json.dumps({name: {"target": targets[name], **result} for name, result in results.items()}, indent=2))
+            ok = all(result["up"] for result in results.values())
+        else:
+            ok = report(targets, results)
+        if not args.watch:
+            sys.exit(0 if ok else 1)
+        try:
+            time.sleep(args.watch)
+        except KeyboardInterrupt:
+            sys.exit(0 if ok else 1)
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -5,10 +5,35 @@ Vulnerability: Server-Side Request Forgery to access internal endpoints
 from flask import Flask, request, render_template_string, jsonify
 import requests
 import os
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))  # shared ctfcommon/ package in a repo checkout
+
+from ctfcommon import dynflag, urls
+from ctfcommon.ratelimit import RateLimiter
+from ctfcommon.metrics import Metrics
+from fetcher import Fetcher
 
 app = Flask(__name__)
+urls.init_app(app)
+limiter = RateLimiter(app)
+metrics = Metrics(app)
 FLAG = os.getenv("FLAG", "CTF{ssrf_metadata_leak}")
 
+# One pooled client per worker process (fetcher.py): keep-alive connections,
+# a byte cap on what is read, and one deadline for the request and its redirects
+FETCH_POOL_SIZE = int(os.getenv("FETCH_POOL_SIZE", "10"))
+FETCH_MAX_BYTES = int(os.getenv("FETCH_MAX_BYTES", "5000"))
+FETCH_DEADLINE = float(os.getenv("FETCH_DEADLINE", "5"))
+FETCH_MAX_REDIRECTS = int(os.getenv("FETCH_MAX_REDIRECTS", "5"))
+fetcher = Fetcher(
+    pool_size=FETCH_POOL_SIZE, max_bytes=FETCH_MAX_BYTES, deadline=FETCH_DEADLINE, max_redirects=FETCH_MAX_REDIRECTS,
+)
+FETCH_ABORTS = metrics.counter(
+    "ssrf_fetch_aborts_total", "Previews cut short, by reason (size, deadline, redirects).", ("reason",),
+)
+
 HTML_TEMPLATE = """
 <!doctype html>
 <html lang="en">
@@ -64,25 +89,31 @@ HTML_TEMPLATE = """
 
 
 @app.route("/", methods=["GET", "POST"])
+@limiter.limit("fetch", "30/60", methods=("POST",))
 def index():
     content = None
     error = None
     url = None
-    scheme = request.headers.get("X-Forwarded-Proto", request.scheme or "http")
-    forwarded_host = request.headers.get("X-Forwarded-Host")
-    raw_host = (forwarded_host.split(",")[0].strip() if forwarded_host else request.host)
-    portal_host = raw_host.split(":")[0]
-    portal_url = f"{scheme}://{portal_host}/"
     if request.method == "POST":
         url = request.form.get("url", "")
         if url:
             try:
                 # VULNERABLE: No URL validation or blocklist for internal IPs
-                resp = requests.get(url, timeout=5, allow_redirects=True)
-                content = resp.text[:5000]  # Limit output size
+                # The preview request carries the player cookie, so internal pages
+                # reached through SSRF can still hand out the per-player flag
+                player_cookie = request.cookies.get(dynflag.PLAYER_COOKIE)
+                cookies = {dynflag.PLAYER_COOKIE: player_cookie} if player_cookie else None
+                result = fetcher.get(url, cookies=cookies)
+                content = result.text
+                if result.truncated:
+                    FETCH_ABORTS.inc("size")
             except requests.exceptions.RequestException as e:
+                if isinstance(e, requests.Timeout):
+                    FETCH_ABORTS.inc("deadline")
+                elif isinstance(e, requests.TooManyRedirects):
+                    FETCH_ABORTS.inc("redirects")
                 error = f"Failed to fetch URL: {e}"
-    return render_template_string(HTML_TEMPLATE, content=content, error=error, url=url, portal_url=portal_url)
+    return render_template_string(HTML_TEMPLATE, content=content, error=error, url=url)
 
 
 @app.route("/api/endpoints")
@@ -111,7 +142,7 @@ def internal_admin():
     # but we're simulating the "internal only" nature by just having it exist)
     return jsonify({
         "admin": True,
-        "flag": FLAG,
+        "flag": dynflag.flag_for(request, FLAG, "ssrf-internal"),
         "message": "Congratulations! You accessed the internal admin panel via SSRF!"
     })
 
@@ -121,7 +152,7 @@ def flag_direct():
     """Direct flag endpoint - only accessible via SSRF from localhost"""
     # In a real scenario, this would check for internal IPs
     # For the CTF, we allow it to demonstrate the concept
-    return jsonify({"flag": FLAG})
+    return jsonify({"flag": dynflag.flag_for(request, FLAG, "ssrf-internal")})
 
 
 @app.route("/healthz")
@@ -130,4 +161,4 @@ def healthz():
 
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000, debug=False)
+    app.run(host="0.0.0.0", port=int(os.getenv("PORT", "5000")), debug=False)
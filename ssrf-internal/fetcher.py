@@ -0,0 +1,107 @@
+"""
+The URL preview's outbound HTTP client: pooled, streamed and capped.
+
+    fetcher = Fetcher(pool_size=10, max_bytes=5000, deadline=5, max_redirects=5)
+    result = fetcher.get(url, cookies=...)   # FetchResult, or a requests.RequestException
+
+One keep-alive session serves every request of the process, keeping at most
+pool_size idle connections per host. The body is read as it arrives and
+reading stops at max_bytes, so a URL pointing at a multi-GB file costs
+max_bytes, not the file. Redirects are followed by hand, at most
+max_redirects of them, and one deadline covers the whole chain: every
+connect and every read waits only for what is left of it.
+
+The session never stores cookies: otherwise a Set-Cookie from one player's
+fetch would be sent along with the next player's.
+"""
+import codecs
+import time
+from http import cookiejar
+from urllib.parse import urljoin
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import DecodeError, ProtocolError, ReadTimeoutError
+
+CHUNK = 8192
+
+
+class _NoCookies(cookiejar.DefaultCookiePolicy):
+    def set_ok(self, cookie, request):
+        return False
+
+
+class FetchResult:
+    def __init__(self, url: str, status_code: int, text: str, truncated: bool, redirects: int):
+        self.url = url
+        self.status_code = status_code
+        self.text = text
+        self.truncated = truncated
+        self.redirects = redirects
+
+
+class Fetcher:
+    def __init__(self, pool_size: int = 10, max_bytes: int = 5000, deadline: float = 5.0, max_redirects: int = 5):
+        self.max_bytes = max_bytes
+        self.deadline = deadline
+        self.max_redirects = max_redirects
+        self.session = requests.Session()
+        self.session.cookies.set_policy(_NoCookies())
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def get(self, url: str, cookies: dict = None) -> FetchResult:
+        deadline = time.monotonic() + self.deadline
+        for redirects in range(self.max_redirects + 1):
+            resp = self.session.get(
+                url, cookies=cookies, stream=True, allow_redirects=False, timeout=self._remaining(deadline),
+            )
+            location = self.session.get_redirect_target(resp)
+            if location is None:
+                with resp:
+                    return self._read(resp, deadline, redirects)
+            resp.close()  # the redirect's own body is never read
+            url = urljoin(resp.url, location)
+        raise requests.TooManyRedirects(f"Exceeded {self.max_redirects} redirects.")
+
+    def _remaining(self, deadline: float) -> float:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise requests.Timeout(f"Deadline of {self.deadline:g} s exceeded")
+        return remaining
+
+    def _read(self, resp, deadline: float, redirects: int) -> FetchResult:
+        try:
+            decoder = codecs.getincrementaldecoder(resp.encoding or "utf-8")("replace")
+        except LookupError:  # a made-up charset in Content-Type
+            decoder = codecs.getincrementaldecoder("utf-8")("replace")
+        size = 0
+        parts = []
+        truncated = False
+        sock = getattr(getattr(resp.raw, "connection", None), "sock", None)
+        while True:
+            remaining = self._remaining(deadline)
+            if sock is not None:
+                sock.settimeout(remaining)  # a slow drip cannot outlast the deadline
+            try:
+                # read1: what one recv() brings, so the deadline is checked between recv()s
+                data = resp.raw.read1(min(CHUNK, self.max_bytes - size + 1), decode_content=True)
+            except ReadTimeoutError:
+                raise requests.Timeout(f"Deadline of {self.deadline:g} s exceeded") from None
+            except DecodeError as exc:
+                raise requests.exceptions.ContentDecodingError(exc) from None
+            except (ProtocolError, OSError) as exc:
+                raise requests.ConnectionError(exc) from None
+            if not data:
+                break
+            if size + len(data) > self.max_bytes:
+                data = data[:self.max_bytes - size]
+                truncated = True
+            size += len(data)
+            parts.append(decoder.decode(data))
+            if truncated:
+                break
+        if not truncated:
+            parts.append(decoder.decode(b"", final=True))
+        return FetchResult(resp.url, resp.status_code, "".join(parts), truncated, redirects)
@@ -0,0 +1,19 @@
+"""
+One-time setup for allinone.py, run once by the gunicorn master before it
+forks (ctfcommon/startup.py). Runs the mounted apps' own startup.py files
+without importing allinone.py or any app.
+"""
+from pathlib import Path
+
+from ctfcommon import startup
+
+BASE_DIR = Path(__file__).resolve().parent
+
+# Only one app may own /flag.txt in a shared filesystem: xxe-injection needs
+# it on disk, hard-jwt-confusion returns its flag over HTTP.
+STARTUP_APPS = ("login-sqli", "xxe-injection")
+
+
+def run():
+    for app_dir in STARTUP_APPS:
+        startup.run(BASE_DIR / app_dir, env=startup.app_env(app_dir))
@@ -1,52 +1,123 @@
-from flask import Flask, send_from_directory, render_template, request
+from flask import Flask, render_template, request
 import os
+import sys
+import threading
 from pathlib import Path
 
-BASE_DIR = Path(__file__).parent
-STATIC_DIR = BASE_DIR / "static"
-FLAG = os.getenv("FLAG", "CTF{follow_the_robots}")
+from werkzeug.exceptions import NotFound
+from werkzeug.wsgi import wrap_file
 
-app = Flask(__name__, static_folder=str(STATIC_DIR))
+sys.path.append(str(Path(__file__).resolve().parent.parent))  # shared ctfcommon/ package in a repo checkout
 
+from ctfcommon import dynflag, urls
+from ctfcommon.metrics import Metrics
+from manifest import ManifestWatcher
 
-def get_portal_url() -> str:
-    scheme = request.headers.get("X-Forwarded-Proto", request.scheme or "http")
-    forwarded_host = request.headers.get("X-Forwarded-Host")
-    raw_host = (forwarded_host.split(",")[0].strip() if forwarded_host else request.host)
-    portal_host = raw_host.split(":")[0]
-    return f"{scheme}://{portal_host}/"
+BASE_DIR = Path(__file__).parent
+STATIC_DIR = BASE_DIR / "static"
+FLAG = os.getenv("FLAG", "CTF{follow_the_robots}")
+# How often to look for changed files under static/ (seconds; 0: never)
+STATIC_WATCH_INTERVAL = float(os.getenv("STATIC_WATCH_INTERVAL", "2"))
+STATIC_MAX_AGE = int(os.getenv("STATIC_MAX_AGE", "60"))
+
+# No built-in /static route: it would read static/ directly, past the manifest
+# and the per-player flag. Every file goes through serve_static().
+app = Flask(__name__, static_folder=None)
+urls.init_app(app)
+metrics = Metrics(app)
+
+# Built now, once; the watcher thread that rebuilds it starts in the serving process
+_watcher = ManifestWatcher(STATIC_DIR, STATIC_WATCH_INTERVAL)
+_watcher_started = False
+_watcher_lock = threading.Lock()
+NOT_FOUND_BODY = NotFound().get_body()
+
+
+def manifest():
+    """The current manifest of static/; starts the watcher on first use (never before a fork)."""
+    global _watcher_started
+    if not _watcher_started and STATIC_WATCH_INTERVAL > 0:
+        with _watcher_lock:
+            if not _watcher_started:
+                _watcher.start()
+                _watcher_started = True
+    return _watcher.manifest
+
+
+@app.errorhandler(404)
+def not_found(e=None):
+    """Same page as werkzeug's, rendered once: brute-forcers mostly get this"""
+    return app.response_class(NOT_FOUND_BODY, 404, mimetype="text/html")
+
+
+def serve_static(key: str):
+    entry = manifest().get(key)
+    if entry is None:
+        return not_found()
+
+    coding = next((c for c in ("br", "gzip") if c in entry.variants and request.accept_encodings[c]), None)
+    etag = f"{entry.etag}-{coding}" if coding else entry.etag
+    if request.if_none_match.contains(etag):
+        resp = app.response_class(status=304)
+    elif coding:
+        # Precompressed when the manifest was built
+        resp = app.response_class(entry.variants[coding], mimetype=entry.mimetype)
+        resp.headers["Content-Encoding"] = coding
+    else:
+        try:
+            f = open(entry.path, "rb")
+        except OSError:
+            return not_found()  # deleted since the last manifest build
+        # wsgi.file_wrapper: gunicorn sends the file with sendfile(), no copy through Python
+        resp = app.response_class(wrap_file(request.environ, f), mimetype=entry.mimetype, direct_passthrough=True)
+        resp.content_length = os.fstat(f.fileno()).st_size
+        resp.make_conditional(request, accept_ranges=True, complete_length=resp.content_length)
+    resp.set_etag(etag)
+    resp.last_modified = entry.mtime
+    resp.vary.add("Accept-Encoding")
+    resp.cache_control.public = True
+    resp.cache_control.max_age = STATIC_MAX_AGE
+    return resp
 
 
 @app.get("/")
 def index():
-    return render_template("index.html", portal_url=get_portal_url())
+    return render_template("index.html")
 
 
 @app.get("/robots.txt")
 def robots():
-    return send_from_directory(app.static_folder, "robots.txt")
+    return serve_static("robots.txt")
 
 
 @app.get("/config.bak")
 def config_bak():
-    return send_from_directory(app.static_folder, "config.bak")
+    return serve_static("config.bak")
 
 
 @app.get("/hidden/")
 def hidden_index():
-    hidden_dir = Path(app.static_folder) / "hidden"
-    if not hidden_dir.exists():
-        return "Not found", 404
-    files = sorted([p.name for p in hidden_dir.iterdir() if p.is_file()])
-    items = "\n".join(f'<li><a href="/hidden/{name}">{name}</a></li>' for name in files)
-    html = f"""<!doctype html><html lang=\"nl\"><head><meta charset=\"utf-8\"><title>Index of /hidden/</title></head>
-    <body><h1>Index of /hidden/</h1><ul>{items}</ul></body></html>"""
+    # Rendered when the manifest was built (manifest.py)
+    html = manifest().listings.get("hidden")
+    if html is None:
+        return not_found()
     return html
 
 
 @app.get("/hidden/<path:filename>")
 def hidden_file(filename: str):
-    return send_from_directory(Path(app.static_folder) / "hidden", filename)
+    if filename == "flag.txt" and dynflag.ENABLED:
+        # Per-player flag instead of the static file contents
+        return app.response_class(dynflag.flag_for(request, FLAG, "static-secrets") + "\n", mimetype="text/plain")
+    return serve_static(f"hidden/{filename}")
+
+
+@app.get("/static/<path:filename>")
+def static_file(filename: str):
+    # The URLs of Flask's static route, which this app used to have
+    if filename.startswith("hidden/"):
+        return hidden_file(filename[len("hidden/"):])
+    return serve_static(filename)
 
 
 @app.get("/healthz")
@@ -61,4 +132,4 @@ def healthz():
 
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000, debug=False)
+    app.run(host="0.0.0.0", port=int(os.getenv("PORT", "5000")), debug=False)
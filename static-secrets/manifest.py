@@ -0,0 +1,116 @@
+"""
+In-memory manifest of the static tree, built once and rebuilt when it changes.
+
+Directory brute-forcers (gobuster, dirb) send thousands of requests, nearly
+all for paths that do not exist. With the manifest those cost a dict lookup:
+no stat(), no open(). For the files that do exist it holds everything a
+response needs up front: size, mimetype, a content ETag, gzip and (with the
+optional brotli package) br variants of compressible files, and the rendered
+HTML listing of every directory.
+
+ManifestWatcher polls the tree's names, sizes and mtimes and swaps in a new
+Manifest when anything changes; readers always see one complete manifest.
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+import threading
+from pathlib import Path
+
+try:
+    import brotli
+except ImportError:  # optional: only gzip variants without it
+    brotli = None
+
+# Variants are only kept when they save at least this much
+MIN_SAVING = 0.1
+COMPRESSIBLE = ("text/", "application/json", "application/xml", "application/javascript", "image/svg+xml")
+
+
+class StaticFile:
+    def __init__(self, path: Path, data: bytes, mtime: float):
+        self.path = path
+        self.size = len(data)
+        self.mtime = mtime
+        mimetype, _ = mimetypes.guess_type(path.name)
+        # robots.txt, config.bak, ...: show them in the browser rather than download them
+        self.mimetype = mimetype or "text/plain"
+        self.etag = hashlib.sha256(data).hexdigest()[:20]
+        self.variants = {}  # content-coding -> compressed bytes
+        if self.mimetype.startswith(COMPRESSIBLE) and data:
+            candidates = {"gzip": gzip.compress(data, compresslevel=9, mtime=0)}
+            if brotli is not None:
+                candidates["br"] = brotli.compress(data)
+            for coding, body in candidates.items():
+                if len(body) <= len(data) * (1 - MIN_SAVING):
+                    self.variants[coding] = body
+
+
+def render_listing(name: str, files: list) -> str:
+    items = "\n".join(f'<li><a href="{file}">{file}</a></li>' for file in files)
+    return f"""<!doctype html><html lang=\"nl\"><head><meta charset=\"utf-8\"><title>Index of /{name}/</title></head>
+    <body><h1>Index of /{name}/</h1><ul>{items}</ul></body></html>"""
+
+
+def snapshot(root: Path) -> tuple:
+    """(relative path, size, mtime_ns) of every file: changes whenever the tree does."""
+    entries = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            stat = os.stat(os.path.join(dirpath, filename))
+            entries.append((os.path.relpath(os.path.join(dirpath, filename), root), stat.st_size, stat.st_mtime_ns))
+    return tuple(entries)
+
+
+class Manifest:
+    def __init__(self, root):
+        self.root = Path(root)
+        self.signature = snapshot(self.root)
+        self.files = {}  # "hidden/flag.txt" -> StaticFile
+        self.listings = {}  # "hidden" -> rendered index HTML
+        children = {}
+        for relpath, _, mtime_ns in self.signature:
+            path = self.root / relpath
+            key = Path(relpath).as_posix()
+            self.files[key] = StaticFile(path, path.read_bytes(), mtime_ns / 1e9)
+            parent, _, name = key.rpartition("/")
+            children.setdefault(parent, []).append(name)
+        for directory in (p for p in self.root.rglob("*") if p.is_dir()):
+            key = directory.relative_to(self.root).as_posix()
+            self.listings[key] = render_listing(key, sorted(children.get(key, [])))
+
+    def get(self, key: str):
+        return self.files.get(key)
+
+
+class ManifestWatcher(threading.Thread):
+    """Rebuilds the manifest every interval seconds if the tree changed."""
+
+    def __init__(self, root, interval: float = 2.0):
+        super().__init__(name="static-manifest", daemon=True)
+        self.root = Path(root)
+        self.interval = interval
+        self.manifest = Manifest(self.root)
+        self.rebuilds = 0
+        self._stop_event = threading.Event()
+
+    def check(self) -> bool:
+        """Rebuild if the tree changed since the current manifest; returns whether it did."""
+        if snapshot(self.root) == self.manifest.signature:
+            return False
+        self.manifest = Manifest(self.root)  # replaced whole, never patched in place
+        self.rebuilds += 1
+        return True
+
+    def run(self) -> None:
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.check()
+            except OSError:
+                # A file vanished mid-scan; the next round sees the settled tree
+                pass
+
+    def stop(self) -> None:
+        self._stop_event.set()
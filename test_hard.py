@@ -1,12 +1,25 @@
 #!/usr/bin/env python3
 """
 Test suite for hard-level CTF challenges
-Tests: container-breakout, hard-deserialization, hard-jwt-confusion
+Tests: container-breakout, hard-deserialization, hard-jwt-confusion,
+verified JWT cache, RS256 keypair and JWKS, batch token endpoints
 """
+import base64
+import hashlib
+import hmac
+import json
+import os
 import sys
+import tempfile
+import threading
+import time
 import importlib.util
 from pathlib import Path
 
+CONFUSION_DIR = Path(__file__).parent / "hard-jwt-confusion"
+if str(CONFUSION_DIR) not in sys.path:
+    sys.path.append(str(CONFUSION_DIR))  # app-local modules (keys)
+
 
 def load_module(module_name, module_path):
     """Dynamically load a module from a specific path"""
@@ -16,6 +29,24 @@ def load_module(module_name, module_path):
     return module
 
 
+def load_confusion(module_name):
+    """Load hard-jwt-confusion with a throwaway key directory"""
+    os.environ["JWT_KEY_DIR"] = tempfile.mkdtemp()
+    try:
+        return load_module(module_name, CONFUSION_DIR / "app.py")
+    finally:
+        del os.environ["JWT_KEY_DIR"]
+
+
+def forge_hs256(claims, key):
+    """HS256 token keyed on any string, the PEM included (jwt.encode refuses a PEM)"""
+    def b64(raw):
+        return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+    signing_input = b64(b'{"alg":"HS256","typ":"JWT"}') + "." + b64(json.dumps(claims).encode())
+    return signing_input + "." + b64(hmac.new(key.encode(), signing_input.encode(), hashlib.sha256).digest())
+
+
 def test_container_breakout():
     """Test Container Breakout Challenge"""
     app_path = Path(__file__).parent / "container-breakout" / "app.py"
@@ -117,8 +148,7 @@ def test_deserialization():
 
 def test_jwt_confusion():
     """Test JWT Algorithm Confusion Challenge"""
-    app_path = Path(__file__).parent / "hard-jwt-confusion" / "app.py"
-    module = load_module("jwt_confusion_app", app_path)
+    module = load_confusion("jwt_confusion_app")
     app = module.app
 
     print("\n" + "=" * 70)
@@ -175,11 +205,291 @@ def test_jwt_confusion():
     print("=" * 70)
 
 
+def test_token_cache():
+    """Test the verified-token cache: hits, expiry at exp, negative caching, unchanged errors"""
+    module = load_confusion("jwt_confusion_app_cached")
+    jwt = module.jwt
+    from ctfcommon.jwtcache import VerifiedTokenCache
+
+    print("\n" + "=" * 70)
+    print("VERIFIED TOKEN CACHE - VERIFICATION")
+    print("=" * 70)
+
+    now = time.time()
+    clock = [now]
+    decode = VerifiedTokenCache(
+        lambda token: jwt.decode(token, "k", algorithms=["HS256"]), maxsize=2, negative_ttl=5, clock=lambda: clock[0],
+    )
+
+    valid = jwt.encode({"sub": "a", "exp": int(now) + 60}, "k", algorithm="HS256")
+    claims = decode(valid)
+    claims["sub"] = "changed"
+    assert decode(valid)["sub"] == "a" and decode.hits == 1, "Valid token not served from cache"
+    clock[0] = int(now) + 60
+    decode(valid)
+    assert decode.misses == 2, "Entry outlived the token's exp"
+    print(f"\n✓ Valid token cached until its exp: {decode.stats()}")
+
+    def errors(token):
+        raised = []
+        for _ in range(2):
+            try:
+                decode(token)
+            except Exception as e:
+                raised.append((type(e), str(e)))
+        return raised
+
+    clock[0] = now
+    bad = jwt.encode({"sub": "a"}, "wrong", algorithm="HS256")
+    hits = decode.hits
+    raised = errors(bad)
+    assert raised == [(jwt.InvalidSignatureError, "Signature verification failed")] * 2, raised
+    assert decode.hits == hits + 1, "Bad signature not negatively cached"
+    expired = jwt.encode({"sub": "a", "exp": int(now) - 10}, "k", algorithm="HS256")
+    assert errors(expired) == [(jwt.ExpiredSignatureError, "Signature has expired")] * 2, "Expired error changed"
+    print("✓ Rejected tokens cached briefly, same error type and message")
+
+    clock[0] = now + 6
+    misses = decode.misses
+    errors(bad)
+    assert decode.misses == misses + 1, "Negative entry outlived negative_ttl"
+    immature = jwt.encode({"sub": "a", "nbf": int(now) + 3600}, "k", algorithm="HS256")
+    misses = decode.misses
+    assert errors(immature)[0][0] is jwt.ImmatureSignatureError
+    assert decode.misses == misses + 2, "Not-yet-valid token was cached"
+    assert decode.stats()["entries"] <= 2, "maxsize not enforced"
+    print("✓ Negative TTL, nbf not cached, LRU bounded")
+
+    admin = forge_hs256({"sub": "x", "role": "admin", "exp": int(now) + 60}, module.PUBLIC_KEY)
+    with module.app.test_client() as client:
+        for _ in range(2):
+            resp = client.post("/verify", data={"token": admin})
+            assert resp.status_code == 200 and "flag" in resp.get_json(), "Forged admin token rejected"
+        stale = forge_hs256({"sub": "x", "role": "admin", "exp": int(now) - 10}, module.PUBLIC_KEY)
+        for token, message in ((stale, "Token expired"), (bad, "Invalid token signature")):
+            for _ in range(2):
+                resp = client.post("/verify", data={"token": token})
+                assert resp.status_code == 401 and resp.get_json()["error"] == message, resp.get_json()
+    print(f"✓ /verify answers unchanged through the cache: {module.decode_token.stats()}")
+
+    print("\n" + "=" * 70)
+    print("VERIFIED TOKEN CACHE: ALL CHECKS PASSED ✓")
+    print("=" * 70)
+
+
+def test_jwt_keys():
+    """Test the persisted RSA keypair, JWKS and the HS256-with-public-key confusion"""
+    import keys
+
+    print("\n" + "=" * 70)
+    print("JWT KEYPAIR AND JWKS - VERIFICATION")
+    print("=" * 70)
+
+    key_dir = tempfile.mkdtemp()
+    start = time.perf_counter()
+    first = keys.load_or_create(key_dir)
+    cold = time.perf_counter() - start
+    start = time.perf_counter()
+    again = keys.load_or_create(key_dir)
+    warm = time.perf_counter() - start
+    print(f"\n✓ Cold start: generate {cold * 1000:.1f} ms, load from disk {warm * 1000:.1f} ms")
+    assert again.kid == first.kid, "Key not reused from disk"
+    assert (Path(key_dir) / "private.pem").stat().st_mode & 0o077 == 0, "Private key readable by others"
+
+    racing_dir = tempfile.mkdtemp()
+    kids = []
+    threads = [threading.Thread(target=lambda: kids.append(keys.load_or_create(racing_dir).kid)) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(kids) == 4 and len(set(kids)) == 1, "Concurrent starts made different keys"
+    print("✓ Four concurrent starts share one generated key")
+
+    module = load_confusion("jwt_confusion_app_keys")
+    jwt = module.jwt
+    with module.app.test_client() as client:
+        pem = client.get("/public-key").get_json()["public_key"]
+        assert pem.startswith("-----BEGIN PUBLIC KEY-----"), "Not a real public key"
+
+        resp = client.get("/.well-known/jwks.json")
+        jwk = resp.get_json()["keys"][0]
+        print(f"✓ JWKS: kid={jwk['kid']}, Cache-Control: {resp.headers['Cache-Control']}")
+        assert resp.headers["Cache-Control"].startswith("public, max-age=") and resp.headers["ETag"], "No cache headers"
+        assert client.get("/.well-known/jwks.json", headers={"If-None-Match": resp.headers["ETag"]}).status_code == 304
+        public = jwt.algorithms.RSAAlgorithm.from_jwk(json.dumps(jwk))
+        assert public.public_numbers() == module.KEYS.public_key.public_numbers(), "JWK does not match the key"
+
+        token = client.post("/token", data={"username": "u", "role": "user"}).get_json()["token"]
+        assert jwt.get_unverified_header(token)["alg"] == "RS256", "Tokens not signed with RS256"
+        assert jwt.decode(token, public, algorithms=["RS256"])["sub"] == "u", "JWKS key cannot verify tokens"
+        resp = client.post("/verify", data={"token": token})
+        assert resp.status_code == 200 and resp.get_json()["role"] == "user", "RS256 token rejected"
+        print("✓ /token signs RS256 with the private key; /verify accepts it")
+
+        resp = client.post("/verify", data={"token": forge_hs256({"sub": "x", "role": "admin"}, pem)})
+        print(f"✓ HS256 forged with the public key PEM -> {resp.status_code} (expected 200 with flag)")
+        assert resp.status_code == 200 and "flag" in resp.get_json(), "Algorithm confusion no longer works"
+        resp = client.post("/verify", data={"token": forge_hs256({"sub": "x", "role": "admin"}, "guess")})
+        assert resp.status_code == 401 and resp.get_json()["error"] == "Invalid token signature"
+        none = jwt.encode({"sub": "x", "role": "admin"}, None, algorithm="none")
+        assert client.post("/verify", data={"token": none}).status_code == 401, "alg=none accepted"
+        print("✓ Other HS256 keys and alg=none still rejected")
+
+    print("\n" + "=" * 70)
+    print("JWT KEYPAIR AND JWKS: ALL CHECKS PASSED ✓")
+    print("=" * 70)
+
+
+def test_jwt_batch():
+    """Test the batch issue/verify endpoints of jwt-weak and hard-jwt-confusion, JSON and NDJSON"""
+    weak = load_module("jwt_weak_app_batch", Path(__file__).parent / "jwt-weak" / "app.py")
+    module = load_confusion("jwt_confusion_app_batch")
+    from ctfcommon import batch
+
+    print("\n" + "=" * 70)
+    print("JWT BATCH ENDPOINTS - VERIFICATION")
+    print("=" * 70)
+
+    with weak.app.test_client() as client:
+        resp = client.post("/login/batch", json={"usernames": ["a", "b", 3]})
+        results = resp.get_json()["results"]
+        assert [r["status"] for r in results] == [200, 200, 400], results
+        tokens = [r["body"]["token"] for r in results[:2]]
+        admin = weak.jwt.encode({"sub": "x", "role": "admin"}, weak.SECRET, algorithm="HS256")
+
+        resp = client.post("/admin/batch", json={"tokens": tokens[:1] + [admin, "garbage"]})
+        results = resp.get_json()["results"]
+        single = client.get("/admin", headers={"Authorization": "Bearer garbage"})
+        print(f"\n✓ jwt-weak /admin/batch -> {[r['status'] for r in results]} (expected [403, 200, 401])")
+        assert [r["status"] for r in results] == [403, 200, 401], results
+        assert "flag" in results[1]["body"] and results[2]["body"] == single.get_json(), "Differs from /admin"
+
+        assert client.post("/admin/batch", data="nope").status_code == 400, "Malformed batch accepted"
+        too_many = client.post("/admin/batch", json={"tokens": ["x"] * (batch.BATCH_MAX + 1)})
+        assert too_many.status_code == 413, "BATCH_MAX not enforced"
+        print("✓ Malformed body -> 400, more than BATCH_MAX -> 413")
+
+    with module.app.test_client() as client:
+        users = [{"username": f"u{i}", "role": "user"} for i in range(3)]
+        issued = client.post("/token/batch", json={"users": users}).get_json()["results"]
+        assert all(r["status"] == 200 and r["body"]["status"] == "success" for r in issued), issued
+        forged = forge_hs256({"sub": "x", "role": "admin"}, module.PUBLIC_KEY)
+        tokens = [r["body"]["token"] for r in issued] + [forged, "", 7]
+
+        resp = client.post("/verify/batch", json={"tokens": tokens}, headers={"Accept": batch.NDJSON})
+        assert resp.mimetype == batch.NDJSON, "NDJSON not honoured"
+        lines = [json.loads(line) for line in resp.get_data(as_text=True).splitlines()]
+        print(f"✓ hard-jwt-confusion /verify/batch (NDJSON) -> {[r['status'] for r in lines]}")
+        assert [r["status"] for r in lines] == [200, 200, 200, 200, 400, 400], lines
+        assert "flag" in lines[3]["body"] and lines[0]["body"]["role"] == "user", "Wrong per-token result"
+
+        big = client.post("/verify/batch", json={"tokens": [forged] * (batch.BATCH_STREAM_MIN + 1)})
+        assert big.mimetype == batch.NDJSON, "Large batch not streamed"
+        assert len(big.get_data(as_text=True).splitlines()) == batch.BATCH_STREAM_MIN + 1
+        print(f"✓ More than {batch.BATCH_STREAM_MIN} tokens -> streamed as NDJSON")
+
+        n = 100
+        start = time.perf_counter()
+        for _ in range(n):
+            client.post("/verify", data={"token": forged})
+        one_by_one = n / (time.perf_counter() - start)
+        start = time.perf_counter()
+        client.post("/verify/batch", json={"tokens": [forged] * n})
+        batched = n / (time.perf_counter() - start)
+        print(f"✓ /verify: {one_by_one:.0f} tokens/s one per request, {batched:.0f} tokens/s in one batch")
+
+    print("\n" + "=" * 70)
+    print("JWT BATCH ENDPOINTS: ALL CHECKS PASSED ✓")
+    print("=" * 70)
+
+
+def test_rate_limit():
+    """Test the token-bucket limiter on the deserialize endpoint"""
+    app_path = Path(__file__).parent / "hard-deserialization" / "app.py"
+    module = load_module("deserialization_app_limited", app_path)
+    app = module.app
+    capacity, _ = module.limiter.rates["deserialize"]
+
+    print("\n" + "=" * 70)
+    print("RATE LIMITER - VERIFICATION")
+    print("=" * 70)
+
+    print(f"\n✓ Draining a bucket of {capacity} tokens:")
+    with app.test_client() as client:
+        client.get("/healthz")  # the first response hands out the client cookie
+        statuses = [client.post("/deserialize", data={"data": "invalid"}).status_code for _ in range(capacity)]
+        assert 429 not in statuses, "Limited before the bucket was empty"
+
+        resp = client.post("/deserialize", data={"data": "invalid"})
+        print(f"  POST /deserialize #{capacity + 1} -> {resp.status_code} (expected 429)")
+        assert resp.status_code == 429, "Bucket not enforced"
+        print(f"  Retry-After: {resp.headers.get('Retry-After')}")
+        assert int(resp.headers["Retry-After"]) >= 1, "Missing Retry-After"
+
+        resp = client.get("/healthz")
+        assert resp.status_code == 200, "Unlimited route affected"
+
+        stats = client.get("/ratelimit").get_json()["routes"]["deserialize"]
+        print(f"  GET /ratelimit -> {stats}")
+        assert stats["allowed"] == capacity and stats["limited"] == 1, "Counters wrong"
+
+    print("\n✓ A second anonymous client on the same IP has a bucket of its own:")
+    with app.test_client() as client:
+        client.get("/healthz")
+        statuses = [client.post("/deserialize", data={"data": "invalid"}).status_code for _ in range(capacity)]
+        print(f"  {capacity} POSTs -> {statuses.count(429)} limited (expected 0)")
+        assert 429 not in statuses, "Anonymous clients on one IP share a bucket"
+
+    print("\n✓ Requests without a client cookie share the IP's anonymous bucket:")
+    statuses = []
+    for _ in range(capacity + 1):
+        with app.test_client() as client:  # a new client every time: no cookie
+            statuses.append(client.post("/deserialize", data={"data": "invalid"}).status_code)
+    print(f"  {capacity + 1} cookie-less POSTs -> {statuses.count(429)} limited (expected 1)")
+    limited = [status == 429 for status in statuses]
+    assert limited == [False] * capacity + [True], "Dropping the cookie escaped the limit"
+
+    print("\n✓ The IP bucket caps every client of an address together:")
+    from flask import Flask
+    from ctfcommon.ratelimit import MemoryBackend, RateLimiter
+    probe = Flask("probe")
+    limiter = RateLimiter(probe, backend=MemoryBackend(), ip_factor=2)
+    probe.add_url_rule("/", "probe", limiter.limit("probe", "2/3600")(lambda: "ok"), methods=["POST"])
+    statuses = []
+    for _ in range(3):
+        with probe.test_client() as client:
+            client.post("/")  # cookie-less: from the anonymous bucket, and hands out a cookie
+            statuses += [client.post("/").status_code for _ in range(2)]
+    print(f"  3 clients x 2 POSTs at 2/3600, IP factor 2 -> {statuses}")
+    assert statuses[-1] == 429 and statuses.count(200) == 2, "IP ceiling not enforced"
+
+    print("\n✓ SQLite buckets are pruned once refilled:")
+    from ctfcommon.ratelimit import PRUNE_INTERVAL, SQLiteBackend
+    backend = SQLiteBackend(str(Path(tempfile.mkdtemp()) / "ratelimit.db"))
+    now = time.time()
+    for n in range(5):
+        backend.take(f"deserialize:ip:10.0.0.{n}", 2, 1.0, now)
+    count = lambda: backend._conn().execute("SELECT COUNT(*) FROM buckets").fetchone()[0]
+    assert count() == 5, "Buckets not stored"
+    backend.take("deserialize:ip:10.0.0.99", 2, 1.0, now + PRUNE_INTERVAL + 1)
+    print(f"  5 buckets, one take {PRUNE_INTERVAL + 1} s later -> {count()} left (expected 1)")
+    assert count() == 1, "Refilled buckets not pruned"
+
+    print("\n" + "=" * 70)
+    print("RATE LIMITER: ALL CHECKS PASSED ✓")
+    print("=" * 70)
+
+
 if __name__ == "__main__":
     try:
         test_container_breakout()
         test_deserialization()
         test_jwt_confusion()
+        test_token_cache()
+        test_jwt_keys()
+        test_jwt_batch()
+        test_rate_limit()
 
         print("\n" + "=" * 70)
         print("ALL HARD CHALLENGES: VERIFICATION COMPLETE ✓✓✓")
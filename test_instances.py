@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Test suite for the per-team instance manager
+Tests: warm leasing, cold start, idle recycle, reset, adaptive pool size,
+one real login-sqli instance behind the proxy
+"""
+import os
+import subprocess
+import sys
+import time
+import importlib.util
+from pathlib import Path
+from unittest import mock
+
+MANAGER_DIR = Path(__file__).parent / "instance-manager"
+
+
+def load_module(module_name, module_path):
+    """Dynamically load a module from a specific path"""
+    spec = importlib.util.spec_from_file_location(module_name, module_path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+class FakeBackend:
+    """Instances that start instantly and never need a real process"""
+
+    def __init__(self, pool_module):
+        self.pool = pool_module
+        self.started = 0
+        self.stopped = 0
+        self.dead = set()
+
+    def start(self, challenge):
+        self.started += 1
+        return self.pool.Instance(challenge, "http://fake", None)
+
+    def alive(self, instance):
+        return instance.id not in self.dead
+
+    def healthy(self, instance):
+        return True
+
+    def stop(self, instance):
+        self.stopped += 1
+
+
+def test_pool_scheduling():
+    """Test leases, recycling and pool resizing against a fake backend"""
+    pool = load_module("instance_pool", MANAGER_DIR / "pool.py")
+    backend = FakeBackend(pool)
+    manager = pool.InstanceManager(backend, ["login-sqli"], min_warm=1, max_warm=3, max_instances=5, idle_timeout=60)
+
+    print("\n" + "=" * 70)
+    print("INSTANCE POOL - VERIFICATION")
+    print("=" * 70)
+
+    print("\n✓ Warm lease:")
+    manager.run_once()
+    assert manager.stats()["login-sqli"]["warm"] == 1, "Pool not pre-warmed"
+    start = time.perf_counter()
+    first = manager.lease("login-sqli", "team-a")
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    print(f"  lease from warm pool in {elapsed_ms:.3f} ms")
+    assert manager.stats()["login-sqli"]["cold_starts"] == 0, "Warm lease started an instance"
+    assert manager.lease("login-sqli", "team-a") is first, "Same team got another instance"
+
+    print("\n✓ Cold start and adaptive size:")
+    second = manager.lease("login-sqli", "team-b")
+    assert second is not first and manager.stats()["login-sqli"]["cold_starts"] == 1, "Empty pool not cold-started"
+    manager.run_once()
+    stats = manager.stats()["login-sqli"]
+    print(f"  2 recent leases -> target_warm={stats['target_warm']} warm={stats['warm']}")
+    assert stats["target_warm"] == 2 and stats["warm"] == 2, "Pool did not grow with demand"
+    manager.lease("login-sqli", "team-c")
+    manager.run_once()
+    stats = manager.stats()["login-sqli"]
+    print(f"  capacity 5 -> leased={stats['leased']} warm={stats['warm']}")
+    assert stats["leased"] + stats["warm"] <= 5, "max_instances exceeded"
+
+    print("\n✓ Reset, idle recycle and dead instances:")
+    assert manager.release("login-sqli", "team-a") is True, "Reset failed"
+    assert manager.lease("login-sqli", "team-a") is not first, "Reset did not hand out a fresh instance"
+    second.last_seen -= 120
+    backend.dead.add(manager.pools["login-sqli"].leases["team-c"].id)
+    manager.run_once()
+    leases = manager.pools["login-sqli"].leases
+    print(f"  teams still leased: {sorted(leases)}")
+    assert sorted(leases) == ["team-a"], "Idle or dead instance not recycled"
+
+    print("\n✓ A spare that died since the last tick is not leased:")
+    manager.run_once()
+    spares = list(manager.pools["login-sqli"].warm)
+    backend.dead.update(i.id for i in spares)
+    stopped = backend.stopped
+    fresh = manager.lease("login-sqli", "team-d")
+    print(f"  {len(spares)} dead spares -> stopped {backend.stopped - stopped}, team-d cold-started")
+    assert fresh not in spares and backend.alive(fresh), "Dead spare leased"
+    assert backend.stopped - stopped == len(spares), "Dead spares not stopped"
+
+    print("\n✓ Demand window expiry:")
+    manager.demand_window = 0
+    manager.run_once()
+    stats = manager.stats()["login-sqli"]
+    assert stats["target_warm"] == 1 and stats["warm"] == 1, "Pool did not shrink back to min_warm"
+
+    manager.shutdown()
+    assert backend.stopped == backend.started, "Instances left running after shutdown"
+
+    print("\n✓ Shell challenges only with an isolating backend:")
+    unsafe = pool.unsafe_challenges(pool.ProcessBackend(), ["login-sqli", "command-injection"])
+    print(f"  process backend refuses {unsafe}")
+    assert unsafe == ["command-injection"], "Shell challenge allowed under the process backend"
+    assert pool.unsafe_challenges(pool.DockerBackend(), pool.SHELL_CHALLENGES) == [], "Docker backend refused"
+
+    print("\n✓ Docker backend commands:")
+    calls = []
+
+    def fake_run(cmd, **kwargs):
+        calls.append(cmd)
+        stdout = "127.0.0.1:49153\n" if cmd[1] == "port" else "container-id\n"
+        return subprocess.CompletedProcess(cmd, 0, stdout, "")
+
+    with mock.patch.object(pool.subprocess, "run", fake_run), \
+            mock.patch.dict(os.environ, {"EVENT_KEY": "k", "FLAG_COMMAND_INJECTION": "CTF{own}"}):
+        instance = pool.DockerBackend(network="ctf_net").start("command-injection")
+        run = calls[0]
+        print(f"  on ctf_net -> {instance.url}")
+        assert instance.url == f"http://{instance.handle}:5000" and len(calls) == 1, "Not reached by name"
+        assert "-p" not in run and run[run.index("--network") + 1] == "ctf_net", run
+        assert "EVENT_KEY=k" in run and "FLAG=CTF{own}" in run, "Event key or flag not passed on"
+        assert run[-1] == "ctf-command-injection", "Wrong image"
+        calls.clear()
+        instance = pool.DockerBackend(host="172.17.0.1", publish_host="0.0.0.0").start("login-sqli")
+        print(f"  published -> {instance.url}")
+        assert "0.0.0.0::5000" in calls[0] and instance.url == "http://172.17.0.1:49153", calls
+    compose = (Path(__file__).parent / "docker-compose.yml").read_text()
+    for challenge in ("login-sqli",) + pool.SHELL_CHALLENGES:
+        assert f"image: ctf-{challenge}" in compose, f"No ctf-{challenge} image in docker-compose.yml"
+
+    print("\n" + "=" * 70)
+    print("INSTANCE POOL: ALL CHECKS PASSED ✓")
+    print("=" * 70)
+
+
+def test_proxy():
+    """Test a real login-sqli instance leased and proxied per team"""
+    if str(MANAGER_DIR) not in sys.path:
+        sys.path.insert(0, str(MANAGER_DIR))
+    os.environ["INSTANCE_CHALLENGES"] = "login-sqli"
+    module = load_module("instance_manager_app", MANAGER_DIR / "app.py")
+    manager = module.MANAGER
+    manager.tick = 3600  # scheduler passes only when woken
+
+    print("\n" + "=" * 70)
+    print("INSTANCE MANAGER PROXY - VERIFICATION")
+    print("=" * 70)
+
+    try:
+        manager.run_once()
+        with module.app.test_client() as client:
+            resp = client.get("/login-sqli")
+            assert resp.status_code == 308, "Bare challenge path not redirected"
+
+            start = time.perf_counter()
+            resp = client.get("/login-sqli/")
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            print(f"  GET /login-sqli/ -> {resp.status_code} {resp.headers.get('Location')} in {elapsed_ms:.0f} ms")
+            assert resp.headers["Location"] == "/login-sqli/login", "Redirect not kept under the prefix"
+            assert elapsed_ms < 1000, "Leasing a warm instance took over a second"
+
+            resp = client.post("/login-sqli/login", data={"username": "admin' --", "password": "x"})
+            print(f"  SQLi through the proxy -> {resp.status_code} {resp.headers.get('Location')}")
+            assert resp.headers["Location"] == "/login-sqli/flag", "Exploit did not reach the instance"
+
+            resp = client.get("/nope/")
+            assert resp.status_code == 404, "Unknown challenge proxied"
+    finally:
+        manager.shutdown()
+
+    print("\n" + "=" * 70)
+    print("INSTANCE MANAGER PROXY: ALL CHECKS PASSED ✓")
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    try:
+        test_pool_scheduling()
+        test_proxy()
+
+        print("\n" + "=" * 70)
+        print("INSTANCE MANAGER: VERIFICATION COMPLETE ✓✓✓")
+        print("=" * 70)
+    except Exception as e:
+        print(f"\n❌ Test failed: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
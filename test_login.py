@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+Test suite for the login-sqli challenge
+Tests: login and SQL injection, cached per-thread database connections,
+per-session database copies, query guard
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+import importlib.util
+from pathlib import Path
+
+
+def load_module(module_name, module_path):
+    """Dynamically load a module from a specific path"""
+    spec = importlib.util.spec_from_file_location(module_name, module_path)
+    module = importlib.util.module_from_spec(spec)
+    # Register before exec so Flask resolves templates relative to the app file
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+LOGIN_DIR = Path(__file__).parent / "login-sqli"
+if str(LOGIN_DIR) not in sys.path:
+    sys.path.append(str(LOGIN_DIR))  # app-local modules (sessiondb)
+
+
+def load_login(**env):
+    """Load login-sqli with its own throwaway users database"""
+    env["DB_PATH"] = str(Path(tempfile.mkdtemp()) / "users.db")
+    os.environ.update(env)
+    try:
+        return load_module("login_sqli_app", LOGIN_DIR / "app.py")
+    finally:
+        for name in env:
+            del os.environ[name]
+
+
+def test_login_sqli():
+    """Test login, SQL injection and the flag page"""
+    module = load_login()
+    app = module.app
+
+    print("\n" + "=" * 70)
+    print("LOGIN-SQLI CHALLENGE - VERIFICATION")
+    print("=" * 70)
+
+    print("\n✓ Testing logins:")
+    with app.test_client() as client:
+        resp = client.post("/login", data={"username": "guest", "password": "guest"})
+        print(f"  POST /login (guest) -> {resp.status_code} (expected 302)")
+        assert resp.status_code == 302, "Valid login failed"
+
+        resp = client.post("/login", data={"username": "admin", "password": "nope"})
+        print(f"  POST /login (wrong password) -> {resp.status_code} (expected 401)")
+        assert resp.status_code == 401, "Wrong password accepted"
+
+        resp = client.post("/login", data={"username": "admin' --", "password": "x"})
+        print(f"  POST /login (admin' --) -> {resp.status_code} (expected 302)")
+        assert resp.status_code == 302, "SQL injection no longer works"
+
+        resp = client.get("/flag")
+        print(f"  GET /flag -> {resp.status_code} (expected 200)")
+        assert resp.status_code == 200 and module.FLAG.encode() in resp.data, "Flag not shown"
+
+        # Boolean-blind extraction, as sqlmap does it: one character per request
+        hits = [
+            client.post("/login", data={"username": f"admin' AND substr(password,1,1)='{c}' --", "password": "x"}).status_code
+            for c in "abc"
+        ]
+        print(f"  blind probes a/b/c -> {hits} (expected [302, 401, 401])")
+        assert hits == [302, 401, 401], "Blind SQLi oracle broken"
+
+    print("\n" + "=" * 70)
+    print("LOGIN-SQLI: ALL CHECKS PASSED ✓")
+    print("=" * 70)
+
+
+def test_connection_cache():
+    """Test one read-only connection per thread, closed by shutdown()"""
+    module = load_login()
+
+    print("\n" + "=" * 70)
+    print("LOGIN-SQLI CONNECTIONS - VERIFICATION")
+    print("=" * 70)
+
+    client = module.app.test_client()
+    for _ in range(20):
+        client.post("/login", data={"username": "admin", "password": "nope"})
+    print(f"\n✓ 20 logins on one thread -> {len(module._connections)} connection(s)")
+    assert len(module._connections) == 1, "Connection not reused"
+
+    con = module.get_db()
+    assert con.execute("PRAGMA query_only").fetchone()[0] == 1, "query_only not set"
+    assert con.execute("PRAGMA journal_mode").fetchone()[0] == "wal", "WAL not enabled"
+    try:
+        con.execute("DELETE FROM users")
+        raise AssertionError("Write allowed on the login connection")
+    except module.sqlite3.OperationalError:
+        print("✓ Login connection is read-only (query_only, WAL)")
+
+    other = []
+    thread = threading.Thread(target=lambda: other.append(module.get_db()))
+    thread.start()
+    thread.join()
+    assert other[0] is not con and len(module._connections) == 2, "Threads share a connection"
+    print("✓ Second thread -> its own connection")
+
+    module.shutdown()
+    assert module._connections == [], "Connections not closed"
+    print("✓ shutdown() closed them all")
+
+    print("\n" + "=" * 70)
+    print("LOGIN-SQLI CONNECTIONS: ALL CHECKS PASSED ✓")
+    print("=" * 70)
+
+
+def test_session_databases():
+    """Test a private in-memory database copy per browser, LRU budget and reset"""
+    module = load_login(LOGIN_DB_MODE="session")
+    dbs = module.SESSION_DBS
+
+    print("\n" + "=" * 70)
+    print("LOGIN-SQLI SESSION DATABASES - VERIFICATION")
+    print("=" * 70)
+
+    alice = module.app.test_client()
+    resp = alice.post("/login", data={"username": "admin' --", "password": "x"})
+    cookie = alice.get_cookie(module.DB_SESSION_COOKIE)
+    assert resp.status_code == 302, "SQL injection broken in session mode"
+    assert cookie is not None, "No database session cookie"
+    session_id = cookie.value
+    print(f"\n✓ SQLi login -> {resp.status_code}, {module.DB_SESSION_COOKIE}={session_id}")
+
+    # Stacked statements are not possible through execute(), so change the copy directly
+    copy = dbs.get(session_id)
+    with copy.lock:
+        copy.con.execute("UPDATE users SET password = 'changed' WHERE username = 'guest'")
+    resp = alice.post("/login", data={"username": "guest", "password": "guest"})
+    assert resp.status_code == 401, "Change to own copy not visible"
+    bob = module.app.test_client()
+    resp = bob.post("/login", data={"username": "guest", "password": "guest"})
+    assert resp.status_code == 302, "Change leaked into another session"
+    shared = module.sqlite3.connect(module.DB_PATH)
+    assert shared.execute("SELECT password FROM users WHERE username = 'guest'").fetchone()[0] == "guest"
+    shared.close()
+    print("✓ Changes stay in the session's own copy (other session and users.db untouched)")
+
+    resp = alice.post("/reset")
+    assert resp.status_code == 302 and copy.closed, "Reset did not drop the copy"
+    resp = alice.post("/login", data={"username": "guest", "password": "guest"})
+    assert resp.status_code == 302, "Reset did not restore the template"
+    print(f"✓ POST /reset -> fresh copy; stats: {dbs.stats()}")
+
+    budget = module.SessionDatabases(module.DB_PATH, 3 * len(dbs.template))
+    copies = [budget.get(str(i)) for i in range(5)]
+    assert budget.stats()["sessions"] == 3 and budget.evicted == 2, "Budget not enforced"
+    assert copies[0].closed and copies[1].closed and not copies[4].closed, "Wrong copies evicted"
+    budget.get("2")
+    budget.get("5")
+    assert budget.get("2") is copies[2] and copies[3].closed, "Not least recently used"
+    print(f"✓ Memory budget of 3 copies -> LRU eviction ({budget.evicted} evicted)")
+
+    start = time.perf_counter()
+    for i in range(200):
+        budget.reset("clone")
+        budget.get("clone")
+    per_clone = (time.perf_counter() - start) / 200 * 1e6
+    print(f"✓ Reset + clone: {per_clone:.0f} µs")
+    budget.close()
+
+    module.shutdown()
+    assert dbs.stats()["sessions"] == 0, "shutdown() left copies open"
+
+    shared_mode = load_login()
+    assert shared_mode.app.test_client().post("/reset").status_code == 404, "/reset outside session mode"
+
+    print("\n" + "=" * 70)
+    print("LOGIN-SQLI SESSION DATABASES: ALL CHECKS PASSED ✓")
+    print("=" * 70)
+
+
+def test_query_guard():
+    """Test the time and size budget on injected SQL, its status and counters"""
+    module = load_login()
+    client = module.app.test_client()
+
+    print("\n" + "=" * 70)
+    print("LOGIN-SQLI QUERY GUARD - VERIFICATION")
+    print("=" * 70)
+
+    endless = "admin' AND (WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x+1 FROM c) SELECT count(*) FROM c) --"
+    start = time.perf_counter()
+    resp = client.post("/login", data={"username": endless, "password": "x"}, headers={"X-Query-Budget-Ms": "100"})
+    elapsed = time.perf_counter() - start
+    print(f"\n✓ Endless recursive CTE, 100 ms budget -> {resp.status_code} {resp.headers.get('X-Query-Aborted')} after {elapsed * 1000:.0f} ms")
+    assert resp.status_code == 400 and resp.headers.get("X-Query-Aborted") == "time", "CTE not interrupted"
+    assert "Query afgebroken" in resp.get_data(as_text=True), "Abort not reported"
+    assert elapsed < 1.0, "Budget header ignored"
+
+    resp = client.post("/login", data={"username": "admin' AND length(randomblob(1000000000)) --", "password": "x"})
+    print(f"✓ randomblob(1e9) -> {resp.status_code} {resp.headers.get('X-Query-Aborted')}")
+    assert resp.status_code == 400 and resp.headers.get("X-Query-Aborted") == "size", "Huge blob allowed"
+
+    # Heavy-query timing oracle within the budget still answers normally
+    timing = "admin' AND CASE WHEN substr(password,1,1)='{}' THEN length(randomblob(5000000)) ELSE 1 END > 1 --"
+    hits = [client.post("/login", data={"username": timing.format(c), "password": "x"}).status_code for c in "ab"]
+    print(f"✓ Timing payloads a/b -> {hits} (expected [302, 401])")
+    assert hits == [302, 401], "Timing payload blocked"
+
+    resp = client.post("/login", data={"username": "admin' AND nosuchfunc() --", "password": "x"})
+    assert resp.status_code == 401 and "X-Query-Aborted" not in resp.headers, "Broken SQL reported as abort"
+    print("✓ Broken SQL is still a plain failed login (401)")
+
+    with module.app.test_request_context(headers={"X-Query-Budget-Ms": "999999"}):
+        assert module.query_budget_ms() == module.QUERY_BUDGET_MS, "Request raised its own budget"
+
+    text = client.get("/metrics").get_data(as_text=True)
+    app_labels = f'app="login-sqli",worker="{os.getpid()}"'
+    for line in (
+        f'login_sqli_query_aborts_total{{{app_labels},reason="time"}} 1',
+        f'login_sqli_query_aborts_total{{{app_labels},reason="size"}} 1',
+    ):
+        assert line in text, f"Missing metric: {line}"
+    print("✓ Guard counters exported on /metrics")
+
+    print("\n" + "=" * 70)
+    print("LOGIN-SQLI QUERY GUARD: ALL CHECKS PASSED ✓")
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    try:
+        test_login_sqli()
+        test_connection_cache()
+        test_session_databases()
+        test_query_guard()
+
+        print("\n" + "=" * 70)
+        print("LOGIN-SQLI: VERIFICATION COMPLETE ✓✓✓")
+        print("=" * 70)
+    except Exception as e:
+        print(f"\n❌ Test failed: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
@@ -1,11 +1,24 @@
 #!/usr/bin/env python3
 """
 Test suite for medium-level CTF challenges
-Tests: command-injection, ssrf-internal, xxe-injection
+Tests: command-injection (its runner pool, streamed output and jobs), ssrf-internal (and its fetcher), xxe-injection
 """
+import os
+import selectors
 import sys
+import tempfile
+import threading
+import time
 import importlib.util
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from pathlib import Path
+from unittest import mock
+
+CMD_DIR = Path(__file__).parent / "command-injection"
+SSRF_DIR = Path(__file__).parent / "ssrf-internal"
+for app_dir in (CMD_DIR, SSRF_DIR):
+    if str(app_dir) not in sys.path:
+        sys.path.append(str(app_dir))  # app-local modules (runner, jobs, fetcher)
 
 
 def load_module(module_name, module_path):
@@ -59,6 +72,248 @@ def test_command_injection():
     print("=" * 70)
 
 
+def test_runner_pool():
+    """Test the bounded, sandboxed runner: group kill, timeout, output cap, rlimits, queue"""
+    import runner
+    from runner import Busy, RunnerPool
+
+    print("\n" + "=" * 70)
+    print("COMMAND RUNNER POOL - VERIFICATION")
+    print("=" * 70)
+
+    pool = RunnerPool(timeout=5, output_limit=1000, cpu_seconds=3, file_size=4096)
+    start = time.perf_counter()
+    result = pool.run("echo start; sleep 30 & echo $!")
+    leftover = int(result.output.split()[-1])
+    print(f"\n✓ 'sleep 30 &' -> returned after {time.perf_counter() - start:.2f} s")
+    assert result.output.startswith("start") and time.perf_counter() - start < 2, "Waited for the background job"
+    time.sleep(0.1)
+    try:
+        # Gone, or a zombie waiting for init to reap it
+        state = Path(f"/proc/{leftover}/stat").read_text().rsplit(")", 1)[1].split()[0]
+    except FileNotFoundError:
+        state = "gone"
+    assert state in ("gone", "Z"), f"Background job survived its request (state {state})"
+    print(f"✓ Background job killed with its process group ({state})")
+
+    result = RunnerPool(timeout=0.5).run("sleep 10 & sleep 10")
+    assert result.timed_out and result.seconds < 2, "Timeout not enforced"
+    print(f"✓ Timeout: group killed after {result.seconds:.2f} s")
+
+    result = pool.run("yes")
+    assert result.truncated and len(result.output) == 1000, "Output not capped"
+    print(f"✓ 'yes' -> output capped at {len(result.output)} bytes, kills so far: {pool.kills}")
+
+    limits = pool.run("cat /proc/self/limits").output
+    assert any(line.startswith("Max cpu time") and " 3 " in line for line in limits.splitlines()), limits
+    target = Path(tempfile.mkdtemp()) / "big"
+    pool.run(f"head -c 100000 /dev/zero > {target}")
+    assert target.stat().st_size <= 4096, "File size limit not applied"
+    print("✓ rlimits applied (cpu time, file size)")
+
+    fallback = RunnerPool(cpu_seconds=3)
+    fallback.prefix = []  # as on a host without prlimit(1)
+    limits = fallback.run("sleep 0.2; cat /proc/self/limits").output
+    assert any(line.startswith("Max cpu time") and " 3 " in line for line in limits.splitlines()), limits
+    print(f"✓ Limits set by {pool.prefix[0] if pool.prefix else 'resource.prlimit'}; "
+          "resource.prlimit after the start without it")
+
+    class LateSelector(selectors.DefaultSelector):
+        """Every wait runs out empty-handed: as if the output came just after it, then the shell exited"""
+
+        def select(self, timeout=None):
+            if timeout:
+                time.sleep(timeout)
+                return []
+            return super().select(timeout)
+
+    with mock.patch.object(runner.selectors, "DefaultSelector", LateSelector):
+        output = pool.run("echo last").output
+    assert output == "last\n", f"Output written before the shell exited was lost: {output!r}"
+    print("✓ Last output before the shell exits is kept")
+
+    narrow = RunnerPool(max_concurrency=1, max_queue=1, queue_timeout=0.3)
+    outcomes = []
+
+    def attempt():
+        try:
+            narrow.run("sleep 1")
+            outcomes.append("ran")
+        except Busy:
+            outcomes.append("busy")
+
+    first = threading.Thread(target=attempt)
+    first.start()
+    time.sleep(0.1)
+    second = threading.Thread(target=attempt)
+    second.start()
+    time.sleep(0.1)
+    assert narrow.stats()["running"] == 1 and narrow.stats()["waiting"] == 1, narrow.stats()
+    attempt()  # queue full: rejected at once
+    first.join()
+    second.join()
+    assert sorted(outcomes) == ["busy", "busy", "ran"], outcomes
+    print(f"✓ One slot, queue of one -> {outcomes}; stats {narrow.stats()}")
+
+    module = load_module("cmd_injection_app_pool", CMD_DIR / "app.py")
+    with module.app.test_client() as client:
+        resp = client.post("/", data={"host": "127.0.0.1 -W 1; echo injected-$((6*7))"})
+        assert resp.status_code == 200 and b"injected-42" in resp.data, "Injection no longer works"
+        text = client.get("/metrics").get_data(as_text=True)
+    for name in ("command_runner_jobs_total", "command_runner_queue_depth", "command_runner_running",
+                 "command_runner_seconds_total"):
+        assert name in text, f"Missing metric: {name}"
+    print("✓ Injection still works through the pool; runner metrics exported")
+
+    print("\n" + "=" * 70)
+    print("COMMAND RUNNER POOL: ALL CHECKS PASSED ✓")
+    print("=" * 70)
+
+
+def test_runner_streaming():
+    """Test streamed command output: chunks as they arrive, cancel on disconnect, HTML and SSE"""
+    from runner import RunnerPool
+
+    print("\n" + "=" * 70)
+    print("COMMAND OUTPUT STREAMING - VERIFICATION")
+    print("=" * 70)
+
+    pool = RunnerPool(timeout=5)
+    start = time.perf_counter()
+    job = pool.start("echo first; sleep 1; echo second")
+    chunks = job.chunks()
+    first = next(chunks)
+    assert first == "first\n" and time.perf_counter() - start < 0.8, "First line waited for the command"
+    print(f"✓ First chunk after {time.perf_counter() - start:.2f} s: {first!r}")
+    assert "".join(chunks) == "second\n" and job.result.returncode == 0
+    print(f"✓ Rest arrived, exit code {job.result.returncode}")
+
+    job = pool.start("echo $$; sleep 30")
+    chunks = job.chunks(idle=0.2)
+    pid = int(next(chunks))
+    assert next(chunks) == "", "No heartbeat while the command was quiet"
+    chunks.close()  # what the server does when the client disconnects
+    assert job.killed == "cancelled" and pool.running == 0, (job.killed, pool.stats())
+    assert not Path(f"/proc/{pid}").exists(), "Command kept running after the client left"
+    print(f"✓ Heartbeat while idle; closing the stream killed the command (kills: {pool.kills})")
+
+    module = load_module("cmd_injection_app_stream", CMD_DIR / "app.py")
+    with module.app.test_client() as client:
+        resp = client.post("/", data={"host": "127.0.0.1 -W 1; echo '<b>injected</b>'", "stream": "1"})
+        page = resp.get_data(as_text=True)
+        assert resp.status_code == 200 and "Content-Length" not in resp.headers, "Page not streamed"
+        assert "&lt;b&gt;injected&lt;/b&gt;" in page and page.rstrip().endswith("</html>"), page[-300:]
+        print("✓ POST / with stream=1 -> chunked page, output escaped")
+
+        resp = client.get("/stream", query_string={"host": "127.0.0.1 -W 1; echo injected"})
+        body = resp.get_data(as_text=True)
+        assert resp.mimetype == "text/event-stream" and resp.headers["X-Accel-Buffering"] == "no"
+        assert "event: output" in body and "injected" in body, body
+        assert body.rstrip().splitlines()[-2] == "event: done", body
+        print("✓ GET /stream -> output events, then done")
+        assert client.get("/stream").status_code == 400
+
+    print("\n" + "=" * 70)
+    print("COMMAND OUTPUT STREAMING: ALL CHECKS PASSED ✓")
+    print("=" * 70)
+
+
+def test_command_jobs():
+    """Test the asynchronous job API: background workers, per-client limit, TTL, memory cap"""
+    from jobs import JobQueue, MemoryJobStore, QueueFull, SQLiteJobStore, TooManyJobs
+    from runner import RunnerPool
+
+    print("\n" + "=" * 70)
+    print("COMMAND JOBS - VERIFICATION")
+    print("=" * 70)
+
+    def wait_done(store, job_id):
+        for _ in range(100):
+            record = store.get(job_id)
+            if record["status"] == "done":
+                return record
+            time.sleep(0.05)
+        raise AssertionError(f"Job {job_id} never finished")
+
+    store_dir = Path(tempfile.mkdtemp())
+    for store in (MemoryJobStore(ttl=60), SQLiteJobStore(str(store_dir / "jobs.db"), ttl=60)):
+        name = type(store).__name__
+        queue = JobQueue(store, run=RunnerPool(max_concurrency=2).run, workers=2, max_queued=2, per_client=3)
+        start = time.perf_counter()
+        slow = [queue.submit("sleep 0.5; echo slow", "ip:a") for _ in range(2)]
+        time.sleep(0.1)  # both picked up by the workers
+        slow.append(queue.submit("sleep 0.5; echo slow", "ip:a"))
+        assert time.perf_counter() - start < 0.3, "submit() waited for the command"
+        try:
+            queue.submit("echo one too many", "ip:a")
+            raise AssertionError("Per-client limit not enforced")
+        except TooManyJobs:
+            pass
+        try:
+            queue.submit("echo no room", "ip:b")  # 2 running, 1 waiting, 1 more: past max_queued
+            queue.submit("echo no room", "ip:c")
+            raise AssertionError("Queue limit not enforced")
+        except QueueFull:
+            pass
+        records = [wait_done(store, job_id) for job_id in slow]
+        assert all(r["output"] == "slow\n" and r["returncode"] == 0 for r in records), [(r["output"], r["returncode"]) for r in records]
+        assert isinstance(queue.submit("echo again", "ip:a"), str), "Limit not released after the jobs finished"
+        queue.stop()
+        print(f"✓ {name}: 3 slow jobs done in {time.perf_counter() - start:.2f} s; "
+              "4th refused per client, full queue refused")
+
+        queue = JobQueue(store, run=RunnerPool(max_concurrency=1).run, workers=1, max_queued=2, per_client=3)
+        running = queue.submit("sleep 0.3", "ip:f")
+        time.sleep(0.1)  # picked up by the one worker
+        waiting = queue.submit("echo never", "ip:f")
+        queue.stop()
+        record = store.get(waiting)
+        assert record["status"] == "cancelled" and record["returncode"] is None, record
+        assert store.get(running)["status"] == "done", "Running job not finished on stop"
+        assert store.add("after-stop", "ip:f", 1), "Cancelled job still counted against the client"
+        print(f"✓ {name}: job still queued on stop() -> {record['status']}")
+
+        store.ttl = 0.2
+        assert store.add("expiring", "ip:d", 1)
+        store.finish("expiring", "x", 0, False, False)
+        assert store.get("expiring") is not None
+        time.sleep(0.3)
+        assert store.get("expiring") is None, "Result outlived its TTL"
+        print(f"✓ {name}: result gone after its TTL")
+
+    capped = MemoryJobStore(ttl=60, max_bytes=25)
+    for n in range(3):
+        capped.add(f"job{n}", "ip:e", 10)
+        capped.finish(f"job{n}", "x" * 10, 0, False, False)
+    assert capped.get("job0") is None and capped.get("job2") is not None, "Oldest result not evicted"
+    assert capped.stats()["bytes"] <= 25, capped.stats()
+    print(f"✓ Memory cap: oldest result evicted, {capped.stats()}")
+
+    module = load_module("cmd_injection_app_jobs", CMD_DIR / "app.py")
+    with module.app.test_client() as client:
+        resp = client.post("/api/jobs", json={"host": "127.0.0.1 -W 1; echo injected-$((6*7))"})
+        assert resp.status_code == 202 and resp.headers["Location"] == resp.json["url"], resp.json
+        for _ in range(100):
+            record = client.get(resp.json["url"]).json
+            if record["status"] == "done":
+                break
+            time.sleep(0.05)
+        assert "injected-42" in record["output"] and "client" not in record, record
+        print(f"✓ POST /api/jobs -> 202, GET {resp.json['url'][:16]}... -> done with the injected output")
+        resp = client.post("/api/jobs", json={"host": "127.0.0.1"},
+                           headers={"X-Forwarded-Prefix": "/command-injection"})
+        print(f"✓ Behind nginx: Location {resp.headers['Location'][:36]}...")
+        assert resp.headers["Location"].startswith("/command-injection/api/jobs/"), "Location lost the prefix"
+        assert client.post("/api/jobs", json={}).status_code == 400
+        assert client.get("/api/jobs/nope").status_code == 404
+        assert "command_jobs_submitted_total" in client.get("/metrics").get_data(as_text=True)
+    module.shutdown()
+
+    print("\n" + "=" * 70)
+    print("COMMAND JOBS: ALL CHECKS PASSED ✓")
+    print("=" * 70)
+
+
 def test_ssrf_internal():
     """Test SSRF Internal Challenge"""
     ssrf_app_path = Path(__file__).parent / "ssrf-internal" / "app.py"
@@ -129,6 +384,112 @@ def test_ssrf_internal():
     print("=" * 70)
 
 
+class FetchTarget(BaseHTTPRequestHandler):
+    """What an SSRF preview may point at: huge files, slow drips, redirect loops"""
+    protocol_version = "HTTP/1.1"
+    peers = set()
+
+    def do_GET(self):
+        self.peers.add(self.client_address)
+        if self.path == "/huge":
+            self.send_response(200)
+            self.send_header("Content-Length", str(10 ** 9))
+            self.end_headers()
+            try:
+                for _ in range(10 ** 5):
+                    self.wfile.write(b"A" * 10000)
+            except OSError:
+                pass  # the fetcher hung up, as it should
+            return
+        if self.path == "/drip":
+            self.send_response(200)
+            self.send_header("Content-Length", "100")
+            self.end_headers()
+            try:
+                for _ in range(100):
+                    self.wfile.write(b".")
+                    self.wfile.flush()
+                    time.sleep(0.1)
+            except OSError:
+                pass
+            return
+        if self.path in ("/loop", "/set-cookie"):
+            self.send_response(302)
+            self.send_header("Location", "/loop" if self.path == "/loop" else "/internal/admin")
+            self.send_header("Set-Cookie", "planted=1")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        body = f"flag for {self.headers.get('Cookie')}".encode()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def test_ssrf_fetcher():
+    """Test the pooled fetcher: byte cap, deadline, redirect cap, keep-alive, no shared cookies"""
+    import requests
+    from fetcher import Fetcher
+
+    print("\n" + "=" * 70)
+    print("SSRF FETCHER - VERIFICATION")
+    print("=" * 70)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FetchTarget)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_port}"
+    fetcher = Fetcher(max_bytes=5000, deadline=1, max_redirects=3)
+    try:
+        start = time.perf_counter()
+        result = fetcher.get(base + "/huge")
+        assert len(result.text) == 5000 and result.truncated, "Byte cap not applied"
+        print(f"✓ 1 GB body -> {len(result.text)} bytes read in {time.perf_counter() - start:.3f} s")
+
+        start = time.perf_counter()
+        try:
+            fetcher.get(base + "/drip")
+            raise AssertionError("Slow body outlived the deadline")
+        except requests.Timeout:
+            pass
+        assert time.perf_counter() - start < 1.5
+        print(f"✓ Slow drip cut off at the deadline ({time.perf_counter() - start:.2f} s)")
+
+        try:
+            fetcher.get(base + "/loop")
+            raise AssertionError("Redirect cap not applied")
+        except requests.TooManyRedirects as e:
+            print(f"✓ Redirect loop -> {e}")
+
+        # Redirects still work (the SSRF stays) and keep the player cookie
+        result = fetcher.get(base + "/set-cookie", cookies={"ctf_player": "team1"})
+        assert result.redirects == 1 and result.text == "flag for ctf_player=team1", result.text
+        assert fetcher.get(base + "/internal/admin").text == "flag for None", "Cookie leaked into the next fetch"
+        print("✓ Redirect followed with the player cookie; Set-Cookie not kept for the next fetch")
+
+        FetchTarget.peers.clear()
+        for _ in range(5):
+            fetcher.get(base + "/internal/admin")
+        assert len(FetchTarget.peers) == 1, FetchTarget.peers
+        print("✓ 5 fetches over 1 keep-alive connection")
+
+        module = load_module("ssrf_internal_app_fetcher", SSRF_DIR / "app.py")
+        with module.app.test_client() as client:
+            resp = client.post("/", data={"url": base + "/huge"})
+            assert resp.status_code == 200 and b"A" * 5000 in resp.data and b"A" * 5001 not in resp.data
+            assert 'reason="size"' in client.get("/metrics").get_data(as_text=True)
+        print("✓ POST / previews the capped body; abort counted in /metrics")
+    finally:
+        server.shutdown()
+
+    print("\n" + "=" * 70)
+    print("SSRF FETCHER: ALL CHECKS PASSED ✓")
+    print("=" * 70)
+
+
 def test_xxe_injection():
     """Test XXE Injection Challenge"""
     xxe_app_path = Path(__file__).parent / "xxe-injection" / "app.py"
@@ -190,6 +551,7 @@ def test_xxe_injection():
 if __name__ == "__main__":
     try:
         test_command_injection()
+        test_runner_pool()
         test_ssrf_internal()
         test_xxe_injection()
 
@@ -1,6 +1,10 @@
 #!/usr/bin/env python3
 import sys
+import gzip
+import importlib.util
+import tempfile
 from pathlib import Path
+from unittest import mock
 
 # Add static-secrets to path
 static_path = Path(__file__).parent / "static-secrets"
@@ -56,3 +60,80 @@ print("\n" + "=" * 60)
 print("STATIC-SECRETS CHALLENGE: ALL CHECKS PASSED ✓")
 print("=" * 60)
 
+
+def test_static_manifest():
+    """Test manifest serving: ETags, precompressed variants, cached listing, fast 404, watcher"""
+    # Its own copy: "app" in sys.modules may be another challenge when run with the other suites
+    spec = importlib.util.spec_from_file_location("static_secrets_app", static_path / "app.py")
+    static_module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = static_module
+    spec.loader.exec_module(static_module)
+    static_app = static_module.app
+    from manifest import ManifestWatcher
+
+    print("\n" + "=" * 60)
+    print("STATIC-SECRETS MANIFEST - VERIFICATION")
+    print("=" * 60)
+
+    with static_app.test_client() as client:
+        resp = client.get("/robots.txt")
+        etag = resp.headers["ETag"]
+        print(f"\n✓ GET /robots.txt -> {resp.status_code}, ETag {etag}, {resp.headers['Cache-Control']}")
+        assert resp.status_code == 200 and b"Disallow" in resp.data, "robots.txt not served"
+        assert "Accept-Encoding" in resp.headers["Vary"], "Missing Vary"
+        resp = client.get("/robots.txt", headers={"If-None-Match": etag})
+        assert resp.status_code == 304 and not resp.data, "ETag not honoured"
+        resp = client.get("/robots.txt", headers={"Range": "bytes=0-9"})
+        assert resp.status_code == 206 and len(resp.data) == 10, "Range not honoured"
+        print("✓ If-None-Match -> 304, Range -> 206")
+
+        # Unknown paths: answered from the manifest, without a stat() or open()
+        with mock.patch("os.stat", side_effect=AssertionError("stat")), \
+                mock.patch("builtins.open", side_effect=AssertionError("open")):
+            for path in ("/hidden/admin.php", "/hidden/../config.bak", "/wp-login.php"):
+                assert client.get(path).status_code == 404, path
+            assert b"flag.txt" in client.get("/hidden/").data, "Listing not cached"
+        print("✓ 404s and the /hidden/ listing never touch the filesystem")
+
+        with mock.patch.dict(static_module.manifest().listings, clear=True):
+            resp = client.get("/hidden/")
+        assert resp.status_code == 404 and resp.data == client.get("/wp-login.php").data, "Odd 404 for a missing listing"
+        print("✓ A manifest without the /hidden/ listing answers the usual 404 page")
+
+    dynflag = static_module.dynflag
+    with static_app.test_client() as client, \
+            mock.patch.multiple(dynflag, EVENT_KEY="test-event-key", ENABLED=True):
+        client.set_cookie(dynflag.PLAYER_COOKIE, dynflag.sign_player("team-rood"))
+        expected = dynflag.derive_flag(static_module.FLAG, "static-secrets", "team-rood")
+        for path in ("/hidden/flag.txt", "/static/hidden/flag.txt"):
+            resp = client.get(path)
+            print(f"✓ GET {path} with EVENT_KEY set -> {resp.data.decode().strip()}")
+            assert resp.data.decode().strip() == expected, f"{path} bypassed the per-player flag"
+        assert client.get("/static/robots.txt").data == client.get("/robots.txt").data, "/static/ not served"
+    assert "static" not in {rule.endpoint for rule in static_app.url_map.iter_rules()}, "Built-in static route"
+
+    root = Path(tempfile.mkdtemp())
+    (root / "hidden").mkdir()
+    (root / "big.txt").write_text("gobuster " * 500)
+    watcher = ManifestWatcher(root, interval=0)
+    entry = watcher.manifest.get("big.txt")
+    assert gzip.decompress(entry.variants["gzip"]) == (root / "big.txt").read_bytes(), "Bad gzip variant"
+    print(f"✓ Precompressed variants of a {entry.size} byte text file: "
+          f"{ {coding: len(body) for coding, body in entry.variants.items()} }")
+
+    assert not watcher.check(), "Rebuilt without a change"
+    (root / "hidden" / "new.txt").write_text("new")
+    assert watcher.check() and watcher.manifest.get("hidden/new.txt"), "New file not picked up"
+    assert "new.txt" in watcher.manifest.listings["hidden"], "Listing not rebuilt"
+    (root / "big.txt").unlink()
+    assert watcher.check() and watcher.manifest.get("big.txt") is None, "Deleted file still served"
+    print(f"✓ Watcher rebuilt the manifest after {watcher.rebuilds} changes")
+
+    with static_app.test_client() as client:
+        resp = client.get("/config.bak", headers={"Accept-Encoding": "gzip"})
+        variants = static_module.manifest().get("config.bak").variants
+        assert resp.headers.get("Content-Encoding") == ("gzip" if "gzip" in variants else None)
+
+    print("\n" + "=" * 60)
+    print("STATIC-SECRETS MANIFEST: ALL CHECKS PASSED ✓")
+    print("=" * 60)
@@ -5,8 +5,17 @@ Vulnerability: XML External Entity Injection for file disclosure
 from flask import Flask, request, render_template_string, jsonify
 from lxml import etree
 import os
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))  # shared ctfcommon/ package in a repo checkout
+
+from ctfcommon import startup, urls
+from ctfcommon.metrics import Metrics
 
 app = Flask(__name__)
+urls.init_app(app)
+metrics = Metrics(app)
 FLAG = os.getenv("FLAG", "CTF{xxe_file_disclosure}")
 
 HTML_TEMPLATE = """
@@ -84,11 +93,6 @@ def index():
     result = None
     error = None
     xml_input = None
-    scheme = request.headers.get("X-Forwarded-Proto", request.scheme or "http")
-    forwarded_host = request.headers.get("X-Forwarded-Host")
-    raw_host = (forwarded_host.split(",")[0].strip() if forwarded_host else request.host)
-    portal_host = raw_host.split(":")[0]
-    portal_url = f"{scheme}://{portal_host}/"
     
     if request.method == "POST":
         xml_input = request.form.get("xml", "")
@@ -122,7 +126,7 @@ def index():
             except Exception as e:
                 error = f"Error processing XML: {e}"
     
-    return render_template_string(HTML_TEMPLATE, result=result, error=error, xml=xml_input, portal_url=portal_url)
+    return render_template_string(HTML_TEMPLATE, result=result, error=error, xml=xml_input)
 
 
 @app.route("/api/import", methods=["POST"])
@@ -162,7 +166,5 @@ def healthz():
 
 
 if __name__ == "__main__":
-    # Write flag to /flag.txt
-    with open("/flag.txt", "w") as f:
-        f.write(FLAG)
-    app.run(host="0.0.0.0", port=5000, debug=False)
+    startup.run(Path(__file__).resolve().parent)  # startup.py, as the gunicorn master does
+    app.run(host="0.0.0.0", port=int(os.getenv("PORT", "5000")), debug=False)